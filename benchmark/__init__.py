@@ -0,0 +1,3 @@
+"""
+性能测试脚本, 在仓库根目录下以 `python -m benchmark.<name>` 运行
+"""
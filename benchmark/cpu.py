@@ -0,0 +1,75 @@
+"""
+在CPU上比较各个模型大小在fp32与int8动态量化下的解码耗时与实时率, 用于估算机器规格。
+
+    python -m benchmark.cpu --audio speech.wav --models tiny base small --threads 8
+
+rtf(window) = 解码一个30s窗口的耗时 / 30s; rtf(step) = 解码耗时 / step, 大于1时这台机器跟不上该step的实时转录。
+"""
+from typing import *
+
+import argparse
+import time
+
+import numpy as np
+import torch
+import whisper
+from whisper.audio import log_mel_spectrogram, pad_or_trim, N_SAMPLES, CHUNK_LENGTH
+
+from satranscriber.utils.model import load_model, set_threads
+
+
+def window_mel(path: Optional[str]) -> torch.Tensor:
+    if path:
+        audio = whisper.load_audio(path)
+    else:
+        print("no --audio given, decoding noise; timings of the decoder will not be representative")
+        audio = (np.random.default_rng(0).standard_normal(N_SAMPLES) * 0.05).astype(np.float32)
+    return log_mel_spectrogram(pad_or_trim(audio))
+
+
+def run(name: str, quantize: bool, mel: torch.Tensor, args) -> Dict:
+    begin = time.perf_counter()
+    model = load_model(name, "cpu", quantize)
+    load_time = time.perf_counter() - begin
+
+    options = whisper.DecodingOptions(language=args.language, beam_size=args.beam_size, fp16=False)
+    model.decode(mel, options)
+
+    times = []
+    for _ in range(args.repeat):
+        begin = time.perf_counter()
+        result = model.decode(mel, options)
+        times.append(time.perf_counter() - begin)
+    decode_time = float(np.median(times))
+    return dict(
+        model=name,
+        mode="int8" if quantize else "fp32",
+        load=load_time,
+        decode=decode_time,
+        rtf_window=decode_time / CHUNK_LENGTH,
+        rtf_step=decode_time / args.step,
+        text=result.text,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--audio", type=str, default=None, help="audio file to decode, its first 30s are used")
+    parser.add_argument("--models", type=str, nargs="+", default=["tiny", "base", "small"], choices=whisper.available_models())
+    parser.add_argument("--language", type=str, default="en")
+    parser.add_argument("--beam_size", type=int, default=10)
+    parser.add_argument("--step", type=float, default=3.0, help="seconds between decodes in streaming")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--interop_threads", type=int, default=None)
+    args = parser.parse_args()
+
+    set_threads(args.threads, args.interop_threads)
+    mel = window_mel(args.audio)
+
+    print("threads: {}".format(torch.get_num_threads()))
+    print("{:<10} {:<6} {:>8} {:>10} {:>12} {:>10}".format("model", "mode", "load(s)", "decode(s)", "rtf(window)", "rtf(step)"))
+    for name in args.models:
+        for quantize in (False, True):
+            row = run(name, quantize, mel, args)
+            print("{model:<10} {mode:<6} {load:>8.2f} {decode:>10.2f} {rtf_window:>12.3f} {rtf_step:>10.3f}".format(**row))
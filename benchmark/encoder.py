@@ -0,0 +1,137 @@
+"""
+比较编码器运行在完整的30s输入与缩短的输入(--encoder_buckets)上的速度和准确率。
+对每个buffer长度, 从音频中依次取出这么长的窗口, 分别在30s以及每个能容纳它的bucket上编码、解码;
+准确率以30s输入的转录结果为参照, 报告词错误率(WER)以及完全一致的比例。
+
+    python -m benchmark.encoder --model tiny --audio speech.wav --lengths 2 4 8 15 --buckets 5 10 20
+
+需要真实的模型和语音: 合成音频上模型的输出没有意义, 只能用来比较速度。
+"""
+from typing import *
+
+import argparse
+import collections
+import json
+import time
+
+import numpy as np
+import torch
+import whisper
+from whisper.audio import HOP_LENGTH, N_FRAMES, SAMPLE_RATE
+
+from satranscriber.audio import file
+from satranscriber.utils import decode
+from satranscriber.utils.model import inference_dtype, load_model, set_threads
+
+from .harness import synthetic_speech
+
+
+def read_audio(path: str) -> np.ndarray:
+    stream = file.Stream(path, max_speed=True, chunk_seconds=3600)
+    chunks = list()
+    with stream:
+        while not stream.exhausted:
+            chunks.append(stream.read())
+    return np.concatenate(chunks)
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """
+    以空白分词的编辑距离 / 参照的词数。没有空白的语言(中文、日语)按字计算
+    """
+    def split(text: str) -> List[str]:
+        words = text.split()
+        return words if len(words) > 1 or not words else list(words[0])
+
+    reference, hypothesis = split(reference), split(hypothesis)
+    if not reference:
+        return float(len(hypothesis) > 0)
+    distance = list(range(len(hypothesis) + 1))
+    for i, word in enumerate(reference, 1):
+        previous, distance[0] = distance[0], i
+        for j, other in enumerate(hypothesis, 1):
+            previous, distance[j] = distance[j], min(distance[j] + 1, distance[j - 1] + 1, previous + (word != other))
+    return distance[-1] / len(reference)
+
+
+def transcribe(model: whisper.Whisper, mel: torch.Tensor, dtype, n_frames: int, options: Dict) -> Tuple[str, float, float]:
+    """
+    返回文本、编码耗时和解码耗时
+    """
+    def synchronize():
+        if model.device.type == "cuda":
+            torch.cuda.synchronize()
+
+    begin = time.perf_counter()
+    audio_features = decode.encode(model, mel, dtype, n_frames)
+    synchronize()
+    encoded = time.perf_counter()
+    result = decode.decode_features(model, audio_features, **options)
+    synchronize()
+    return result.text.strip(), encoded - begin, time.perf_counter() - encoded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--audio", type=str, default=None, help="wav or raw s16le file, a synthetic one is generated if not given")
+    parser.add_argument("--model", type=str, default="tiny", help="name of the Whisper model or path of a checkpoint")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--language", type=str, default="en")
+    parser.add_argument("--beam_size", type=int, default=5)
+    parser.add_argument("--lengths", type=float, nargs="+", default=[2, 4, 8, 15], help="seconds of audio in the buffer")
+    parser.add_argument("--buckets", type=float, nargs="+", default=[5, 10, 20], help="encoder lengths in seconds to compare with 30s")
+    parser.add_argument("--windows", type=int, default=10, help="windows per buffer length")
+    parser.add_argument("--output", type=str, default=None, help="write the results as json")
+    args = parser.parse_args()
+
+    set_threads(args.threads, None)
+    model = load_model(args.model, args.device)
+    dtype = inference_dtype(args.device, True)
+    options = dict(language=args.language, beam_size=args.beam_size, temperature=0.0, fp16=dtype == torch.float16)
+    audio = read_audio(args.audio) if args.audio else synthetic_speech(max(args.lengths) * args.windows)[0]
+    mel = whisper.log_mel_spectrogram(torch.from_numpy(audio))
+    frames_per_second = SAMPLE_RATE // HOP_LENGTH
+
+    # 第一次运行包含一次性的初始化, 不计入
+    transcribe(model, mel[:, :frames_per_second], dtype, N_FRAMES, options)
+
+    rows = list()
+    for length in args.lengths:
+        frames = int(length * frames_per_second)
+        candidates = sorted({decode.bucket_frames(frames, [bucket]) for bucket in args.buckets} - {N_FRAMES})
+        for start in list(range(0, mel.shape[-1] - frames + 1, frames))[:args.windows]:
+            window = mel[:, start:start + frames]
+            reference, encode_time, decode_time = transcribe(model, window, dtype, N_FRAMES, options)
+            rows.append(dict(length=length, bucket=N_FRAMES / frames_per_second, encode=encode_time, decode=decode_time, wer=0.0, same=True))
+            for n_frames in candidates:
+                text, encode_time, decode_time = transcribe(model, window, dtype, n_frames, options)
+                rows.append(dict(
+                    length=length, bucket=n_frames / frames_per_second, encode=encode_time, decode=decode_time,
+                    wer=word_error_rate(reference, text), same=text == reference,
+                ))
+
+    groups: Dict[Tuple[float, float], List[Dict]] = collections.defaultdict(list)
+    for row in rows:
+        groups[(row["length"], row["bucket"])].append(row)
+    report = list()
+    print("{:>8} {:>8} {:>8} {:>12} {:>12} {:>9} {:>8} {:>6}".format(
+        "length", "bucket", "windows", "encode(ms)", "decode(ms)", "speedup", "wer", "same"))
+    for (length, bucket), items in sorted(groups.items()):
+        full = groups[(length, N_FRAMES / frames_per_second)]
+        full_time = np.mean([row["encode"] + row["decode"] for row in full])
+        entry = dict(
+            length=length, bucket=bucket, windows=len(items),
+            encode=float(np.mean([row["encode"] for row in items])),
+            decode=float(np.mean([row["decode"] for row in items])),
+            wer=float(np.mean([row["wer"] for row in items])),
+            same=float(np.mean([row["same"] for row in items])),
+        )
+        entry["speedup"] = float(full_time / (entry["encode"] + entry["decode"]))
+        report.append(entry)
+        print("{length:>8.1f} {bucket:>8.1f} {windows:>8} {:>12.1f} {:>12.1f} {speedup:>8.2f}x {wer:>8.3f} {same:>6.0%}".format(
+            entry["encode"] * 1e3, entry["decode"] * 1e3, **entry))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(dict(config=vars(args), results=report), f, indent=2)
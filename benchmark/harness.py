@@ -0,0 +1,345 @@
+"""
+流式转录benchmark的公共部分: 虚拟时钟、代替whisper.Whisper的StubModel、记录输出时间的Transcriber, 以及合成音频。
+
+整个Transcriber运行在虚拟时钟上: 文件按虚拟时间读取, Scheduler的等待直接推进时钟,
+模型的耗时由StubModel的代价模型(或者真实模型实测的耗时)推进时钟。所以结果与机器负载无关, 可以重复。
+"""
+from typing import *
+
+import dataclasses
+import functools
+import time
+import wave
+
+import numpy as np
+import torch
+import whisper
+from whisper import DecodingOptions, DecodingResult
+from whisper.audio import SAMPLE_RATE
+from whisper.model import ModelDimensions
+from whisper.tokenizer import get_tokenizer
+
+from satranscriber import Transcriber
+from satranscriber.audio import file
+from satranscriber.utils.parse_result import TranscribeResult
+
+
+class VirtualClock:
+    def __init__(self, now: float = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += max(0.0, seconds)
+
+    def sleep(self, seconds: float) -> None:
+        # 让出GIL, 主线程才能观察到转录线程的进度
+        time.sleep(0)
+        self.advance(seconds)
+
+
+class WallClock:
+    """
+    让StubModel在真实时间中运行: advance即sleep。用于并发(多个会话、多个进程)的benchmark, 排队只能在真实时间中发生
+    """
+
+    def __call__(self) -> float:
+        return time.monotonic()
+
+    def advance(self, seconds: float) -> None:
+        time.sleep(max(0.0, seconds))
+
+
+class StubModel:
+    """
+    接口与whisper.Whisper相同的假模型, 不做任何神经网络运算。
+    编码器输出每个位置的平均mel能量, 解码器把能量高于speech_threshold的连续位置作为一句话, 生成带timestamp的tokens;
+    延续到窗口末尾(或padding)的句子没有结束的timestamp, 与真实模型对不完整句子的输出一致。
+    没有语音的窗口no_speech_prob很高, 有语音的窗口以failure_rate的概率avg_logprob很低, 两者都会使Transcriber换用ladder的下一级策略。
+    beam_gain大于0时失败率随beam(或候选)数降低: failure_rate / (1 + beam_gain * (beams - 1))。
+    耗时: 每次运行编码器 encode_cost 秒, 每个beam每生成一个token token_cost 秒。
+    """
+
+    def __init__(
+        self,
+        clock: VirtualClock,
+        encode_cost: float      = 0.3,
+        token_cost: float       = 0.002,
+        failure_rate: float     = 0.0,
+        beam_gain: float        = 0.0,
+        speech_threshold: float = 0.25,
+        seed: int               = 0,
+    ) -> None:
+        self.clock = clock
+        self.encode_cost = encode_cost
+        self.token_cost = token_cost
+        self.failure_rate = failure_rate
+        self.beam_gain = beam_gain
+        self.speech_threshold = speech_threshold
+        self.rng = np.random.default_rng(seed)
+
+        self.dims = ModelDimensions(
+            n_mels=80, n_audio_ctx=1500, n_audio_state=1, n_audio_head=1, n_audio_layer=1,
+            n_vocab=51865, n_text_ctx=448, n_text_state=1, n_text_head=1, n_text_layer=1,
+        )
+        self.is_multilingual = True
+        self.device = torch.device("cpu")
+        self.tokenizer = get_tokenizer(True)
+        self.word = self.tokenizer.encode(" speech")
+
+    def encoder(self, mel: torch.Tensor) -> torch.Tensor:
+        """
+        (batch, n_mels, N_FRAMES) -> (batch, n_audio_ctx, 1)
+        """
+        self.clock.advance(self.encode_cost * mel.shape[0])
+        energy = mel.float().mean(dim=-2)
+        return energy.reshape(mel.shape[0], self.dims.n_audio_ctx, -1).mean(dim=-1, keepdim=True)
+
+    def decode(self, mel: torch.Tensor, options: DecodingOptions = DecodingOptions()) -> Union[DecodingResult, List[DecodingResult]]:
+        single = mel.ndim == 2
+        if single:
+            mel = mel.unsqueeze(0)
+        features = mel if mel.shape[-2] == self.dims.n_audio_ctx else self.encoder(mel)
+        results = [self.decode_features(item[:, 0], options) for item in features]
+        return results[0] if single else results
+
+    def segments(self, energy: torch.Tensor) -> List[Tuple[int, Optional[int]]]:
+        """
+        [start, end)的语音段, 没有结束(延续到窗口末尾或padding)时end为None
+        """
+        speech = (energy > self.speech_threshold).tolist()
+        padding = (energy == 0).tolist()
+        segments, start = list(), None
+        for i, is_speech in enumerate(speech + [False]):
+            if is_speech and start is None:
+                start = i
+            elif not is_speech and start is not None:
+                segments.append((start, i if i < len(speech) and not padding[i] else None))
+                start = None
+        return segments
+
+    def decode_features(self, energy: torch.Tensor, options: DecodingOptions) -> DecodingResult:
+        timestamp_begin = self.tokenizer.timestamp_begin
+        segments = self.segments(energy)
+
+        prefix = list(options.prefix or [])
+        if prefix:
+            # 强制的前缀之后只生成最后一个timestamp之后开始的句子
+            last = max((token for token in prefix if token >= timestamp_begin), default=timestamp_begin) - timestamp_begin
+            segments = [segment for segment in segments if segment[0] >= last]
+
+        tokens = list()
+        for start, end in segments:
+            length = (end or len(energy)) - start
+            tokens.append(timestamp_begin + start)
+            tokens.extend(self.word * max(1, length // 25))
+            if end is not None:
+                tokens.append(timestamp_begin + end)
+        if prefix and tokens[:len(prefix)] == prefix:
+            tokens = tokens[len(prefix):]
+
+        beams = options.beam_size or options.best_of or 1
+        self.clock.advance(self.token_cost * (len(tokens) + 1) * beams)
+
+        failed = bool(segments) and self.rng.random() < self.failure_rate / (1 + self.beam_gain * (beams - 1))
+        text_tokens = [token for token in tokens if token < self.tokenizer.eot]
+        return DecodingResult(
+            audio_features=energy,
+            language="en",
+            tokens=tokens,
+            text=self.tokenizer.decode(text_tokens),
+            avg_logprob=-2.0 if failed else -0.3,
+            no_speech_prob=0.1 if segments else 0.9,
+            temperature=options.temperature,
+            compression_ratio=1.2,
+        )
+
+
+def timed(model: whisper.Whisper, clock: VirtualClock) -> whisper.Whisper:
+    """
+    真实模型: 测量编码器和decode的实际耗时并推进虚拟时钟。decode内部调用编码器时只计一次
+    """
+    depth = [0]
+
+    def wrap(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            depth[0] += 1
+            begin = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                depth[0] -= 1
+                if depth[0] == 0:
+                    clock.advance(time.perf_counter() - begin)
+        return wrapper
+
+    model.encoder.forward = wrap(model.encoder.forward)
+    model.decode = wrap(model.decode)
+    return model
+
+
+class BenchTranscriber(Transcriber):
+    """
+    记录每个结果输出时的(虚拟)时间、换用下一级策略的次数, 以及每次转录之后的lag和mel_buffer的长度
+    """
+
+    def __enter__(self):
+        self.emitted: List[Tuple[float, TranscribeResult]] = list()
+        self.ladder_ups: int = 0
+        self.lags: List[float] = list()
+        self.peak_buffer: int = 0
+        return super().__enter__()
+
+    def update_gauges(self) -> None:
+        super().update_gauges()
+        self.lags.append(self.metrics.gauges["lag_seconds"])
+        self.peak_buffer = max(self.peak_buffer, len(self.mel_buffer))
+
+    def publish(self, results: List[TranscribeResult], final: bool = True) -> None:
+        now = self.clock()
+        self.emitted.extend((now, result) for result in results)
+        super().publish(results, final)
+
+    def try_ladder_up(self) -> bool:
+        up = super().try_ladder_up()
+        self.ladder_ups += up
+        return up
+
+
+def synthetic_speech(seconds: float, seed: int = 0) -> Tuple[np.ndarray, List[Tuple[float, float]]]:
+    """
+    长1~5s的"语音"(调幅的谐波加白噪声)与0.4~2s的静音交替, 返回音频和语音的区间
+    """
+    rng = np.random.default_rng(seed)
+    audio = 0.003 * rng.standard_normal(int(seconds * SAMPLE_RATE))
+    intervals, t = list(), rng.uniform(0.4, 2.0)
+    while t < seconds - 1:
+        length = min(rng.uniform(1.0, 5.0), seconds - t)
+        begin, end = int(t * SAMPLE_RATE), int((t + length) * SAMPLE_RATE)
+        time_axis = np.arange(end - begin) / SAMPLE_RATE
+        pitch = rng.uniform(120, 240)
+        voice = sum(np.sin(2 * np.pi * pitch * k * time_axis) / k for k in range(1, 4)) + rng.standard_normal(end - begin)
+        audio[begin:end] += 0.1 * voice * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * time_axis))
+        intervals.append((t, t + length))
+        t += length + rng.uniform(0.4, 2.0)
+    return audio.astype(np.float32), intervals
+
+
+def write_wav(path: str, audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> None:
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    return float(np.percentile(values, q)) if values else None
+
+
+def summary(values: List[float]) -> Dict[str, Optional[float]]:
+    return dict(
+        mean=float(np.mean(values)) if values else None,
+        p50=percentile(values, 50),
+        p90=percentile(values, 90),
+        max=max(values) if values else None,
+    )
+
+
+@dataclasses.dataclass
+class StreamingRun:
+    transcriber: BenchTranscriber
+    start_time: float
+    """音频开始播放时的虚拟时间"""
+    end_time: float
+    audio_duration: float
+    wall_time: float
+    finished: bool
+    """False表示在时限内没有转录完全部音频"""
+
+    def finals(self) -> List[Tuple[float, TranscribeResult]]:
+        return [(emit, result) for emit, result in self.transcriber.emitted if result.final]
+
+    def latencies(self) -> List[float]:
+        """
+        每个最终结果从它的语音结束(result.end)到被输出的延迟
+        """
+        return [emit - (self.start_time + result.end) for emit, result in self.finals()]
+
+    def first_text_latencies(self) -> List[float]:
+        """
+        每个最终结果从它的语音结束到第一次显示出文本(临时结果或者最终结果)的延迟, 文本在语音结束之前出现时为负
+        """
+        first = dict()
+        for emit, result in self.transcriber.emitted:
+            if result.text and result.segment_id not in first:
+                first[result.segment_id] = emit
+        return [first.get(result.segment_id, emit) - (self.start_time + result.end) for emit, result in self.finals()]
+
+    def report(self) -> Dict:
+        transcriber = self.transcriber
+        stats = transcriber.scheduler.stats
+        latencies = self.latencies()
+        first_text = self.first_text_latencies()
+        frames_per_second = SAMPLE_RATE / whisper.audio.HOP_LENGTH
+        return dict(
+            finished=self.finished,
+            audio_duration=self.audio_duration,
+            virtual_time=self.end_time - self.start_time,
+            wall_time=self.wall_time,
+            results=len(latencies),
+            interims=len(transcriber.emitted) - len(latencies),
+            latency=summary(latencies),
+            first_text_latency=summary(first_text),
+            rtf=stats.busy_time / self.audio_duration if self.audio_duration else None,
+            steps=stats.steps,
+            ladder_ups=transcriber.ladder_ups,
+            ladder={
+                rung: dict(dataclasses.asdict(stats), acceptance_rate=stats.acceptance_rate())
+                for rung, stats in transcriber.full_ladder.stats.items()
+            },
+            degraded_ladder={
+                rung: dict(dataclasses.asdict(stats), acceptance_rate=stats.acceptance_rate())
+                for rung, stats in transcriber.degraded_ladder.stats.items()
+            },
+            lag=summary(transcriber.lags),
+            peak_buffer_seconds=transcriber.peak_buffer / frames_per_second,
+            lag_actions=dict(transcriber.backpressure.activations) if transcriber.backpressure is not None else {},
+            skipped_seconds=transcriber.metrics.counters["skipped_seconds_total"],
+            silence_seconds=transcriber.metrics.counters["silence_seconds_total"],
+            dropped_seconds=transcriber.dropped_frames / frames_per_second,
+            overflow_seconds=transcriber.mel_buffer.dropped / frames_per_second,
+            scheduler=dataclasses.asdict(stats),
+            encoder_cache_hit_rate=transcriber.encoder_cache.stats.hit_rate(),
+            vad_skips=transcriber.vad_skips,
+            metrics=transcriber.metrics.snapshot(),
+        )
+
+
+def run_streaming(
+    audio_path: str,
+    model: Union[str, whisper.Whisper, StubModel] = "stub",
+    clock: Optional[VirtualClock] = None,
+    timeout: float = 10.0,
+    **transcriber_args
+) -> StreamingRun:
+    """
+    以实时速度(虚拟时间)回放audio_path并转录。虚拟时间超过 音频长度 * timeout 仍未转录完时放弃
+    """
+    clock = clock or VirtualClock()
+    stream = file.Stream(audio_path, clock=clock)
+    transcriber = BenchTranscriber(audio_stream=stream, model=model, clock=clock, sleep=clock.sleep, **transcriber_args)
+
+    begin = time.perf_counter()
+    with stream, transcriber:
+        start_time = stream.start_time
+        audio_duration = len(stream.data) / stream.sample_rate
+        deadline = start_time + audio_duration * timeout
+        while not transcriber.is_finished() and transcriber.transcribe_thread.is_alive() and clock() < deadline:
+            time.sleep(0.001)
+        finished = transcriber.is_finished()
+        end_time = clock()
+    return StreamingRun(transcriber, start_time, end_time, audio_duration, time.perf_counter() - begin, finished)
@@ -0,0 +1,81 @@
+"""
+比较逐块调用log_mel_spectrogram(原来的read_audio_step)与StreamingMel的每块CPU耗时,
+以及两者相对于对整段音频一次性计算的误差。
+
+    python -m benchmark.mel --seconds 60 --chunks 0.02 0.1 0.5 3
+"""
+from typing import *
+
+import argparse
+import time
+
+import numpy as np
+import torch
+from whisper.audio import log_mel_spectrogram, N_FFT, SAMPLE_RATE
+
+from satranscriber.mel import StreamingMel
+
+
+def make_audio(seconds: float, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    audio = 0.3 * np.sin(2 * np.pi * 220 * t) * (np.sin(2 * np.pi * 0.5 * t) > 0)
+    audio += 0.02 * rng.standard_normal(len(t))
+    return audio.astype(np.float32)
+
+
+def chunked(audio: np.ndarray, size: int) -> List[np.ndarray]:
+    return [audio[i:i + size] for i in range(0, len(audio), size)]
+
+
+def per_chunk(chunks: List[np.ndarray]) -> Tuple[float, torch.Tensor]:
+    """
+    原来的做法: 每块单独计算, 短于N_FFT的块被丢弃
+    """
+    mels = []
+    begin = time.perf_counter()
+    for chunk in chunks:
+        if len(chunk) < N_FFT:
+            continue
+        mels.append(log_mel_spectrogram(chunk))
+    return time.perf_counter() - begin, torch.cat(mels, dim=1) if mels else torch.zeros(0)
+
+
+def streaming(chunks: List[np.ndarray]) -> Tuple[float, torch.Tensor]:
+    frontend = StreamingMel()
+    mels = []
+    begin = time.perf_counter()
+    for chunk in chunks:
+        mels.append(frontend(chunk))
+    mels.append(frontend.flush())
+    return time.perf_counter() - begin, torch.cat(mels, dim=1)
+
+
+def error(mel: torch.Tensor, reference: torch.Tensor) -> str:
+    if mel.shape != reference.shape:
+        return "{} frames != {}".format(mel.shape[-1], reference.shape[-1])
+    return "{:.2e}".format((mel - reference).abs().max().item())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=60, help="length of the synthetic audio")
+    parser.add_argument("--chunks", type=float, nargs="+", default=[0.02, 0.1, 0.5, 3.0], help="chunk sizes in seconds")
+    parser.add_argument("--threads", type=int, default=1, help="torch intra-op threads")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    audio = make_audio(args.seconds)
+    reference = log_mel_spectrogram(audio)
+
+    print("{:>8} {:>8} {:>14} {:>14} {:>22} {:>12}".format(
+        "chunk(s)", "chunks", "per-chunk(us)", "streaming(us)", "per-chunk error", "streaming error"))
+    for seconds in args.chunks:
+        chunks = chunked(audio, max(1, int(seconds * SAMPLE_RATE)))
+        old_time, old_mel = per_chunk(chunks)
+        new_time, new_mel = streaming(chunks)
+        print("{:>8} {:>8} {:>14.1f} {:>14.1f} {:>22} {:>12}".format(
+            seconds, len(chunks),
+            old_time / len(chunks) * 1e6, new_time / len(chunks) * 1e6,
+            error(old_mel, reference), error(new_mel, reference),
+        ))
@@ -0,0 +1,111 @@
+"""
+比较录音文件在流式路径(Transcriber以max_speed读取文件, 逐个窗口转录)与离线路径(OfflineTranscriber)上的吞吐量:
+离线路径分别以本进程内batch解码(--workers 0)和多个进程(--workers N)运行。报告每秒处理的音频秒数以及输出的句子数。
+
+    python -m benchmark.offline --seconds 600 --workers 0 2 4
+    python -m benchmark.offline --model tiny --audio speech.wav --workers 0 2 --output tiny.json
+
+--model stub(默认)时StubModel在真实时钟上运行(代价以sleep体现), 多个进程的sleep可以重叠, 所以进程数的收益是理想情况;
+真实模型的多进程收益取决于CPU核心数, 每个进程平分核心。
+进程的启动和模型载入(startup)单独报告, 不计入吞吐量: 它是一次性的, 转录数小时的音频时可以忽略。
+"""
+from typing import *
+
+import argparse
+import functools
+import json
+import os
+import tempfile
+import time
+
+from satranscriber import Transcriber, choices
+from satranscriber.audio import file
+from satranscriber.offline import OfflineTranscriber
+
+from .harness import StubModel, WallClock, synthetic_speech, write_wav
+
+
+def run_streaming(audio_path: str, model, options: Dict) -> Dict:
+    stream = file.Stream(audio_path, max_speed=True)
+    begin = time.perf_counter()
+    with stream, Transcriber(audio_stream=stream, model=model, background_load=False, warmup=False, **options) as transcriber:
+        results = [result for result in transcriber if result.final]
+    return dict(path="streaming", workers=None, startup=0.0, wall_time=time.perf_counter() - begin, results=len(results), chunks=None)
+
+
+def run_offline(audio_path: str, model, workers: int, options: Dict) -> Dict:
+    begin = time.perf_counter()
+    with OfflineTranscriber(model, workers=workers, **options) as transcriber:
+        transcriber.wait_ready()
+        startup = time.perf_counter() - begin
+        results = transcriber.transcribe(file.Stream(audio_path, max_speed=True))
+    return dict(
+        path="offline", workers=workers, startup=startup, wall_time=time.perf_counter() - begin - startup, results=len(results),
+        chunks=transcriber.stats.chunks, skipped=transcriber.stats.skipped,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--audio", type=str, default=None, help="wav or raw s16le file, a synthetic one is generated if not given")
+    parser.add_argument("--seconds", type=float, default=300, help="length of the synthetic audio")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model", type=str, default="stub", help="stub, name of the Whisper model or path of a checkpoint")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4], help="process counts of the offline path, 0 decodes batches in this process")
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--skip_streaming", action="store_true", help="only run the offline path")
+
+    stub = parser.add_argument_group("stub model")
+    stub.add_argument("--encode_cost", type=float, default=0.3, help="seconds per encoder run")
+    stub.add_argument("--token_cost", type=float, default=0.002, help="seconds per generated token per beam")
+
+    transcriber = parser.add_argument_group("transcriber")
+    transcriber.add_argument("--language", type=str, default="en")
+    transcriber.add_argument("--beam_size", type=int, default=5)
+    transcriber.add_argument("--ladder", type=str, nargs="+", default=None)
+
+    parser.add_argument("--output", type=str, default=None, help="write the results as json")
+    args = parser.parse_args()
+
+    if args.model == "stub":
+        # 每个进程各自创建StubModel, functools.partial可以被传给spawn的进程
+        model = functools.partial(StubModel, WallClock(), args.encode_cost, args.token_cost, seed=args.seed)
+    elif args.model in choices.MODELS or os.path.isfile(args.model):
+        model = args.model
+    else:
+        parser.error("unknown model {!r}".format(args.model))
+
+    audio_path = args.audio
+    if audio_path is None:
+        audio, _ = synthetic_speech(args.seconds, args.seed)
+        fd, audio_path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        write_wav(audio_path, audio)
+    stream = file.Stream(audio_path, max_speed=True)
+    with stream:
+        audio_seconds = len(stream.data) / stream.sample_rate
+
+    options = dict(language=args.language, beam_size=args.beam_size, ladder=args.ladder, device=args.device, fp16=args.device != "cpu")
+    runs = list()
+    try:
+        if not args.skip_streaming:
+            runs.append(run_streaming(audio_path, model() if callable(model) else model, options))
+        for workers in args.workers:
+            runs.append(run_offline(audio_path, model, workers, dict(options, batch_size=args.batch_size)))
+    finally:
+        if args.audio is None:
+            os.remove(audio_path)
+
+    baseline = runs[0]["wall_time"]
+    print("{:>10} {:>8} {:>11} {:>10} {:>14} {:>9} {:>8} {:>8}".format(
+        "path", "workers", "startup(s)", "wall(s)", "audio s / s", "speedup", "chunks", "results"))
+    for run in runs:
+        run["throughput"] = audio_seconds / run["wall_time"]
+        run["speedup"] = baseline / run["wall_time"]
+        print("{path:>10} {:>8} {startup:>11.2f} {wall_time:>10.2f} {throughput:>14.1f} {speedup:>8.2f}x {:>8} {results:>8}".format(
+            "-" if run["workers"] is None else run["workers"], "-" if run["chunks"] is None else run["chunks"], **run))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(dict(config=vars(args), audio_seconds=audio_seconds, runs=runs), f, indent=2)
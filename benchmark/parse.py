@@ -0,0 +1,86 @@
+"""
+比较原来的split_decode_result + to_transcribe_results与parse_decode_result在长token序列上的每次耗时和内存分配,
+并检查两者的结果一致。
+
+    python -m benchmark.parse --sentences 10 50 200 --repeat 200
+"""
+from typing import *
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+from whisper import DecodingResult
+from whisper.tokenizer import get_tokenizer
+
+from satranscriber.utils.parse_result import parse_decode_result, split_decode_result, to_transcribe_results
+
+
+def make_result(n_sentences: int, tokenizer, seed: int = 0) -> DecodingResult:
+    """
+    n_sentences句带timestamp的tokens, 最后一句没有结束的timestamp
+    """
+    rng = np.random.default_rng(seed)
+    words = tokenizer.encode(" the quick brown fox jumps over the lazy dog")
+    tokens, timestamp = list(), 0
+    for i in range(n_sentences):
+        tokens.append(tokenizer.timestamp_begin + timestamp)
+        tokens.extend(rng.choice(words, rng.integers(5, 30)).tolist())
+        timestamp += int(rng.integers(10, 100))
+        if i < n_sentences - 1:
+            tokens.append(tokenizer.timestamp_begin + timestamp)
+    return DecodingResult(
+        audio_features=None, language="en", tokens=tokens, text="",
+        avg_logprob=-0.3, no_speech_prob=0.1, temperature=0.0, compression_ratio=1.2,
+    )
+
+
+def original(result: DecodingResult, tokenizer) -> List:
+    return to_transcribe_results(split_decode_result(result, tokenizer), 0, 2, tokenizer.timestamp_begin)
+
+
+def vectorized(result: DecodingResult, tokenizer) -> List:
+    return parse_decode_result(result, tokenizer, 0, 2)[0]
+
+
+def measure(function: Callable, result: DecodingResult, tokenizer, repeat: int) -> Tuple[float, int]:
+    """
+    返回每次调用的平均秒数, 以及一次调用中分配的峰值内存
+    """
+    function(result, tokenizer)
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        function(result, tokenizer)
+    elapsed = (time.perf_counter() - begin) / repeat
+
+    tracemalloc.start()
+    function(result, tokenizer)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def same(a: List, b: List) -> bool:
+    return len(a) == len(b) and all(
+        x.text == y.text and list(x.tokens) == list(y.tokens) and (x.sposition, x.tposition) == (y.sposition, y.tposition)
+        for x, y in zip(a, b)
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--sentences", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    tokenizer = get_tokenizer(True, language="en", task="transcribe")
+    print("{:>10} {:>8} {:>14} {:>14} {:>12} {:>12} {:>6}".format(
+        "sentences", "tokens", "original(us)", "vectorized(us)", "orig peak", "vec peak", "same"))
+    for n in args.sentences:
+        result = make_result(n, tokenizer)
+        orig_time, orig_peak = measure(original, result, tokenizer, args.repeat)
+        vec_time, vec_peak = measure(vectorized, result, tokenizer, args.repeat)
+        print("{:>10} {:>8} {:>14.1f} {:>14.1f} {:>12} {:>12} {:>6}".format(
+            n, len(result.tokens), orig_time * 1e6, vec_time * 1e6, orig_peak, vec_peak,
+            str(same(original(result, tokenizer), vectorized(result, tokenizer)))))
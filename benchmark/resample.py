@@ -0,0 +1,73 @@
+"""
+比较原来的librosa逐块、逐声道重采样(kaiser_fast)与Resampler(先混合为单声道, 跨块保留状态)的吞吐量。
+
+    python -m benchmark.resample --sample_rate 48000 --channels 2 --block 0.5
+"""
+from typing import *
+
+import argparse
+import time
+
+import numpy as np
+import librosa
+
+from satranscriber.audio.resample import Resampler, QUALITY
+
+TARGET_SR = 16000
+
+
+def make_frames(seconds: float, sample_rate: int, channels: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    mono = 0.3 * np.sin(2 * np.pi * 440 * t) + 0.05 * rng.standard_normal(len(t))
+    frames = np.stack([mono * (0.5 + 0.5 * c / max(1, channels - 1)) for c in range(channels)], axis=1)
+    return (frames * 32767).astype(np.int16)
+
+
+def librosa_path(blocks: List[np.ndarray], sample_rate: int, channels: int) -> Tuple[float, np.ndarray]:
+    """
+    原来speaker.Stream.read的做法
+    """
+    outputs = []
+    begin = time.perf_counter()
+    for block in blocks:
+        result = librosa.resample(
+            block.T.astype(np.float32),
+            res_type="kaiser_fast",
+            orig_sr=sample_rate,
+            target_sr=TARGET_SR,
+            scale=True,
+        )
+        outputs.append(np.sum(result, axis=0) / channels / 32768.0)
+    return time.perf_counter() - begin, np.concatenate(outputs)
+
+
+def resampler_path(blocks: List[np.ndarray], sample_rate: int, quality: str) -> Tuple[float, np.ndarray]:
+    resampler = Resampler(sample_rate, TARGET_SR, quality)
+    outputs = []
+    begin = time.perf_counter()
+    for block in blocks:
+        outputs.append(resampler(block))
+    return time.perf_counter() - begin, np.concatenate(outputs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--sample_rate", type=int, default=48000)
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--block", type=float, default=0.5, help="seconds of audio drained per read()")
+    args = parser.parse_args()
+
+    frames = make_frames(args.seconds, args.sample_rate, args.channels)
+    block = int(args.block * args.sample_rate)
+    blocks = [frames[i:i + block] for i in range(0, len(frames), block)]
+    librosa_path(blocks[:1], args.sample_rate, args.channels)
+
+    rows = [("librosa kaiser_fast",) + librosa_path(blocks, args.sample_rate, args.channels)]
+    for quality in QUALITY:
+        rows.append(("resampler " + quality,) + resampler_path(blocks, args.sample_rate, quality))
+
+    print("{:<22} {:>12} {:>14}".format("path", "cpu(s)", "x realtime"))
+    for name, seconds, audio in rows:
+        print("{:<22} {:>12.3f} {:>14.1f}".format(name, seconds, args.seconds / seconds))
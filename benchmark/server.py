@@ -0,0 +1,133 @@
+"""
+转录服务的负载测试: 在同一个Server上同时运行1, 2, 4...个以实时速度发送音频的会话, 测量:
+每个最终结果从它的语音结束到客户端收到的延迟(整体以及最差的会话)、engine的平均batch大小和繁忙程度,
+以及p90延迟不超过--max_latency时一个节点能承载的会话数。
+
+    python -m benchmark.server --sessions 1 2 4 8 --seconds 30
+    python -m benchmark.server --model tiny --sessions 1 2 4 --output tiny.json
+
+与benchmark.streaming不同, 并发的排队只能在真实时间中发生, 所以这里使用真实时钟:
+--model stub(默认)时StubModel的代价以sleep体现, 一次batch的耗时与batch大小成正比, 得到的是不考虑batch加速的保守数字。
+"""
+from typing import *
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+from satranscriber import choices
+from satranscriber.audio import file
+from satranscriber.engine import InferenceEngine
+from satranscriber.server import RemoteTranscriber, Server
+from satranscriber.utils.model import load_model
+
+from .harness import StubModel, WallClock, percentile, summary, synthetic_speech, write_wav
+
+
+def run_session(address: str, audio_path: str, options: Dict, output: Dict) -> None:
+    stream = file.Stream(audio_path)
+    received = list()
+    with stream, RemoteTranscriber(stream, address, on_result=lambda result: received.append((time.monotonic(), result)), **options) as transcriber:
+        for _ in transcriber:
+            pass
+        start_time = stream.start_time
+    output.update(
+        latencies=[emit - (start_time + result.end) for emit, result in received if result.final],
+        finished=transcriber.stats is not None,
+        stats=transcriber.stats and transcriber.stats["session"],
+    )
+
+
+def run_level(address: str, engine: InferenceEngine, audio_paths: List[str], options: Dict) -> Dict:
+    outputs = [dict() for _ in audio_paths]
+    threads = [
+        threading.Thread(target=run_session, args=(address, path, options, output))
+        for path, output in zip(audio_paths, outputs)
+    ]
+    batches, requests, decode_time = engine.stats.batches, engine.stats.requests, engine.stats.decode_time
+    begin = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.monotonic() - begin
+
+    latencies = [latency for output in outputs for latency in output.get("latencies", [])]
+    batches, requests = engine.stats.batches - batches, engine.stats.requests - requests
+    return dict(
+        sessions=len(audio_paths),
+        finished=sum(bool(output.get("finished")) for output in outputs),
+        results=len(latencies),
+        latency=summary(latencies),
+        worst_session_p90=max((percentile(output.get("latencies", []), 90) or 0.0 for output in outputs), default=None),
+        mean_batch_size=requests / batches if batches else 0.0,
+        engine_utilization=(engine.stats.decode_time - decode_time) / wall_time,
+        wall_time=wall_time,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8], help="numbers of concurrent sessions to test")
+    parser.add_argument("--seconds", type=float, default=30, help="length of the synthetic audio of each session")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model", type=str, default="stub", choices=("stub",) + choices.MODELS)
+    parser.add_argument("--device", type=str, default="cpu", help="device of the real model")
+    parser.add_argument("--max_batch", type=int, default=8)
+    parser.add_argument("--max_wait", type=float, default=0.01)
+    parser.add_argument("--max_latency", type=float, default=5.0, help="p90 latency a level must stay under to count as keeping up")
+
+    stub = parser.add_argument_group("stub model")
+    stub.add_argument("--encode_cost", type=float, default=0.3, help="seconds per encoder run")
+    stub.add_argument("--token_cost", type=float, default=0.002, help="seconds per generated token per beam")
+
+    transcriber = parser.add_argument_group("transcriber")
+    transcriber.add_argument("--language", type=str, default="en")
+    transcriber.add_argument("--beam_size", type=int, default=5)
+    transcriber.add_argument("--target_latency", type=float, default=3.0)
+    transcriber.add_argument("--min_new_audio", type=float, default=0.5)
+
+    parser.add_argument("--output", type=str, default=None, help="write the results as json")
+    args = parser.parse_args()
+
+    if args.model == "stub":
+        model = StubModel(WallClock(), args.encode_cost, args.token_cost, seed=args.seed)
+    else:
+        model = load_model(args.model, args.device)
+    engine = InferenceEngine(model, args.device, fp16=args.device != "cpu", max_batch=args.max_batch, max_wait=args.max_wait)
+
+    directory = tempfile.mkdtemp()
+    address = "unix:" + os.path.join(directory, "server.sock")
+    audio_paths = list()
+    for i in range(max(args.sessions)):
+        audio, _ = synthetic_speech(args.seconds, args.seed + i)
+        audio_paths.append(os.path.join(directory, "{}.wav".format(i)))
+        write_wav(audio_paths[-1], audio)
+    options = dict(language=args.language, beam_size=args.beam_size, target_latency=args.target_latency, min_new_audio=args.min_new_audio)
+
+    levels = list()
+    try:
+        with engine, Server(engine, address, max_sessions=max(args.sessions)):
+            for sessions in args.sessions:
+                level = run_level(address, engine, audio_paths[:sessions], options)
+                levels.append(level)
+                print("{sessions:>3} sessions  p50 {latency[p50]:.2f}s  p90 {latency[p90]:.2f}s  worst session p90 {worst_session_p90:.2f}s  "
+                      "batch {mean_batch_size:.2f}  engine busy {engine_utilization:.0%}  finished {finished}/{sessions}".format(**level))
+    finally:
+        for path in audio_paths:
+            os.remove(path)
+        os.rmdir(directory)
+
+    keeping_up = [
+        level["sessions"] for level in levels
+        if level["finished"] == level["sessions"] and level["latency"]["p90"] is not None and level["latency"]["p90"] <= args.max_latency
+    ]
+    sessions_per_node = max(keeping_up, default=0)
+    print("sessions per node (p90 <= {:.1f}s): {}".format(args.max_latency, sessions_per_node))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(dict(config=vars(args), levels=levels, sessions_per_node=sessions_per_node), f, indent=2)
@@ -0,0 +1,104 @@
+"""
+在虚拟时钟上以实时速度回放音频并流式转录, 测量:
+从一句话结束到它的TranscribeResult被输出的延迟(--interim时还有到第一次显示出文本的延迟)、实时率(转录耗时 / 音频长度)、
+decode ladder每一级的尝试次数、通过率和耗时, 落后于实时的lag、mel_buffer的峰值以及lag policies丢弃和跳过的音频。
+
+    python -m benchmark.streaming --seconds 300 --output stub.json
+    python -m benchmark.streaming --model stub --failure_rate 0.2 --target_latency 1.5
+    python -m benchmark.streaming --failure_rate 0.3 --beam_gain 0.5 --ladder greedy beam:3 beam:10 sample:0.4
+    python -m benchmark.streaming --encode_cost 3 --token_cost 0.01 --lag_policies silence:6 degrade:10 skip:20
+    python -m benchmark.streaming --model tiny --audio speech.wav --output tiny.json
+
+--model stub(默认)使用benchmark.harness.StubModel, 在CPU上几秒内跑完, 用于比较调度和缓冲的改动;
+其他取值加载真实模型, 以实测的推理耗时推进虚拟时钟, 得到端到端的数字。
+不指定--audio时使用合成的语音/静音交替的音频。
+"""
+from typing import *
+
+import argparse
+import json
+import os
+import tempfile
+
+import whisper
+
+from satranscriber.utils.model import load_model
+
+from .harness import StubModel, VirtualClock, run_streaming, synthetic_speech, timed, write_wav
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--audio", type=str, default=None, help="wav or raw s16le file to replay, a synthetic one is generated if not given")
+    parser.add_argument("--seconds", type=float, default=120, help="length of the synthetic audio")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model", type=str, default="stub", choices=["stub"] + whisper.available_models())
+    parser.add_argument("--device", type=str, default="cpu", help="device of the real model")
+    parser.add_argument("--quantize", action="store_true", help="int8 dynamic quantization of the real model on cpu")
+
+    stub = parser.add_argument_group("stub model")
+    stub.add_argument("--encode_cost", type=float, default=0.3, help="seconds per encoder run")
+    stub.add_argument("--token_cost", type=float, default=0.002, help="seconds per generated token per beam")
+    stub.add_argument("--failure_rate", type=float, default=0.0, help="probability of a low quality result on a window with speech")
+    stub.add_argument("--beam_gain", type=float, default=0.0, help="how much each extra beam or candidate lowers the failure rate")
+
+    transcriber = parser.add_argument_group("transcriber")
+    transcriber.add_argument("--language", type=str, default="en")
+    transcriber.add_argument("--beam_size", type=int, default=5)
+    transcriber.add_argument("--ladder", type=str, nargs="+", default=None, help="decode strategies, e.g. greedy beam:3 beam:10 sample:0.4")
+    transcriber.add_argument("--target_latency", type=float, default=3.0)
+    transcriber.add_argument("--min_new_audio", type=float, default=0.5)
+    transcriber.add_argument("--mel_capacity", type=int, default=6000)
+    transcriber.add_argument("--incremental", action="store_true")
+    transcriber.add_argument("--interim", action="store_true", help="publish unstable hypotheses, reported as first_text_latency")
+    transcriber.add_argument("--vad", action="store_true")
+    transcriber.add_argument("--lag_policies", type=str, nargs="+", default=None, help="e.g. silence:5 degrade:10 skip:20")
+    transcriber.add_argument("--degrade_rung", type=str, default="greedy")
+
+    parser.add_argument("--timeout", type=float, default=10.0, help="give up after this many times the audio duration in virtual time")
+    parser.add_argument("--output", type=str, default=None, help="write the results as json")
+    args = parser.parse_args()
+
+    clock = VirtualClock()
+    if args.model == "stub":
+        model = StubModel(clock, args.encode_cost, args.token_cost, args.failure_rate, args.beam_gain, seed=args.seed)
+    else:
+        model = timed(load_model(args.model, args.device, args.quantize), clock)
+
+    audio_path = args.audio
+    if audio_path is None:
+        audio, _ = synthetic_speech(args.seconds, args.seed)
+        fd, audio_path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        write_wav(audio_path, audio)
+
+    try:
+        run = run_streaming(
+            audio_path, model, clock, args.timeout,
+            language=args.language, beam_size=args.beam_size, ladder=args.ladder,
+            target_latency=args.target_latency, min_new_audio=args.min_new_audio,
+            mel_capacity=args.mel_capacity, incremental=args.incremental, interim=args.interim, vad=args.vad,
+            lag_policies=args.lag_policies, degrade_rung=args.degrade_rung,
+            device=args.device, fp16=args.device != "cpu",
+        )
+    finally:
+        if args.audio is None:
+            os.remove(audio_path)
+
+    report = dict(config=vars(args), **run.report())
+    for name in ("latency", "first_text_latency"):
+        if report[name]["p50"] is not None:
+            print("{:<20} p50 {p50:.2f}s  p90 {p90:.2f}s  max {max:.2f}s".format(name, **report[name]))
+    print("results {results}  steps {steps}  rtf {rtf:.3f}  ladder ups {ladder_ups}".format(**report))
+    for rung, stats in report["ladder"].items():
+        print("  {:<14} attempts {attempts:>4}  accepted {acceptance_rate:>4.0%}  decode {decode_time:.2f}s".format(rung, **stats))
+    for rung, stats in report["degraded_ladder"].items():
+        if stats["attempts"]:
+            print("  {:<14} attempts {attempts:>4}  accepted {acceptance_rate:>4.0%}  decode {decode_time:.2f}s  (degraded)".format(rung, **stats))
+    print("lag p90 {lag[p90]:.1f}s  max {lag[max]:.1f}s  peak buffer {peak_buffer_seconds:.1f}s  lag actions {lag_actions}".format(**report))
+    print("dropped {dropped_seconds:.1f}s  skipped {skipped_seconds:.1f}s  silence {silence_seconds:.1f}s  overflow {overflow_seconds:.1f}s  "
+          "finished {finished}  wall {wall_time:.1f}s".format(**report))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
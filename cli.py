@@ -1,40 +1,74 @@
 from typing import *
+import time
+
+STARTED = time.perf_counter()
 
 import argparse
-import time
 import importlib
 import dataclasses
 import json
+import sys
 
 import satranscriber
+from satranscriber import choices
 # from satranscriber import audio, translator
 
 
 def get_parser() -> argparse.ArgumentParser:
-    import whisper
-    from whisper.tokenizer import LANGUAGES, TO_LANGUAGE_CODE
-    
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("--config", default=None, type=str, help="path to json config file")
     parser.add_argument("--verbose", default=False, type=bool)
+    parser.add_argument("--metrics_port", default=None, type=int, help="serve prometheus metrics on http://127.0.0.1:<port>/metrics")
 
     transcriber = parser.add_argument_group("transcriber")
-    transcriber.add_argument("--model", default="medium", choices=whisper.available_models(), help="name of the Whisper model to use")
+    transcriber.add_argument("--server", type=str, default=None, help="transcribe on a running `python -m satranscriber.server` at host:port or unix:/path instead of loading the model in this process")
+    transcriber.add_argument("--model", default="medium", choices=choices.MODELS, help="name of the Whisper model to use")
     transcriber.add_argument("--task", type=str, default="transcribe", choices=["transcribe", "translate"], help="whether to perform X->X speech recognition ('transcribe') or X->English translation ('translate')")
-    transcriber.add_argument("--language", type=str, default="English", choices=sorted(LANGUAGES.keys()) + sorted([k.title() for k in TO_LANGUAGE_CODE.keys()]), help="language spoken in the audio, specify None to perform language detection")
+    transcriber.add_argument("--language", type=str, default="English", choices=choices.LANGUAGES, help="language spoken in the audio, specify None to perform language detection")
     transcriber.add_argument("--temperature", type=float, nargs='+', default=(0), help="temperature to use for sampling")
     transcriber.add_argument("--beam_size", type=int, default=10, help="number of beams in beam search, only applicable when temperature is zero")
     transcriber.add_argument("--best_of", type=int, default=10, help="number of candidates when sampling with non-zero temperature")
-    transcriber.add_argument("--fp16", type=bool, default=True, help="whether to perform inference in fp16; True by default")
+    transcriber.add_argument("--ladder", type=str, nargs='+', default=None, help="decode strategies tried in order until one passes the verification thresholds, each greedy, beam:N, sample:T or sample:T:N, e.g. greedy beam:3 beam:10 sample:0.4; built from --temperature, --beam_size and --best_of by default")
+    transcriber.add_argument("--interim", type=bool, default=False, help="show the unstable tail of each decode on the last line until it is replaced by the final text")
+    transcriber.add_argument("--incremental", type=bool, default=False, help="force the unstable sentences of the last decode as prefix and the emitted text as prompt, so beam search only runs over new speech")
+    transcriber.add_argument("--device", type=str, default=None, help="device to run the model on, cuda if available and cpu otherwise by default")
+    transcriber.add_argument("--fp16", type=bool, default=True, help="whether to perform inference in fp16; True by default, always False on cpu")
+    transcriber.add_argument("--threads", type=int, default=None, help="number of torch intra-op threads")
+    transcriber.add_argument("--interop_threads", type=int, default=None, help="number of torch inter-op threads")
+    transcriber.add_argument("--quantize", type=bool, default=False, help="run the Linear layers with int8 dynamic quantization, cpu only")
+    transcriber.add_argument("--model_dir", type=str, default=None, help="directory of the downloaded checkpoints, ~/.cache/whisper by default; a checkpoint path can also be given as --model")
+    transcriber.add_argument("--mmap", type=bool, default=True, help="memory-map the checkpoint instead of reading it into memory first (torch>=2.1)")
+    transcriber.add_argument("--background_load", type=bool, default=True, help="load the model in the background while audio is already being captured and buffered")
+    transcriber.add_argument("--warmup", type=bool, default=True, help="run one decode on silence after loading, so the first real decode is not slowed down by one-time setup")
+    transcriber.add_argument("--encoder_buckets", type=float, nargs='+', default=None, help="run the encoder over the shortest of these lengths in seconds that holds the buffer instead of always over 30s, e.g. 5 10 20; faster on short buffers at some cost in accuracy")
+    transcriber.add_argument("--offline", type=bool, default=False, help="transcribe a whole --audio file at once instead of in real time: split it at silences into chunks of at most 30s and decode the chunks in batches or across --workers processes")
+    transcriber.add_argument("--workers", type=int, default=0, help="number of processes for --offline, each loading its own copy of the model; 0 decodes batches in this process")
+    transcriber.add_argument("--batch_size", type=int, default=8, help="number of chunks decoded together by --offline")
+    transcriber.add_argument("--lag_policies", type=str, nargs='+', default=None, help="what to do when decoding falls behind real time, each action:seconds of lag, e.g. silence:5 degrade:10 skip:20; silence skips windows without speech, degrade decodes with --degrade_rung (and --degrade_model) only, skip drops the oldest audio to catch up")
+    transcriber.add_argument("--degrade_rung", type=str, default="greedy", help="decode strategy of the degrade lag policy")
+    transcriber.add_argument("--degrade_model", type=str, default=None, choices=choices.MODELS, help="smaller Whisper model used by the degrade lag policy, loaded next to --model")
+    transcriber.add_argument("--mel_capacity", type=int, default=6000, help="capacity of the mel buffer in frames (100 = 1s), the oldest frames are dropped when decoding falls behind")
+
+    scheduler = parser.add_argument_group("scheduler")
+    scheduler.add_argument("--target_latency", type=float, default=3.0, help="target seconds between audio arriving and its decode finishing, the wait before the next decode is shortened by the last decode time")
+    scheduler.add_argument("--min_new_audio", type=float, default=0.5, help="seconds of new audio required before decoding again, raise it to favour throughput over latency")
 
     verification = parser.add_argument_group("verification")
     verification.add_argument("--logprob_threshold", type=float, default=-0.6, help="if the average log probability is lower than this value, treat the decoding as failed")
     verification.add_argument("--compression_ratio_threshold", type=float, default=1.8, help="if the gzip compression ratio is higher than this value, treat the decoding as failed")
     verification.add_argument("--no_speech_threshold", type=float, default=0.6, help="if the probability of the <|nospeech|> token is higher than this value AND the decoding has failed due to `logprob_threshold`, consider the segment as silence")
+    verification.add_argument("--vad", type=bool, default=False, help="skip decoding while the buffer holds no speech and trim leading silence, using the energy and spectral flux of the mel frames")
+    verification.add_argument("--vad_threshold", type=float, default=0.2, help="how far the mean normalized log-mel energy of a frame must rise above the noise floor to count as speech")
     verification.add_argument("--padding", type=int, default=200, help="if the distance from the end of the audio is greater than this value, treat the sentence as incomplete (padding 100 = 1s)")
 
     audio = parser.add_argument_group("audio")
-    audio.add_argument("--audio", type=str, default="speaker", choices=["speaker"], help="audio streaming to transcribe")
+    audio.add_argument("--audio", type=str, default="speaker", choices=["speaker", "file", "stdin", "socket"], help="audio streaming to transcribe")
+    audio.add_argument("--audio_path", type=str, help="wav or raw s16le pcm file for --audio file")
+    audio.add_argument("--audio_address", type=str, default="127.0.0.1:9000", help="host:port or unix:/path to listen on for --audio socket")
+    audio.add_argument("--audio_sample_rate", type=int, default=16000, help="sample rate of raw pcm input")
+    audio.add_argument("--audio_channels", type=int, default=1, help="number of channels of raw pcm input")
+    audio.add_argument("--max_speed", type=bool, default=False, help="feed file/stdin/socket audio as fast as the transcriber consumes it instead of in real time")
+    audio.add_argument("--resample_quality", type=str, default="fast", choices=["best", "medium", "fast", "linear"], help="quality of the streaming resampler")
 
     translator = parser.add_argument_group("translator")
     translator.add_argument("--translator_api", type=str, choices=["youdao", "baidu", "google"], help="translate api for X -> Y translate")
@@ -43,6 +77,11 @@ def get_parser() -> argparse.ArgumentParser:
     translator.add_argument("--secret_file", type=str, help="path to secret file")
     translator.add_argument("--source_lang", type=str, help="source language for tranlator api")
     translator.add_argument("--target_lang", type=str, help="target language for tranlator api")
+    translator.add_argument("--translator_concurrency", type=int, default=4, help="number of translation requests in flight, results are still printed in order")
+    translator.add_argument("--translator_timeout", type=float, default=10.0, help="timeout in seconds of each translation request")
+    translator.add_argument("--translator_cache", type=str, default=None, help="sqlite file to cache translations across runs, repeated sentences are only sent to the api once")
+    translator.add_argument("--translator_cache_size", type=int, default=1024, help="number of translations kept in memory")
+    translator.add_argument("--translator_cache_ttl", type=float, default=7 * 24 * 3600, help="seconds before a cached translation expires")
 
     return parser
 
@@ -50,7 +89,8 @@ def get_parser() -> argparse.ArgumentParser:
 if __name__ == "__main__":
     from pprint import pprint
     
-    args = get_parser().parse_args().__dict__
+    parser = get_parser()
+    args = parser.parse_args().__dict__
 
     if args["config"]:
         with open(args["config"], "r") as f:
@@ -58,17 +98,31 @@ if __name__ == "__main__":
         args = {**args, **cfg}
 
     pprint(args)
+    imported = time.perf_counter()
+
+    if args["offline"]:
+        if args["audio"] == "speaker":
+            parser.error("--offline needs --audio file, stdin or socket, the speaker never ends")
+        # 离线转录一次读完整个文件
+        args["max_speed"] = True
 
     try:
         module = importlib.import_module("satranscriber.audio.{}".format(args["audio"]))
         AudioStream = getattr(module, "Stream")
-        audio_stream: satranscriber.audio.Stream = AudioStream()
+        audio_stream: satranscriber.audio.Stream = AudioStream(**args)
     except:
         print("failed to load audio module")
         raise
     
     try:
-        transcriber = satranscriber.Transcriber(audio_stream=audio_stream, **args)
+        if args["offline"]:
+            from satranscriber.offline import OfflineTranscriber
+            transcriber = OfflineTranscriber(**args)
+        elif args["server"]:
+            from satranscriber.server import RemoteTranscriber
+            transcriber = RemoteTranscriber(audio_stream=audio_stream, **args)
+        else:
+            transcriber = satranscriber.Transcriber(audio_stream=audio_stream, **args)
     except:
         print("failed to load transcriber")
         raise
@@ -85,22 +139,76 @@ if __name__ == "__main__":
         if args["translator_api"]:
             module = importlib.import_module("satranscriber.translator.{}".format(args["translator_api"]))
             Translator = getattr(module, "Translator")
-            translator: satranscriber.translator.Translator = Translator(args["source_lang"], args["target_lang"])
+            translator: satranscriber.translator.Translator = Translator(
+                args["source_lang"], args["target_lang"],
+                timeout=args["translator_timeout"], concurrency=args["translator_concurrency"],
+            )
             translator.authentication(**args)
+            if args["translator_cache"]:
+                from satranscriber.translator.cache import CachedTranslator
+                translator = CachedTranslator(
+                    translator, args["translator_cache"],
+                    max_entries=args["translator_cache_size"], ttl=args["translator_cache_ttl"],
+                )
     except:
         print("failed to load translator")
         raise
 
+    def report_startup():
+        phases = dict(imports=imported - STARTED, **transcriber.startup)
+        print("startup: " + ", ".join("{} {:.2f}s".format(phase, seconds) for phase, seconds in phases.items()), file=sys.stderr)
+
+    if args["metrics_port"]:
+        from satranscriber import metrics
+        metrics.serve(transcriber.metrics, args["metrics_port"])
+
+    # 临时结果显示在最后一行, 以\r覆盖
+    CLEAR_LINE = "\r\033[K" if args["interim"] else ""
+    interims: Dict[int, str] = dict()
+
+    def output(result, text, error):
+        if error is not None:
+            print(CLEAR_LINE + "error occurred while translating")
+        print(CLEAR_LINE + text)
+
+    if translator:
+        from satranscriber.translator.pipeline import TranslationPipeline
+
+    if args["offline"]:
+        pipeline = TranslationPipeline(translator, output) if translator else None
+        with transcriber:
+            results = transcriber.transcribe(audio_stream)
+        if pipeline:
+            for i in range(0, len(results), 16):
+                pipeline.submit_batch(results[i:i + 16])
+            pipeline.close()
+        else:
+            for result in results:
+                output(result, result.text, None)
+        sys.exit(0)
+
+    pipeline = TranslationPipeline(translator, output, metrics=transcriber.metrics) if translator else None
+
     with audio_stream, transcriber:
-        while True:
-            time.sleep(2)
-            results = transcriber.read()
+        # 结果被接受时立即返回, 同一次转录的其他结果随后用read()一起取出, 合并为一次翻译请求
+        for i, result in enumerate(transcriber):
+            if i == 0:
+                report_startup()
+            results = [result] + transcriber.read()
+            finals = [result for result in results if result.final]
             for result in results:
-                text = result.text
-                if translator:
-                    try:
-                        text = translator.translate(text)
-                    except:
-                        print("error occurred while translating")
-                        pass
-                print(text)
+                if result.final or not result.text:
+                    interims.pop(result.segment_id, None)
+                else:
+                    interims[result.segment_id] = result.text
+
+            if pipeline and finals:
+                pipeline.submit_batch(finals)
+            elif not pipeline:
+                for result in finals:
+                    output(result, result.text, None)
+            if interims:
+                print(CLEAR_LINE + " ".join(interims[key] for key in sorted(interims)), end="", flush=True)
+
+    if pipeline:
+        pipeline.close()
@@ -1,3 +1,19 @@
-from . import audio
-from . import translator
-from .transcriber import Transcriber, TranscribeResult
\ No newline at end of file
+import importlib
+
+__all__ = ["audio", "translator", "Transcriber", "TranscribeResult"]
+
+_ATTRIBUTES = {
+    "Transcriber": ".transcriber",
+    "TranscribeResult": ".transcriber",
+}
+
+
+def __getattr__(name):
+    """
+    按需导入(PEP 562): 只用到satranscriber.choices等轻量模块时不需要导入torch和whisper
+    """
+    if name in ("audio", "translator"):
+        return importlib.import_module("." + name, __name__)
+    if name in _ATTRIBUTES:
+        return getattr(importlib.import_module(_ATTRIBUTES[name], __name__), name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
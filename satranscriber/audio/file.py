@@ -0,0 +1,118 @@
+from typing import *
+import struct
+import time
+
+import numpy as np
+
+from . import stream
+from .resample import Resampler
+
+
+WAV_FORMATS = {
+    (1, 16): np.int16,
+    (1, 32): np.int32,
+    (3, 32): np.float32,
+}
+"""(wFormatTag, wBitsPerSample)到样本类型的映射, 1为PCM, 3为IEEE float"""
+
+
+def read_wav_header(path: str) -> Tuple[int, int, np.dtype, int, int]:
+    """
+    遍历RIFF chunk, 返回(采样率, 声道数, 样本类型, data的偏移, data的字节数)
+    """
+    with open(path, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise ValueError("{} is not a RIFF/WAVE file".format(path))
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError("{} has no data chunk".format(path))
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                f.seek(size - 16 + size % 2, 1)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError("{} has no fmt chunk before data".format(path))
+                format_tag, channels, sample_rate, _, _, bits = fmt
+                if (format_tag, bits) not in WAV_FORMATS:
+                    raise ValueError("unsupported wav format {} with {} bits".format(format_tag, bits))
+                return sample_rate, channels, WAV_FORMATS[(format_tag, bits)], f.tell(), size
+            else:
+                f.seek(size + size % 2, 1)
+
+
+class Stream(stream.Stream):
+    """
+    WAV文件或者s16le的裸PCM文件, 用memmap按需读取而不是一次全部载入内存。
+    默认按实际时间读取, max_speed为True时以Transcriber能处理的最快速度读取。
+    """
+
+    def __init__(
+        self,
+        audio_path: str,
+        audio_sample_rate: int      = 16000,
+        audio_channels: int         = 1,
+        max_speed: bool             = False,
+        chunk_seconds: float        = 1.0,
+        resample_quality: str       = "fast",
+        clock: Callable[[], float]  = time.monotonic,
+        **kwargs
+    ) -> None:
+        """
+        audio_sample_rate, audio_channels: 裸PCM文件的采样率和声道数, WAV文件使用文件头中的值
+        chunk_seconds: max_speed时每次read返回的最长音频
+        clock: 按实际时间读取时使用的时钟, benchmark中替换为虚拟时钟
+        """
+        self.path = audio_path
+        self.sample_rate = audio_sample_rate
+        self.channels = audio_channels
+        self.realtime = not max_speed
+        self.chunk_seconds = chunk_seconds
+        self.resample_quality = resample_quality
+        self.clock = clock
+
+    def __enter__(self):
+        with open(self.path, "rb") as f:
+            is_wav = f.read(4) == b"RIFF"
+
+        if is_wav:
+            self.sample_rate, self.channels, dtype, offset, size = read_wav_header(self.path)
+        else:
+            dtype, offset = np.int16, 0
+            size = None
+        itemsize = np.dtype(dtype).itemsize * self.channels
+        frames = (size if size is not None else self._file_size() - offset) // itemsize
+
+        self.data = np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=(frames, self.channels))
+        self.position = 0
+        self.resampler = Resampler(self.sample_rate, self.SAMPLE_RATE, self.resample_quality)
+        self.start_time = self.clock()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        del self.data
+
+    def _file_size(self) -> int:
+        with open(self.path, "rb") as f:
+            return f.seek(0, 2)
+
+    @property
+    def exhausted(self) -> bool:
+        return self.position >= len(self.data)
+
+    def read(self) -> np.ndarray:
+        if self.realtime:
+            end = int((self.clock() - self.start_time) * self.sample_rate)
+        else:
+            end = self.position + int(self.chunk_seconds * self.sample_rate)
+        end = min(end, len(self.data))
+        if end <= self.position:
+            return np.ndarray(0, np.float32)
+
+        frames = np.asarray(self.data[self.position:end])
+        self.position = end
+        return self.resampler(frames, end_of_input=self.exhausted)
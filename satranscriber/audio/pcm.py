@@ -0,0 +1,99 @@
+from typing import *
+from abc import ABC, abstractmethod
+import threading
+import time
+
+import numpy as np
+
+from . import stream
+from .ring import RingBuffer
+from .resample import Resampler
+
+
+class Stream(stream.Stream, ABC):
+    """
+    在后台线程中从字节流(stdin、socket等)读取s16le裸PCM, 写入环形缓冲区。
+    realtime时缓冲区满了就丢弃新数据(计入overruns); max_speed时读取线程等待消费者, 背压会传递给发送方。
+    子类实现open_source、recv和close_source。
+    """
+
+    def __init__(
+        self,
+        audio_sample_rate: int      = 16000,
+        audio_channels: int         = 1,
+        max_speed: bool             = False,
+        buffer_seconds: float       = 60,
+        resample_quality: str       = "fast",
+        **kwargs
+    ) -> None:
+        self.sample_rate = audio_sample_rate
+        self.channels = audio_channels
+        self.realtime = not max_speed
+        self.buffer_seconds = buffer_seconds
+        self.resample_quality = resample_quality
+
+    def open_source(self) -> None:
+        pass
+
+    @abstractmethod
+    def recv(self, size: int) -> bytes:
+        """
+        读取最多size字节, 音频结束时返回b""
+        """
+        pass
+
+    def close_source(self) -> None:
+        pass
+
+    def __enter__(self):
+        self.buffer = RingBuffer(int(self.sample_rate * self.buffer_seconds), self.channels, np.int16)
+        self.resampler = Resampler(self.sample_rate, self.SAMPLE_RATE, self.resample_quality)
+        self.eof = False
+        self.flushed = False
+        self.is_exited = False
+        self.open_source()
+        self.thread = threading.Thread(target=self.receive, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.is_exited = True
+        self.close_source()
+
+    @property
+    def overruns(self) -> int:
+        return self.buffer.overruns
+
+    @property
+    def exhausted(self) -> bool:
+        return self.eof and self.flushed and self.buffer.available() == 0
+
+    def receive(self):
+        frame_size = 2 * self.channels
+        block = 1024 * frame_size
+        remainder = b""
+        try:
+            while not self.is_exited:
+                data = self.recv(block)
+                if not data:
+                    break
+                data = remainder + data
+                length = len(data) // frame_size * frame_size
+                data, remainder = data[:length], data[length:]
+                if not self.realtime:
+                    while self.buffer.free() < length // frame_size and not self.is_exited:
+                        time.sleep(0.01)
+                self.buffer.write(data)
+        except OSError:
+            if not self.is_exited:
+                raise
+        finally:
+            self.eof = True
+
+    def read(self) -> np.ndarray:
+        if self.buffer.available() == 0:
+            if self.eof and not self.flushed:
+                self.flushed = True
+                return self.resampler(np.zeros((0, self.channels), np.int16), end_of_input=True)
+            return np.ndarray(0, np.float32)
+        return self.resampler(self.buffer.read())
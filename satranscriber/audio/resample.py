@@ -0,0 +1,46 @@
+import numpy as np
+import samplerate
+
+
+QUALITY = {
+    "best":     "sinc_best",
+    "medium":   "sinc_medium",
+    "fast":     "sinc_fastest",
+    "linear":   "linear",
+}
+"""重采样质量档位到libsamplerate转换器的映射"""
+
+
+def downmix(frames: np.ndarray) -> np.ndarray:
+    """
+    (frames, channels)的交错样本混合为float32单声道, 整数样本按样本宽度normalize到[-1, 1)
+    """
+    scale = float(-np.iinfo(frames.dtype).min) if np.issubdtype(frames.dtype, np.integer) else 1.0
+    if frames.ndim == 1:
+        return frames.astype(np.float32) / scale
+    return frames.mean(axis=1, dtype=np.float32) / scale
+
+
+class Resampler:
+    """
+    有状态的流式重采样: 先混合为单声道, 再用同一个libsamplerate转换器处理连续的块,
+    滤波器状态跨调用保留, 所以块的边界处不会出现不连续。
+    """
+
+    def __init__(self, orig_sr: int, target_sr: int, quality: str = "fast") -> None:
+        if quality not in QUALITY:
+            raise ValueError("unknown resample quality {}, choose from {}".format(quality, list(QUALITY)))
+        self.orig_sr = orig_sr
+        self.target_sr = target_sr
+        self.ratio = target_sr / orig_sr
+        self.quality = quality
+        self.resampler = samplerate.Resampler(QUALITY[quality], channels=1)
+
+    def __call__(self, frames: np.ndarray, end_of_input: bool = False) -> np.ndarray:
+        mono = downmix(frames)
+        if self.orig_sr == self.target_sr:
+            return mono
+        return self.resampler.process(mono, self.ratio, end_of_input=end_of_input).astype(np.float32, copy=False)
+
+    def reset(self) -> None:
+        self.resampler.reset()
@@ -0,0 +1,88 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    单生产者单消费者的定长环形缓冲区, 存放交错排列的多声道样本(frames, channels)。
+    write只由音频回调调用且只修改write_pos, read只由消费者调用且只修改read_pos, 所以两边都不需要加锁。
+    消费者读取得太慢、缓冲区已满时, 新到达的帧会被丢弃并计入overruns。
+    """
+
+    def __init__(self, capacity: int, channels: int, dtype=np.int16) -> None:
+        self.capacity = capacity
+        self.channels = channels
+        self.data = np.zeros((capacity, channels), dtype=dtype)
+
+        self.write_pos: int = 0
+        self.read_pos: int = 0
+        self.overruns: int = 0
+        """因为缓冲区已满而丢弃的帧数"""
+
+    def available(self) -> int:
+        return self.write_pos - self.read_pos
+
+    def free(self) -> int:
+        return self.capacity - self.available()
+
+    def write(self, in_data) -> int:
+        """
+        in_data为PortAudio回调得到的bytes(或同样布局的ndarray), 返回实际写入的帧数
+        """
+        frames = np.frombuffer(in_data, dtype=self.data.dtype).reshape((-1, self.channels))
+        length = frames.shape[0]
+        free = self.free()
+        if length > free:
+            self.overruns += length - free
+            frames, length = frames[:free], free
+
+        start = self.write_pos % self.capacity
+        first = min(length, self.capacity - start)
+        self.data[start:start + first] = frames[:first]
+        self.data[:length - first] = frames[first:]
+
+        self.write_pos += length
+        return length
+
+    def read(self) -> np.ndarray:
+        """
+        取出全部未读的帧, 只复制一次
+        """
+        length = self.available()
+        start = self.read_pos % self.capacity
+        if start + length <= self.capacity:
+            result = self.data[start:start + length].copy()
+        else:
+            result = np.concatenate([self.data[start:], self.data[:start + length - self.capacity]])
+        self.read_pos += length
+        return result
+
+
+if __name__ == "__main__":
+    """
+    用假的回调驱动检查缓冲区, 不需要声卡
+    """
+    import threading
+    import time
+
+    CHANNELS, FRAMES_PER_BUFFER = 2, 1024
+    ring = RingBuffer(48000, CHANNELS)
+    counter = np.arange(200 * FRAMES_PER_BUFFER * CHANNELS, dtype=np.int16)
+
+    def driver():
+        for i in range(200):
+            block = counter[i * FRAMES_PER_BUFFER * CHANNELS:(i + 1) * FRAMES_PER_BUFFER * CHANNELS]
+            ring.write(block.tobytes())
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=driver)
+    thread.start()
+    received = []
+    while thread.is_alive() or ring.available():
+        time.sleep(0.01)
+        received.append(ring.read())
+    thread.join()
+
+    received = np.concatenate(received).reshape(-1)
+    assert ring.overruns == 0
+    assert np.array_equal(received, counter[:len(received)])
+    print("read {} frames, overruns {}".format(len(received) // CHANNELS, ring.overruns))
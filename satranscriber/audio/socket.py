@@ -0,0 +1,51 @@
+import os
+import socket
+
+from . import pcm
+
+
+def parse_address(address: str):
+    """
+    "unix:/path/to/socket"为Unix socket, "host:port"为TCP
+    """
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "0.0.0.0", int(port))
+
+
+class Stream(pcm.Stream):
+    """
+    在TCP或Unix socket上监听, 接受一个连接并读取其发送的s16le裸PCM, 连接关闭即音频结束。例如
+
+        ffmpeg -re -i input.mp4 -f s16le -ac 1 -ar 16000 tcp://127.0.0.1:9000
+    """
+
+    def __init__(self, audio_address: str = "127.0.0.1:9000", **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.address = audio_address
+
+    def open_source(self) -> None:
+        family, address = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.unlink(address)
+        self.server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(address)
+        self.server.listen(1)
+        self.connection = None
+
+    def recv(self, size: int) -> bytes:
+        if self.connection is None:
+            self.connection, _ = self.server.accept()
+        return self.connection.recv(size)
+
+    def close_source(self) -> None:
+        for sock in (self.connection, self.server):
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                sock.close()
@@ -1,9 +1,9 @@
 import pyaudiowpatch as pyaudio
 import numpy as np
-import threading
-import librosa
 
 from . import stream
+from .ring import RingBuffer
+from .resample import Resampler
 
 
 def get_speaker():
@@ -27,6 +27,14 @@ def get_speaker():
 
 
 class Stream(stream.Stream):
+    def __init__(self, buffer_seconds: float = 60, resample_quality: str = "fast", **kwargs) -> None:
+        """
+        buffer_seconds: 捕获缓冲区的长度, 超过这个长度还没有被read的音频会被丢弃(计入overruns)
+        resample_quality: 重采样质量, 见resample.QUALITY
+        """
+        self.buffer_seconds = buffer_seconds
+        self.resample_quality = resample_quality
+
     def __enter__(self):
         self.p = pyaudio.PyAudio()
 
@@ -35,8 +43,8 @@ class Stream(stream.Stream):
         self.speaker_sr = int(speaker["defaultSampleRate"])
         self.speaker_ac = speaker["maxInputChannels"]
 
-        self.buffer = np.ndarray((self.speaker_ac, 0), dtype=np.float32)
-        self.lock = threading.Lock()
+        self.buffer = RingBuffer(int(self.speaker_sr * self.buffer_seconds), self.speaker_ac, np.int16)
+        self.resampler = Resampler(self.speaker_sr, self.SAMPLE_RATE, self.resample_quality)
 
         self.stream = self.p.open(
             format=                 pyaudio.paInt16,
@@ -55,30 +63,17 @@ class Stream(stream.Stream):
         self.stream.close()
         self.p.terminate()
 
+    @property
+    def overruns(self) -> int:
+        return self.buffer.overruns
+
     def read(self) -> np.ndarray:
-        with self.lock:
-            if self.buffer.shape[-1] == 0:
-                return np.ndarray(0, np.float32)
-            buffer, self.buffer = self.buffer, np.ndarray((self.speaker_ac, 0), dtype=np.float32)
-        
-        result = librosa.resample(
-            buffer, 
-            res_type="kaiser_fast", 
-            orig_sr=self.speaker_sr, 
-            target_sr=self.SAMPLE_RATE, 
-            scale=True
-        )
-        """
-        scale 需要为True, 要保证音量
-        """
-        return np.sum(result, axis=0, keepdims=False) / self.speaker_ac / 32768.0
+        if self.buffer.available() == 0:
+            return np.ndarray(0, np.float32)
+        return self.resampler(self.buffer.read())
 
     def callback(self, in_data, frame_count, time_info, status):
-        mat = np.frombuffer(
-            in_data, dtype=np.int16
-        ).astype(np.float32).reshape((self.speaker_ac, -1), order="F")
-        with self.lock: 
-            self.buffer = np.concatenate([self.buffer, mat], axis=1)
+        self.buffer.write(in_data)
         return (None, pyaudio.paContinue)
 
 
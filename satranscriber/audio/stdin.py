@@ -0,0 +1,14 @@
+import sys
+
+from . import pcm
+
+
+class Stream(pcm.Stream):
+    """
+    从标准输入读取s16le裸PCM, 例如
+
+        ffmpeg -i input.mp4 -f s16le -ac 1 -ar 16000 - | python cli.py --audio stdin
+    """
+
+    def recv(self, size: int) -> bytes:
+        return sys.stdin.buffer.read1(size)
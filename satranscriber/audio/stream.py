@@ -1,9 +1,19 @@
 from abc import ABC, abstractmethod
-import whisper
 import numpy as np
 
 class Stream(ABC):
-	SAMPLE_RATE = whisper.audio.SAMPLE_RATE
+	SAMPLE_RATE = 16000
+	"""与whisper.audio.SAMPLE_RATE相同, 不导入whisper"""
+
+	realtime: bool = True
+	"""音频是否按实际时间到达。为False时(例如以最快速度读取文件)Transcriber只在窗口未满时读取, 由消费速度决定读取速度"""
+
+	@property
+	def exhausted(self) -> bool:
+		"""
+		音频源已经结束并且全部被read
+		"""
+		return False
 
 	@abstractmethod
 	def read(self) -> np.ndarray:
@@ -0,0 +1,80 @@
+from typing import *
+import dataclasses
+
+
+ACTIONS = ("silence", "degrade", "skip")
+"""
+silence: 不解码没有语音的窗口, 去掉语音之前的静音(与vad=True相同), 最先丢弃的是静音;
+degrade: 只用最便宜的解码策略(以及degrade_model)解码, 失败时不再换用下一级;
+skip: 丢弃最旧的音频, 只保留最近的一段, 直接跳到接近实时的位置
+"""
+
+
+@dataclasses.dataclass(frozen=True)
+class LagPolicy:
+    """
+    lag超过threshold秒时启用action, 降到threshold * recover以下时停止
+    """
+    action: str
+    threshold: float
+
+    def __str__(self) -> str:
+        return "{}:{:g}".format(self.action, self.threshold)
+
+
+def parse_policy(text: str) -> LagPolicy:
+    """
+    "action:threshold", 例如"silence:5", "degrade:10", "skip:20"
+    """
+    action, _, threshold = text.partition(":")
+    try:
+        if action in ACTIONS:
+            return LagPolicy(action, float(threshold))
+    except ValueError:
+        pass
+    raise ValueError("invalid lag policy {!r}, expected one of {} followed by :seconds".format(text, ", ".join(ACTIONS)))
+
+
+class Backpressure:
+    """
+    转录跟不上实时音频时, 根据lag(已经采集的音频比上一次解码的窗口多出的秒数)逐级启用policies。
+    启用和停止之间有回差(recover), 避免lag在阈值附近时反复切换。
+    activations记录每个action被启用的次数
+    """
+
+    def __init__(self, policies: Sequence[LagPolicy], recover: float = 0.5) -> None:
+        if len({policy.action for policy in policies}) != len(policies):
+            raise ValueError("each lag policy action can only be given once")
+        self.policies = sorted(policies, key=lambda policy: policy.threshold)
+        self.recover = recover
+        self.active: Set[str] = set()
+        self.activations: Dict[str, int] = {policy.action: 0 for policy in self.policies}
+        self.lag: float = 0.0
+
+    def update(self, lag: float) -> Tuple[List[str], List[str]]:
+        """
+        返回这次新启用和停止的action
+        """
+        self.lag = lag
+        started, stopped = list(), list()
+        for policy in self.policies:
+            if policy.action not in self.active and lag > policy.threshold:
+                self.active.add(policy.action)
+                self.activations[policy.action] += 1
+                started.append(policy.action)
+            elif policy.action in self.active and lag < policy.threshold * self.recover:
+                self.active.discard(policy.action)
+                stopped.append(policy.action)
+        return started, stopped
+
+    def release(self, action: str) -> None:
+        """
+        一次性的action(skip)执行之后立即停止, lag再次超过阈值时重新启用
+        """
+        self.active.discard(action)
+
+    def __contains__(self, action: str) -> bool:
+        return action in self.active
+
+    def threshold(self, action: str) -> Optional[float]:
+        return next((policy.threshold for policy in self.policies if policy.action == action), None)
@@ -0,0 +1,66 @@
+from typing import *
+import collections
+import dataclasses
+import time
+
+import torch
+
+
+@dataclasses.dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    encode_time: float = 0.0
+    """未命中时运行编码器的总时间"""
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def saved_time(self) -> float:
+        """
+        按未命中时的平均编码时间估计命中节省的时间
+        """
+        return self.encode_time / self.misses * self.hits if self.misses else 0.0
+
+
+class EncoderCache:
+    """
+    缓存一个mel窗口的编码器输出, 以窗口的(绝对mel offset, 有效长度, 编码器输入的帧数)为key。
+    换用下一级策略重试或者没有新帧时的重新解码可以直接使用缓存, 完全跳过编码器。
+    mel帧写入后不会再改变, 所以相同的key总是对应相同的输入; offset前移后旧的条目不会再被访问, 由evict清除。
+    """
+
+    def __init__(self, max_entries: int = 4) -> None:
+        self.max_entries = max_entries
+        self.entries: "collections.OrderedDict[Tuple[int, int, int], torch.Tensor]" = collections.OrderedDict()
+        self.stats = CacheStats()
+
+    def get(self, key: Tuple[int, int, int], encode: Callable[[], torch.Tensor]) -> torch.Tensor:
+        if key in self.entries:
+            self.stats.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        begin = time.perf_counter()
+        features = encode()
+        self.stats.encode_time += time.perf_counter() - begin
+        self.stats.misses += 1
+
+        self.entries[key] = features
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return features
+
+    def clear(self) -> None:
+        """
+        换用另一个模型编码时, 已有的条目都不能再使用
+        """
+        self.entries.clear()
+
+    def evict(self, offset: int) -> None:
+        """
+        删除offset之前开始的窗口
+        """
+        for key in [key for key in self.entries if key[0] < offset]:
+            del self.entries[key]
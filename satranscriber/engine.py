@@ -0,0 +1,207 @@
+from typing import *
+import dataclasses
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+import whisper
+from whisper import DecodingOptions, DecodingResult
+from whisper.audio import pad_or_trim, N_FRAMES
+
+from .utils import decode
+from .utils.model import default_device, inference_dtype, load_model, set_threads
+
+
+@dataclasses.dataclass
+class SessionStats:
+    requests: int = 0
+    queue_time: float = 0.0
+    """请求在队列中等待的总时间"""
+    decode_time: float = 0.0
+    """请求所在batch的解码总时间"""
+    batch_size: int = 0
+    """请求所在batch大小的总和"""
+
+    def latency(self) -> float:
+        return (self.queue_time + self.decode_time) / self.requests if self.requests else 0.0
+
+
+@dataclasses.dataclass
+class EngineStats:
+    batches: int = 0
+    requests: int = 0
+    decode_time: float = 0.0
+
+    def mean_batch_size(self) -> float:
+        return self.requests / self.batches if self.batches else 0.0
+
+
+@dataclasses.dataclass
+class Request:
+    session: "Session"
+    mel: torch.Tensor
+    options: DecodingOptions
+    key: Tuple
+    future: Future
+    submitted: float
+    n_frames: int = N_FRAMES
+    """编码器输入的帧数, 见decode.bucket_frames"""
+
+
+def options_key(options: DecodingOptions) -> Tuple:
+    """
+    DecodingOptions相同的请求才能合并为一个batch, prompt和prefix是list, 转换为tuple之后才能hash
+    """
+    return tuple(
+        tuple(value) if isinstance(value, list) else value
+        for value in dataclasses.astuple(options)
+    )
+
+
+class Session:
+    """
+    一个音频流在InferenceEngine上的会话, 由Transcriber持有
+    """
+
+    def __init__(self, engine: "InferenceEngine", name: str) -> None:
+        self.engine = engine
+        self.name = name
+        self.stats = SessionStats()
+
+    def decode(self, mel: torch.Tensor, n_frames: int = N_FRAMES, **decode_options) -> DecodingResult:
+        return self.engine.submit(self, mel, DecodingOptions(**decode_options), n_frames).result()
+
+    def close(self) -> None:
+        self.engine.unregister(self)
+
+
+class InferenceEngine:
+    """
+    多个Transcriber共用的一份模型。
+    工作线程收集各个会话待解码的窗口, 把DecodingOptions相同的请求合并为一次batch的model.decode(编码器和解码器都是batch运算)。
+    为了公平, 每个batch里每个会话最多一个请求, 并且总是先处理等待最久的请求。
+    """
+
+    def __init__(
+        self,
+        model: Union[str, whisper.Whisper]  = "medium",
+        device: Optional[str]               = None,
+        fp16: bool                          = True,
+        threads: Optional[int]              = None,
+        interop_threads: Optional[int]      = None,
+        quantize: bool                      = False,
+        max_batch: int                      = 8,
+        max_wait: float                     = 0.01,
+    ) -> None:
+        """
+        max_wait: 收到第一个请求后, 为了凑成更大的batch最多再等待的秒数
+        """
+        self.device = device or default_device()
+        self.dtype = inference_dtype(self.device, fp16)
+        set_threads(threads, interop_threads)
+        self.model: whisper.Whisper = load_model(model, self.device, quantize, dtype=self.dtype) if isinstance(model, str) else model
+
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+
+        self.sessions: Dict[str, Session] = dict()
+        self.queue: List[Request] = list()
+        self.condition = threading.Condition()
+        self.counter = itertools.count()
+        self.stats = EngineStats()
+
+        self.is_exited = True
+        self.thread: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        self.is_exited = False
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        with self.condition:
+            self.is_exited = True
+            self.condition.notify_all()
+        self.thread.join(timeout=1)
+        for request in self.queue:
+            request.future.cancel()
+        self.queue.clear()
+
+    def register(self, name: Optional[str] = None) -> Session:
+        name = name or "session-{}".format(next(self.counter))
+        if name in self.sessions:
+            raise ValueError("session {} is already registered".format(name))
+        session = Session(self, name)
+        self.sessions[name] = session
+        return session
+
+    def unregister(self, session: Session) -> None:
+        self.sessions.pop(session.name, None)
+
+    def submit(self, session: Session, mel: torch.Tensor, options: DecodingOptions, n_frames: int = N_FRAMES) -> Future:
+        if self.is_exited:
+            raise RuntimeError("inference engine is not running")
+        future = Future()
+        request = Request(session, mel, options, options_key(options), future, time.monotonic(), n_frames)
+        with self.condition:
+            self.queue.append(request)
+            self.condition.notify()
+        return future
+
+    def take_batch(self) -> List[Request]:
+        """
+        取出最早的请求, 以及与它DecodingOptions相同、属于其他会话的请求
+        """
+        key = self.queue[0].key
+        batch, sessions, rest = list(), set(), list()
+        for request in self.queue:
+            if len(batch) < self.max_batch and request.key == key and request.session.name not in sessions:
+                batch.append(request)
+                sessions.add(request.session.name)
+            else:
+                rest.append(request)
+        self.queue = rest
+        return batch
+
+    def serve(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.is_exited:
+                    self.condition.wait()
+                if self.is_exited:
+                    return
+                deadline = self.queue[0].submitted + self.max_wait
+                while len(self.queue) < self.max_batch and not self.is_exited:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch = self.take_batch()
+            self.run(batch)
+
+    def run(self, batch: List[Request]) -> None:
+        begin = time.monotonic()
+        try:
+            # 不同长度的请求在同一个batch中时补齐到最长的一个
+            n_frames = max(request.n_frames for request in batch)
+            mel = torch.stack([pad_or_trim(request.mel, n_frames) for request in batch])
+            results = decode.decode_batch(self.model, mel.to(self.model.device).to(self.dtype), batch[0].options)
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        elapsed = time.monotonic() - begin
+        self.stats.batches += 1
+        self.stats.requests += len(batch)
+        self.stats.decode_time += elapsed
+        for request, result in zip(batch, results):
+            stats = request.session.stats
+            stats.requests += 1
+            stats.queue_time += begin - request.submitted
+            stats.decode_time += elapsed
+            stats.batch_size += len(batch)
+            request.future.set_result(result)
@@ -0,0 +1,91 @@
+from typing import *
+import dataclasses
+
+
+@dataclasses.dataclass(frozen=True)
+class Rung:
+    """
+    一种解码策略: temperature为0时beam_size为None是greedy, 否则是beam search; temperature大于0时是best_of个候选的采样
+    """
+    temperature: float = 0.0
+    beam_size: Optional[int] = None
+    best_of: Optional[int] = None
+
+    def options(self) -> Dict:
+        if self.temperature == 0:
+            return dict(temperature=0.0, beam_size=self.beam_size if self.beam_size and self.beam_size > 1 else None, best_of=None)
+        return dict(temperature=self.temperature, beam_size=None, best_of=self.best_of)
+
+    def __str__(self) -> str:
+        if self.temperature > 0:
+            return "sample:{:g}".format(self.temperature) + (":{}".format(self.best_of) if self.best_of else "")
+        if self.beam_size and self.beam_size > 1:
+            return "beam:{}".format(self.beam_size)
+        return "greedy"
+
+
+def parse_rung(text: str) -> Rung:
+    """
+    "greedy", "beam:N", "sample:T"或者"sample:T:N"(N个候选)
+    """
+    kind, *values = text.split(":")
+    try:
+        if kind == "greedy" and not values:
+            return Rung()
+        if kind == "beam" and len(values) == 1:
+            return Rung(beam_size=int(values[0]))
+        if kind == "sample" and len(values) in (1, 2):
+            return Rung(temperature=float(values[0]), best_of=int(values[1]) if len(values) == 2 else None)
+    except ValueError:
+        pass
+    raise ValueError("invalid decode strategy {!r}, expected greedy, beam:N, sample:T or sample:T:N".format(text))
+
+
+def default_ladder(temperatures: Sequence[float], beam_size: int, best_of: int) -> List[Rung]:
+    """
+    没有指定ladder时与原来的升温相同: 温度为0时beam search, 之后依次以更高的温度采样
+    """
+    return [Rung(beam_size=beam_size) if temperature == 0 else Rung(temperature=temperature, best_of=best_of) for temperature in temperatures]
+
+
+@dataclasses.dataclass
+class RungStats:
+    attempts: int = 0
+    accepted: int = 0
+    decode_time: float = 0.0
+
+    def acceptance_rate(self) -> float:
+        return self.accepted / self.attempts if self.attempts else 0.0
+
+
+class DecodeLadder:
+    """
+    从最便宜的策略开始解码, 结果没有通过is_quality时才换到下一级; 窗口前移(转录成功或者放弃)之后回到第一级。
+    stats记录每一级的尝试次数、通过次数和解码耗时, 用来选择能保持质量的最便宜的ladder
+    """
+
+    def __init__(self, rungs: Sequence[Rung]) -> None:
+        if not rungs:
+            raise ValueError("the decode ladder needs at least one rung")
+        self.rungs = list(rungs)
+        self.index = 0
+        self.stats: Dict[str, RungStats] = {str(rung): RungStats() for rung in self.rungs}
+
+    @property
+    def rung(self) -> Rung:
+        return self.rungs[self.index]
+
+    def up(self) -> bool:
+        if self.index + 1 < len(self.rungs):
+            self.index += 1
+            return True
+        return False
+
+    def reset(self) -> None:
+        self.index = 0
+
+    def record(self, accepted: bool, decode_time: float) -> None:
+        stats = self.stats[str(self.rung)]
+        stats.attempts += 1
+        stats.accepted += accepted
+        stats.decode_time += decode_time
@@ -0,0 +1,169 @@
+from typing import *
+import numpy as np
+import torch
+
+from whisper.audio import N_FRAMES, N_MELS, N_FFT, HOP_LENGTH
+from whisper.audio import mel_filters
+
+
+class MelBuffer:
+    """
+    定长的环形mel谱缓冲区, 以绝对帧序号索引(offset即原来的mel_offset)。
+    每一帧同时写入 i 和 i + capacity 两个位置, 所以从任意位置开始、长度不超过capacity的窗口都是连续的view。
+    已释放的位置会被清零, 因此window()得到的N_FRAMES窗口不需要再pad。
+    """
+
+    def __init__(self, capacity: int = 2 * N_FRAMES, n_mels: int = N_MELS) -> None:
+        if capacity < N_FRAMES:
+            raise ValueError("capacity must be at least N_FRAMES ({})".format(N_FRAMES))
+        self.capacity = capacity
+        self.data = torch.zeros((n_mels, 2 * capacity))
+
+        self.offset: int = 0
+        """最旧的一帧的绝对序号"""
+        self.end: int = 0
+        """最新的一帧之后的绝对序号"""
+        self.dropped: int = 0
+        """因为容量不足而丢弃的帧数"""
+
+    def __len__(self) -> int:
+        return self.end - self.offset
+
+    def _write(self, position: int, mel: Optional[torch.Tensor], length: int) -> None:
+        """
+        从绝对位置position开始写入length帧, mel为None时写入0。环绕时最多分两段写。
+        """
+        start = position % self.capacity
+        first = min(length, self.capacity - start)
+        for begin, src in ((start, slice(0, first)), (0, slice(first, length))):
+            n = src.stop - src.start
+            if n <= 0:
+                continue
+            for base in (begin, begin + self.capacity):
+                if mel is None:
+                    self.data[:, base:base + n].zero_()
+                else:
+                    self.data[:, base:base + n] = mel[:, src]
+
+    def append(self, mel: torch.Tensor) -> None:
+        length = mel.shape[-1]
+        if length == 0:
+            return
+
+        if length > self.capacity:
+            skip = length - self.capacity
+            self.advance(len(self))
+            self.offset = self.end = self.end + skip
+            self.dropped += skip
+            mel, length = mel[:, skip:], self.capacity
+
+        overflow = len(self) + length - self.capacity
+        if overflow > 0:
+            self.advance(overflow)
+            self.dropped += overflow
+
+        self._write(self.end, mel, length)
+        self.end += length
+
+    def advance(self, length: int) -> None:
+        """
+        将最旧的length帧释放, 之后不会再访问
+        """
+        length = max(0, min(length, len(self)))
+        if length == 0:
+            return
+        self._write(self.offset, None, length)
+        self.offset += length
+
+    def view(self, start: int, stop: int) -> torch.Tensor:
+        """
+        绝对帧序号[start, stop)的连续view, 超出end的部分为0
+        """
+        if start < self.offset or stop - start > self.capacity:
+            raise IndexError("frames [{}, {}) are not in the buffer".format(start, stop))
+        begin = start % self.capacity
+        return self.data[:, begin:begin + stop - start]
+
+    def window(self, length: int = N_FRAMES) -> torch.Tensor:
+        """
+        从offset开始、长度为length的连续view, 可以直接交给decode.decode
+        """
+        return self.view(self.offset, self.offset + length)
+
+
+class StreamingMel:
+    """
+    流式的log-mel谱计算, 与whisper的log_mel_spectrogram使用相同的STFT(中心对齐, 两端reflect padding)。
+    跨调用保留计算下一帧所需的样本尾部, 每次只输出窗口已经完整的新帧, 所以短于N_FFT的片段也不会被丢弃;
+    音频结束时调用flush()补上右侧的padding并输出剩余的帧。
+    log_mel_spectrogram以整段音频的最大值截断动态范围, 这里只能使用到目前为止的最大值,
+    在此之外输出与对拼接后的音频一次性调用log_mel_spectrogram相同。
+    """
+
+    def __init__(self, n_mels: int = N_MELS, device: Union[str, torch.device] = "cpu") -> None:
+        self.window = torch.hann_window(N_FFT).to(device)
+        self.filters = mel_filters(device, n_mels)
+        self.device = device
+        self.reset()
+
+    def reset(self) -> None:
+        self.samples: torch.Tensor = torch.zeros(0, device=self.device)
+        """(已padding的)样本中第frame帧开始的部分"""
+        self.started: bool = False
+        """左侧的reflect padding是否已经补上"""
+        self.received: int = 0
+        self.frame: int = 0
+        self.log_max: float = float("-inf")
+
+    def __call__(self, audio: Union[np.ndarray, torch.Tensor]) -> torch.Tensor:
+        return self.push(audio)
+
+    def push(self, audio: Union[np.ndarray, torch.Tensor]) -> torch.Tensor:
+        audio = torch.as_tensor(audio, dtype=torch.float32).to(self.device)
+        self.received += audio.shape[-1]
+        self.samples = torch.cat([self.samples, audio])
+
+        if not self.started:
+            if self.samples.shape[-1] <= N_FFT // 2:
+                return self._emit(0)
+            self.samples = torch.cat([self.samples[1:N_FFT // 2 + 1].flip(0), self.samples])
+            self.started = True
+
+        return self._emit(self._available())
+
+    def flush(self) -> torch.Tensor:
+        """
+        音频结束, 补上右侧的reflect padding并输出剩余的帧, 之后状态会被重置
+        """
+        if not self.started:
+            self.reset()
+            return self._emit(0)
+
+        pad = self.samples[-(N_FFT // 2 + 1):-1].flip(0)
+        self.samples = torch.cat([self.samples, pad])
+        mel = self._emit(self.received // HOP_LENGTH - self.frame)
+        self.reset()
+        return mel
+
+    def _available(self) -> int:
+        if self.samples.shape[-1] < N_FFT:
+            return 0
+        return (self.samples.shape[-1] - N_FFT) // HOP_LENGTH + 1
+
+    def _emit(self, n_frames: int) -> torch.Tensor:
+        if n_frames <= 0:
+            return torch.zeros((self.filters.shape[0], 0), device=self.device)
+
+        segment = self.samples[:(n_frames - 1) * HOP_LENGTH + N_FFT]
+        stft = torch.stft(segment, N_FFT, HOP_LENGTH, window=self.window, center=False, return_complex=True)
+        magnitudes = stft.abs() ** 2
+
+        mel_spec = self.filters @ magnitudes
+        log_spec = torch.clamp(mel_spec, min=1e-10).log10()
+        self.log_max = max(self.log_max, log_spec.max().item())
+        log_spec = torch.clamp(log_spec, min=self.log_max - 8.0)
+        log_spec = (log_spec + 4.0) / 4.0
+
+        self.samples = self.samples[n_frames * HOP_LENGTH:]
+        self.frame += n_frames
+        return log_spec
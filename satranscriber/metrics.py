@@ -0,0 +1,163 @@
+from typing import *
+import contextlib
+import dataclasses
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+STAGES = ("read", "mel", "encode", "decode", "parse", "translate")
+"""transcribe_step的各个阶段以及cli中的翻译"""
+
+DESCRIPTIONS = {
+    "steps_total":              "transcribe steps run",
+    "results_total":            "TranscribeResults emitted",
+    "interims_total":           "interim hypotheses emitted",
+    "quality_failures_total":   "decodes rejected by the quality thresholds",
+    "ladder_ups_total":         "retries with the next strategy of the decode ladder",
+    "rung_attempts_total":      "decodes with each strategy of the decode ladder",
+    "rung_accepted_total":      "decodes with each strategy that passed the quality thresholds",
+    "dropped_seconds_total":    "seconds of audio dropped without a result",
+    "overflow_seconds_total":   "seconds of audio dropped because the mel buffer was full",
+    "vad_skips_total":          "decodes skipped because the buffer held no speech",
+    "silence_seconds_total":    "seconds of silence dropped by the VAD without decoding",
+    "lag_actions_total":        "times each lag policy was started because decoding fell behind",
+    "skipped_seconds_total":    "seconds of audio skipped to catch up with real time",
+    "capture_overrun_seconds_total": "seconds of audio lost because the capture buffer of the audio stream was full",
+    "translate_errors_total":   "failed translations",
+    "buffer_seconds":           "seconds of audio in the mel buffer that have not been committed",
+    "lag_seconds":              "seconds of received audio that have not been decoded yet",
+    "degraded":                 "1 while decoding with the cheaper strategy of the degrade lag policy",
+    "startup_load_seconds":     "seconds spent loading the model",
+    "startup_warmup_seconds":   "seconds spent on the warmup decode",
+    "startup_first_result_seconds": "seconds from creating the transcriber to its first result",
+    "startup_degrade_load_seconds": "seconds spent loading the degrade model",
+    "startup_degrade_warmup_seconds": "seconds spent on the warmup decode of the degrade model",
+}
+
+LABELS = {
+    "rung_attempts_total":      "rung",
+    "rung_accepted_total":      "rung",
+    "lag_actions_total":        "policy",
+}
+"""带一个label的计数器以及label的名字"""
+
+
+@dataclasses.dataclass
+class StageStats:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    last: float = 0.0
+
+
+class Metrics:
+    """
+    Transcriber各阶段的耗时、计数器与当前状态。
+    每次转录之后以Metrics本身调用callbacks; render()输出Prometheus的文本格式, 由serve()在本地提供。
+    """
+
+    def __init__(self, namespace: str = "satranscriber") -> None:
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.stages: Dict[str, StageStats] = {name: StageStats() for name in STAGES}
+        self.counters: Dict[str, float] = {name: 0 for name in DESCRIPTIONS if name.endswith("_total") and name not in LABELS}
+        self.labeled: Dict[str, Dict[str, float]] = {name: dict() for name in LABELS}
+        self.gauges: Dict[str, float] = {name: 0.0 for name in DESCRIPTIONS if not name.endswith("_total")}
+        self.callbacks: List[Callable[["Metrics"], None]] = list()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - begin)
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self.lock:
+            stats = self.stages.setdefault(name, StageStats())
+            stats.count += 1
+            stats.total += seconds
+            stats.max = max(stats.max, seconds)
+            stats.last = seconds
+
+    def inc(self, name: str, value: float = 1, label: Optional[str] = None) -> None:
+        with self.lock:
+            if label is None:
+                self.counters[name] = self.counters.get(name, 0) + value
+            else:
+                counters = self.labeled.setdefault(name, dict())
+                counters[label] = counters.get(label, 0) + value
+
+    def set(self, name: str, value: float) -> None:
+        with self.lock:
+            self.gauges[name] = value
+
+    def add_callback(self, callback: Callable[["Metrics"], None]) -> None:
+        self.callbacks.append(callback)
+
+    def emit(self) -> None:
+        for callback in self.callbacks:
+            callback(self)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return dict(
+                stages={name: dataclasses.asdict(stats) for name, stats in self.stages.items()},
+                counters=dict(self.counters),
+                labeled={name: dict(values) for name, values in self.labeled.items()},
+                gauges=dict(self.gauges),
+            )
+
+    def render(self) -> str:
+        snapshot = self.snapshot()
+        lines = list()
+        name = "{}_stage_seconds".format(self.namespace)
+        lines.append("# HELP {} time spent in each stage".format(name))
+        lines.append("# TYPE {} summary".format(name))
+        for stage, stats in snapshot["stages"].items():
+            lines.append('{}_sum{{stage="{}"}} {}'.format(name, stage, stats["total"]))
+            lines.append('{}_count{{stage="{}"}} {}'.format(name, stage, stats["count"]))
+
+        for kind, values in (("counter", snapshot["counters"]), ("gauge", snapshot["gauges"])):
+            for key, value in values.items():
+                name = "{}_{}".format(self.namespace, key)
+                if key in DESCRIPTIONS:
+                    lines.append("# HELP {} {}".format(name, DESCRIPTIONS[key]))
+                lines.append("# TYPE {} {}".format(name, kind))
+                lines.append("{} {}".format(name, value))
+
+        for key, values in snapshot["labeled"].items():
+            name = "{}_{}".format(self.namespace, key)
+            if key in DESCRIPTIONS:
+                lines.append("# HELP {} {}".format(name, DESCRIPTIONS[key]))
+            lines.append("# TYPE {} counter".format(name))
+            for label, value in values.items():
+                lines.append('{}{{{}="{}"}} {}'.format(name, LABELS.get(key, "label"), label, value))
+        return "\n".join(lines) + "\n"
+
+
+def serve(metrics: Metrics, port: int = 9100, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    在后台线程中提供 http://host:port/metrics, 返回的server用shutdown()停止
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,317 @@
+"""
+录音文件的离线转录: 不经过实时的滑动窗口, 而是先在静音处把音频切成不超过30s的片段,
+把片段成批地交给同一个模型(batch解码), 或者分给多个各自载入模型的进程, 最后把结果合并到同一条绝对时间轴上。
+片段之间没有prompt, 所以可以以任意顺序、并行地转录。
+"""
+from typing import *
+import concurrent.futures
+import dataclasses
+import multiprocessing
+import os
+import time
+
+import torch
+import whisper
+from whisper.audio import HOP_LENGTH, N_FRAMES, N_MELS, SAMPLE_RATE
+from whisper.tokenizer import get_tokenizer
+
+from .audio import Stream
+from .ladder import Rung, RungStats, default_ladder, parse_rung
+from .mel import StreamingMel
+from .metrics import Metrics
+from .utils import decode, parse_result
+from .utils.model import default_device, inference_dtype, load_model, set_threads
+from .utils.parse_result import TranscribeResult
+from .vad import VoiceActivityDetector
+
+
+@dataclasses.dataclass
+class Chunk:
+    start: int
+    """第一帧的绝对序号"""
+    mel: torch.Tensor
+    """(n_mels, 不超过N_FRAMES)"""
+
+
+@dataclasses.dataclass
+class ChunkConfig:
+    """
+    转录片段所需的参数, 会被传给工作进程
+    """
+    task: str
+    language: str
+    rungs: List[Rung]
+    logprob_threshold: float
+    compression_ratio_threshold: float
+    no_speech_threshold: float
+    fp16: bool
+
+
+@dataclasses.dataclass
+class OfflineStats:
+    audio_seconds: float = 0.0
+    speech_seconds: float = 0.0
+    """切分后片段的总长度, 静音不会被转录"""
+    chunks: int = 0
+    skipped: int = 0
+    """所有策略都没有通过并且判断为没有语音而被跳过的片段数"""
+    mel_time: float = 0.0
+    transcribe_time: float = 0.0
+    rungs: Dict[str, RungStats] = dataclasses.field(default_factory=dict)
+
+    def throughput(self) -> float:
+        """
+        每秒处理的音频秒数
+        """
+        elapsed = self.mel_time + self.transcribe_time
+        return self.audio_seconds / elapsed if elapsed else 0.0
+
+
+def compute_mel(audio_stream: Stream, vad_threshold: float = 0.2) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    读取整个音频流, 返回mel和每一帧是否为语音。audio_stream应当已经打开, 并且不按实际时间读取
+    """
+    frontend, vad = StreamingMel(N_MELS), VoiceActivityDetector(vad_threshold)
+    mels, speech = list(), list()
+    while not audio_stream.exhausted:
+        audio = audio_stream.read()
+        mel = frontend(audio) if len(audio) else torch.zeros(N_MELS, 0)
+        if audio_stream.exhausted:
+            mel = torch.cat([mel, frontend.flush()], dim=-1)
+        mels.append(mel)
+        speech.append(vad(mel))
+    if not mels:
+        # 打开时就已经结束的音频流(例如空的wav)
+        return torch.zeros(N_MELS, 0), torch.zeros(0, dtype=torch.bool)
+    return torch.cat(mels, dim=-1), torch.cat(speech)
+
+
+def split_at_silences(speech: torch.Tensor, max_frames: int = N_FRAMES, margin: int = 30) -> List[Tuple[int, int]]:
+    """
+    把语音切成不超过max_frames帧的[start, end)区间: 在窗口内最后一个静音帧处切开, 整个窗口都是语音时才在max_frames处硬切。
+    区间不包含前后的静音, 但在语音之前保留margin帧(与VAD的hangover对应)
+    """
+    n_frames = len(speech)
+    spans, position = list(), 0
+    while True:
+        rest = speech[position:].nonzero()
+        if not len(rest):
+            return spans
+        first = position + int(rest[0])
+        start = max(position, first - margin)
+        if start + max_frames >= n_frames:
+            cut = n_frames
+        else:
+            # 只在第一个语音帧之后找静音, 保证每次都向前推进
+            silent = (~speech[first:start + max_frames]).nonzero()
+            cut = first + int(silent[-1]) if len(silent) else start + max_frames
+        voiced = speech[first:cut].nonzero()
+        spans.append((start, first + int(voiced[-1]) + 1))
+        position = cut
+
+
+def transcribe_chunks(model: whisper.Whisper, dtype: torch.dtype, chunks: List[Chunk], config: ChunkConfig) -> Tuple[List[TranscribeResult], Dict[str, RungStats], int]:
+    """
+    以batch解码chunks, 没有通过is_quality的片段换用下一级策略再一起解码;
+    所有策略都失败时与whisper.transcribe相同, 判断为没有语音则跳过, 否则保留最后一次的结果。
+    返回结果、每一级的统计以及跳过的片段数
+    """
+    tokenizer = get_tokenizer(model.is_multilingual, language=config.language, task=config.task)
+    input_stride = N_FRAMES // model.dims.n_audio_ctx
+    stats = {str(rung): RungStats() for rung in config.rungs}
+
+    def is_quality(result: whisper.DecodingResult) -> bool:
+        return result.avg_logprob > config.logprob_threshold and \
+            result.compression_ratio < config.compression_ratio_threshold and \
+            result.no_speech_prob < config.no_speech_threshold
+
+    decoded: Dict[int, whisper.DecodingResult] = dict()
+    pending = list(range(len(chunks)))
+    for rung in config.rungs:
+        if not pending:
+            break
+        options = whisper.DecodingOptions(task=config.task, language=config.language, fp16=config.fp16, **rung.options())
+        mel = torch.stack([whisper.pad_or_trim(chunks[i].mel, N_FRAMES) for i in pending])
+        begin = time.perf_counter()
+        results = decode.decode_batch(model, mel.to(model.device).to(dtype), options)
+        elapsed = time.perf_counter() - begin
+
+        failed = list()
+        for i, result in zip(pending, results):
+            accepted = is_quality(result)
+            stats[str(rung)].attempts += 1
+            stats[str(rung)].accepted += accepted
+            stats[str(rung)].decode_time += elapsed / len(pending)
+            decoded[i] = result
+            if not accepted:
+                failed.append(i)
+        pending = failed
+
+    transcribe_results, skipped, failed = list(), 0, set(pending)
+    for i, chunk in enumerate(chunks):
+        result = decoded[i]
+        if i in failed and result.no_speech_prob > config.no_speech_threshold:
+            skipped += 1
+            continue
+        # 片段在静音处结束, 没有结束timestamp的最后一句以片段的末尾作为结束
+        end_token = tokenizer.timestamp_begin + chunk.mel.shape[-1] // input_stride
+        results, unfinished = parse_result.parse_decode_result(result, tokenizer, chunk.start, input_stride, end_token)
+        transcribe_results.extend(results + ([unfinished] if unfinished else []))
+    return transcribe_results, stats, skipped
+
+
+_worker: Dict = dict()
+"""工作进程中的模型和dtype"""
+
+
+def init_worker(model: Union[str, Callable[[], whisper.Whisper]], device: str, fp16: bool, quantize: bool, model_dir: Optional[str], threads: Optional[int]) -> None:
+    set_threads(threads)
+    _worker["dtype"] = inference_dtype(device, fp16)
+    _worker["model"] = load_model(model, device, quantize, model_dir, dtype=_worker["dtype"]) if isinstance(model, str) else model()
+
+
+def transcribe_chunks_in_worker(chunks: List[Chunk], config: ChunkConfig) -> Tuple[List[TranscribeResult], Dict[str, RungStats], int]:
+    return transcribe_chunks(_worker["model"], _worker["dtype"], chunks, config)
+
+
+class OfflineTranscriber:
+    """
+    workers为0时在本进程中以batch_size个片段为一批解码; 大于0时启动workers个进程, 每个进程载入一份模型。
+    model可以是模型名、checkpoint路径、已经载入的模型(只能在workers为0时使用), 或者在每个进程中创建模型的函数
+    """
+
+    def __init__(
+        self,
+        model: Union[str, whisper.Whisper, Callable[[], whisper.Whisper]] = "medium",
+        task: str                                   = "transcribe",
+        language: str                               = "English",
+        temperature: Union[Tuple[float], float]     = (0, 0.2, 0.6),
+        beam_size: int                              = 10,
+        best_of: int                                = 10,
+        ladder: Optional[Sequence[Union[str, Rung]]] = None,
+        logprob_threshold: float                    = -1.0,
+        compression_ratio_threshold: float          = 2.4,
+        no_speech_threshold: float                  = 0.6,
+        vad_threshold: float                        = 0.2,
+        max_chunk: float                            = 30.0,
+        workers: int                                = 0,
+        batch_size: int                             = 8,
+        device: Optional[str]                       = None,
+        fp16: bool                                  = True,
+        threads: Optional[int]                      = None,
+        quantize: bool                              = False,
+        model_dir: Optional[str]                    = None,
+        verbose: bool                               = False,
+        **kwargs
+    ) -> None:
+        self.device = device or default_device()
+        self.dtype = inference_dtype(self.device, fp16)
+        temperatures = temperature if isinstance(temperature, Iterable) else [temperature]
+        rungs = [parse_rung(rung) if isinstance(rung, str) else rung for rung in ladder] \
+            if ladder else default_ladder(temperatures, beam_size, best_of)
+        self.config = ChunkConfig(
+            task, language, rungs, logprob_threshold, compression_ratio_threshold, no_speech_threshold,
+            self.dtype == torch.float16,
+        )
+        self.vad_threshold = vad_threshold
+        self.max_frames = min(N_FRAMES, int(max_chunk * SAMPLE_RATE / HOP_LENGTH))
+        self.workers = workers
+        self.batch_size = batch_size
+        self.verbose = verbose
+
+        self.model_spec = model
+        self.model: Optional[whisper.Whisper] = None
+        self.executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        if workers > 0:
+            if not isinstance(model, str) and hasattr(model, "decode"):
+                raise ValueError("workers need a model name, a checkpoint path or a function creating the model")
+            # 每个进程平分CPU核心, 避免多个进程的torch线程互相争抢
+            threads = threads or max(1, (os.cpu_count() or 1) // workers)
+            # fork会复制torch已经启动的线程池的状态, 使用spawn
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker, initargs=(model, self.device, fp16, quantize, model_dir, threads),
+            )
+            # 立即启动所有进程并载入模型, 与读取音频、计算mel重叠
+            self.started = [self.executor.submit(os.getpid) for _ in range(workers)]
+        else:
+            set_threads(threads)
+            if isinstance(model, str):
+                self.model = load_model(model, self.device, quantize, model_dir, dtype=self.dtype)
+            else:
+                self.model = model if hasattr(model, "decode") else model()
+        self.stats = OfflineStats()
+        self.metrics = Metrics()
+        """与Transcriber.metrics相同的名字: mel和decode阶段的耗时, 结果数以及每种解码策略的尝试和通过次数, 每批片段之后更新"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def wait_ready(self) -> None:
+        """
+        等待所有进程载入模型
+        """
+        if self.executor is not None:
+            concurrent.futures.wait(self.started)
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def transcribe(self, audio_stream: Stream) -> List[TranscribeResult]:
+        """
+        转录整个音频流, 返回按时间排序、segment_id依次编号的结果。
+        实时的音频流(麦克风, 或者没有max_speed的文件、stdin、socket)没有尽头或者只能以实时的速度读取, 不能离线转录
+        """
+        if audio_stream.realtime:
+            raise ValueError("offline transcription needs a file, stdin or socket stream read with max_speed, not a realtime stream")
+        stats = self.stats = OfflineStats(rungs={str(rung): RungStats() for rung in self.config.rungs})
+        begin = time.perf_counter()
+        with audio_stream:
+            mel, speech = compute_mel(audio_stream, self.vad_threshold)
+        chunks = [Chunk(start, mel[:, start:end]) for start, end in split_at_silences(speech, self.max_frames)]
+        stats.mel_time = time.perf_counter() - begin
+        self.metrics.observe("mel", stats.mel_time)
+        stats.audio_seconds = mel.shape[-1] * HOP_LENGTH / SAMPLE_RATE
+        stats.speech_seconds = sum(chunk.mel.shape[-1] for chunk in chunks) * HOP_LENGTH / SAMPLE_RATE
+        stats.chunks = len(chunks)
+        self.try_log("{:.1f}s of audio split into {} chunks with {:.1f}s of speech in {:.2f}s".format(
+            stats.audio_seconds, len(chunks), stats.speech_seconds, stats.mel_time))
+
+        begin = time.perf_counter()
+        # 有多个进程时减小batch, 让每个进程都分到片段
+        size = min(self.batch_size, -(-len(chunks) // self.workers)) if self.executor is not None else self.batch_size
+        batches = [chunks[i:i + size] for i in range(0, len(chunks), max(1, size))]
+        if self.executor is not None:
+            outputs = self.executor.map(transcribe_chunks_in_worker, batches, [self.config] * len(batches))
+        else:
+            outputs = (transcribe_chunks(self.model, self.dtype, batch, self.config) for batch in batches)
+
+        results = list()
+        for batch_results, rung_stats, skipped in outputs:
+            results.extend(batch_results)
+            stats.skipped += skipped
+            for rung, rung_stat in rung_stats.items():
+                total = stats.rungs[rung]
+                total.attempts += rung_stat.attempts
+                total.accepted += rung_stat.accepted
+                total.decode_time += rung_stat.decode_time
+                self.metrics.inc("rung_attempts_total", rung_stat.attempts, rung)
+                self.metrics.inc("rung_accepted_total", rung_stat.accepted, rung)
+                self.metrics.inc("quality_failures_total", rung_stat.attempts - rung_stat.accepted)
+            self.metrics.observe("decode", sum(rung_stat.decode_time for rung_stat in rung_stats.values()))
+            self.metrics.inc("results_total", len(batch_results))
+            self.metrics.emit()
+        stats.transcribe_time = time.perf_counter() - begin
+        self.try_log("transcribed in {:.2f}s, {:.1f}x realtime".format(stats.transcribe_time, stats.throughput()))
+
+        results.sort(key=lambda result: result.sposition)
+        return [dataclasses.replace(result, segment_id=i) for i, result in enumerate(results)]
+
+    def try_log(self, log: str) -> None:
+        if self.verbose:
+            print(log)
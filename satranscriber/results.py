@@ -0,0 +1,102 @@
+from typing import *
+import asyncio
+import queue
+import threading
+
+from .utils.parse_result import TranscribeResult
+
+
+FINISHED = object()
+"""转录线程退出时放入结果队列, 迭代器收到后结束"""
+
+
+class ResultQueue:
+    """
+    转录线程放入的结果, 由阻塞的迭代器、不阻塞的read()或者async for取出。
+    SimpleQueue不需要持有转录的锁, 读取不会等待模型。
+    async for不在executor中阻塞地get(被取消时线程仍会取走下一个结果), 而是等待put唤醒后以get_nowait取出。
+    转录线程异常退出时, 取完全部结果之后重新抛出它的异常
+    """
+
+    def __init__(self) -> None:
+        self.queue: "queue.SimpleQueue[TranscribeResult]" = queue.SimpleQueue()
+        self.error: Optional[BaseException] = None
+        self.lock = threading.Lock()
+        self.waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = list()
+
+    def put(self, result: TranscribeResult) -> None:
+        self.queue.put(result)
+        self.wake()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.error = error
+        self.queue.put(FINISHED)
+        self.wake()
+
+    def wake(self) -> None:
+        with self.lock:
+            waiters = list(self.waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # 事件循环已经关闭
+                pass
+
+    def finished(self) -> None:
+        """
+        取到FINISHED之后放回去留给其他的消费者, 转录线程异常退出时抛出它的异常
+        """
+        self.queue.put(FINISHED)
+        if self.error is not None:
+            raise self.error
+
+    def read(self) -> List[TranscribeResult]:
+        """
+        取出目前所有的结果, 不会阻塞
+        """
+        results = list()
+        while True:
+            try:
+                result = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if result is FINISHED:
+                if results:
+                    # 先返回已经取出的结果, 异常在下一次read时抛出
+                    self.queue.put(FINISHED)
+                else:
+                    self.finished()
+                break
+            results.append(result)
+        return results
+
+    def __iter__(self) -> Iterator[TranscribeResult]:
+        while True:
+            result = self.queue.get()
+            if result is FINISHED:
+                self.finished()
+                return
+            yield result
+
+    async def __aiter__(self) -> AsyncIterator[TranscribeResult]:
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self.lock:
+            self.waiters.append(waiter)
+        try:
+            while True:
+                event.clear()
+                while True:
+                    try:
+                        result = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if result is FINISHED:
+                        self.finished()
+                        return
+                    yield result
+                await event.wait()
+        finally:
+            with self.lock:
+                self.waiters.remove(waiter)
@@ -0,0 +1,108 @@
+from typing import *
+import contextlib
+import dataclasses
+import time
+
+
+@dataclasses.dataclass
+class SchedulerStats:
+    idle_time: float = 0.0
+    """等待音频的总时间"""
+    busy_time: float = 0.0
+    """转录的总时间"""
+    steps: int = 0
+    last_busy_time: float = 0.0
+
+    audio_wakeups: int = 0
+    """新音频足够而提前唤醒的次数"""
+    deadline_wakeups: int = 0
+    """到达deadline而唤醒的次数"""
+    retry_wakeups: int = 0
+    """转录失败后立即重试的次数"""
+
+    def utilization(self) -> float:
+        total = self.idle_time + self.busy_time
+        return self.busy_time / total if total > 0 else 0.0
+
+
+class Scheduler:
+    """
+    决定何时进行下一次转录, 代替固定的sleep(step)。
+
+    一次转录的延迟约为 等待时间 + 转录耗时, 所以deadline为上一次转录结束后 target_latency - 上一次的转录耗时。
+    新音频达到 target_latency - 上一次的转录耗时 时提前唤醒(音频来得比实时快时不必等到deadline),
+    到达deadline时只要新音频不少于min_new_audio就唤醒; 新音频少于min_new_audio时不会唤醒。
+    调大min_new_audio减少转录次数、提高吞吐量, 调小target_latency降低延迟。
+    """
+
+    def __init__(
+        self,
+        target_latency: float = 3.0,
+        min_new_audio: float = 0.5,
+        poll_interval: float = 0.05,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.target_latency = target_latency
+        self.min_new_audio = min_new_audio
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.sleep = sleep
+
+        self.scale: float = 1.0
+        self.stopped: bool = False
+        self.stats = SchedulerStats()
+
+    def latency(self) -> float:
+        return self.target_latency * self.scale
+
+    def wait(self, poll: Callable[[], float], retry: bool = False) -> str:
+        """
+        poll读取音频并返回自上一次转录以来新音频的秒数。返回唤醒原因
+        """
+        begin = self.clock()
+        try:
+            if retry:
+                self.stats.retry_wakeups += 1
+                return "retry"
+
+            budget = max(0.0, self.latency() - self.stats.last_busy_time)
+            min_new_audio = self.min_new_audio * self.scale
+            deadline = begin + budget
+            while not self.stopped:
+                new_audio = poll()
+                now = self.clock()
+                if new_audio >= max(budget, min_new_audio):
+                    self.stats.audio_wakeups += 1
+                    return "audio"
+                if now >= deadline and new_audio >= min_new_audio:
+                    self.stats.deadline_wakeups += 1
+                    return "deadline"
+                self.sleep(self.poll_interval if now >= deadline else min(self.poll_interval, deadline - now))
+            return "stop"
+        finally:
+            self.stats.idle_time += self.clock() - begin
+
+    @contextlib.contextmanager
+    def busy(self):
+        begin = self.clock()
+        try:
+            yield
+        finally:
+            elapsed = self.clock() - begin
+            self.stats.busy_time += elapsed
+            self.stats.last_busy_time = elapsed
+            self.stats.steps += 1
+
+    def backoff(self) -> bool:
+        """
+        转录失败后缩短等待, 太短时返回False
+        """
+        self.scale /= 2
+        return self.latency() > 0.1
+
+    def reset(self) -> None:
+        self.scale = 1.0
+
+    def stop(self) -> None:
+        self.stopped = True
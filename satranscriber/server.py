@@ -0,0 +1,506 @@
+"""
+常驻的转录服务: 一个进程持有模型(InferenceEngine), 多个客户端进程各自作为一个会话发送音频、接收结果。
+
+协议(Unix socket或TCP, 每条消息是一行JSON):
+    1. 客户端发送会话参数, 例如 {"language": "ja", "interim": true, "audio_sample_rate": 16000}
+    2. 服务端回复 {"type": "session", "session": 会话名}, 参数无效或会话已满时回复 {"type": "error", "message": ...} 并关闭连接
+    3. 之后客户端发送s16le裸PCM, 关闭写方向(shutdown(SHUT_WR))表示音频结束
+    4. 服务端发送 {"type": "result", ...TranscribeResult的字段}, 全部转录完之后发送 {"type": "finished", "stats": ...}
+
+    python -m satranscriber.server --model medium --address unix:/tmp/satranscriber.sock
+    python cli.py --server unix:/tmp/satranscriber.sock --audio speaker --language ja
+"""
+from typing import *
+import argparse
+import array
+import dataclasses
+import json
+import os
+import socket
+import threading
+import time
+
+import numpy as np
+from whisper.audio import N_FRAMES
+
+from . import choices
+from .audio import Stream, pcm
+from .audio.resample import QUALITY
+from .audio.socket import parse_address
+from .backpressure import Backpressure, parse_policy
+from .engine import InferenceEngine
+from .ladder import Rung, parse_rung
+from .metrics import Metrics
+from .results import ResultQueue
+from .transcriber import Transcriber
+from .utils.parse_result import TranscribeResult
+
+
+SESSION_OPTIONS = (
+    "task", "language", "temperature", "beam_size", "best_of", "ladder", "incremental", "interim",
+    "logprob_threshold", "compression_ratio_threshold", "no_speech_threshold", "padding",
+    "mel_capacity", "vad", "vad_threshold", "encoder_buckets", "lag_policies", "degrade_rung", "target_latency", "min_new_audio",
+)
+"""客户端可以为自己的会话设置的Transcriber参数, 模型和设备由服务端决定"""
+
+AUDIO_OPTIONS = ("audio_sample_rate", "audio_channels", "max_speed", "resample_quality")
+
+MAX_HEADER = 64 * 1024
+"""会话参数一行的最大字节数"""
+
+
+def check_number(name: str, value: Any, low: float, high: float, integer: bool = False) -> None:
+    if isinstance(value, bool) or not isinstance(value, int if integer else (int, float)) or not low <= value <= high:
+        raise ValueError("{} must be {} in [{:g}, {:g}], got {!r}".format(name, "an integer" if integer else "a number", low, high, value))
+
+
+def check_list(name: str, value: Any, max_length: int) -> None:
+    if not isinstance(value, list) or not 0 < len(value) <= max_length:
+        raise ValueError("{} must be a list of 1 to {} items, got {!r}".format(name, max_length, value))
+
+
+def check_options(options: Dict, max_mel_capacity: int, max_beam_size: int) -> None:
+    """
+    检查客户端发送的会话参数的类型和范围, 无效时抛出ValueError。
+    mel_capacity决定每个会话的内存, beam_size、best_of以及ladder中的候选数决定每次解码的batch, 由服务端限制上限
+    """
+    def check_rung(name: str, text: Any) -> Rung:
+        if not isinstance(text, str):
+            raise ValueError("{} must be a decode strategy string, got {!r}".format(name, text))
+        rung = parse_rung(text)
+        check_number(name + " temperature", rung.temperature, 0, 1)
+        for size in (rung.beam_size, rung.best_of):
+            if size is not None:
+                check_number(name + " candidates", size, 1, max_beam_size, integer=True)
+        return rung
+
+    for name, value in options.items():
+        if name == "task":
+            if value not in ("transcribe", "translate"):
+                raise ValueError("task must be transcribe or translate, got {!r}".format(value))
+        elif name == "language":
+            if value is not None and value not in choices.LANGUAGES:
+                raise ValueError("unknown language {!r}".format(value))
+        elif name in ("incremental", "interim", "vad", "max_speed"):
+            if not isinstance(value, bool):
+                raise ValueError("{} must be true or false, got {!r}".format(name, value))
+        elif name == "temperature":
+            temperatures = value if isinstance(value, list) else [value]
+            check_list(name, temperatures, 16)
+            for temperature in temperatures:
+                check_number(name, temperature, 0, 1)
+        elif name in ("beam_size", "best_of"):
+            check_number(name, value, 1, max_beam_size, integer=True)
+        elif name == "ladder":
+            if value is not None:
+                check_list(name, value, 16)
+                for text in value:
+                    check_rung(name, text)
+        elif name == "degrade_rung":
+            check_rung(name, value)
+        elif name == "lag_policies":
+            if value is not None:
+                check_list(name, value, 3)
+                if not all(isinstance(text, str) for text in value):
+                    raise ValueError("lag_policies must be action:seconds strings, got {!r}".format(value))
+                policies = [parse_policy(text) for text in value]
+                for policy in policies:
+                    check_number("lag policy threshold", policy.threshold, 0, 3600)
+                Backpressure(policies)
+        elif name == "encoder_buckets":
+            if value is not None:
+                check_list(name, value, 16)
+                for seconds in value:
+                    check_number(name, seconds, 1, 30)
+        elif name in ("logprob_threshold", "compression_ratio_threshold", "no_speech_threshold", "vad_threshold"):
+            check_number(name, value, -100, 100)
+        elif name == "padding":
+            check_number(name, value, 0, N_FRAMES, integer=True)
+        elif name == "mel_capacity":
+            check_number(name, value, N_FRAMES, max_mel_capacity, integer=True)
+        elif name in ("target_latency", "min_new_audio"):
+            check_number(name, value, 0, 30)
+        elif name == "audio_sample_rate":
+            check_number(name, value, 1000, 192000, integer=True)
+        elif name == "audio_channels":
+            check_number(name, value, 1, 32, integer=True)
+        elif name == "resample_quality":
+            if value not in QUALITY:
+                raise ValueError("unknown resample_quality {!r}, choose from {}".format(value, list(QUALITY)))
+
+
+def encode_message(message: Dict) -> bytes:
+    return (json.dumps(message, ensure_ascii=False) + "\n").encode()
+
+
+def encode_result(result: TranscribeResult) -> bytes:
+    message = {field.name: getattr(result, field.name) for field in dataclasses.fields(result)}
+    message["tokens"] = list(result.tokens)
+    return encode_message(dict(type="result", **message))
+
+
+def decode_result(message: Dict) -> TranscribeResult:
+    fields = {field.name for field in dataclasses.fields(TranscribeResult)}
+    result = {key: value for key, value in message.items() if key in fields}
+    result["tokens"] = array.array("i", result["tokens"])
+    return TranscribeResult(**result)
+
+
+class ConnectionStream(pcm.Stream):
+    """
+    服务端: 从客户端连接读取PCM, 客户端关闭写方向或断开即音频结束
+    """
+
+    def __init__(self, reader: BinaryIO, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.reader = reader
+
+    def recv(self, size: int) -> bytes:
+        try:
+            return self.reader.read1(size)
+        except ConnectionError:
+            return b""
+
+
+@dataclasses.dataclass
+class ServerStats:
+    sessions: int = 0
+    """已经接受的会话数"""
+    rejected: int = 0
+    """因为会话已满或参数无效被拒绝的连接数"""
+    failed: int = 0
+    """异常结束的会话数"""
+
+
+class Server:
+    """
+    在address上接受连接, 每个连接是一个会话: 一个读取连接的ConnectionStream和一个使用共同engine的Transcriber。
+    """
+
+    def __init__(
+        self,
+        engine: InferenceEngine,
+        address: str            = "unix:/tmp/satranscriber.sock",
+        max_sessions: int       = 16,
+        verbose: bool           = False,
+        header_timeout: float   = 10.0,
+        max_mel_capacity: int   = 4 * N_FRAMES,
+        max_beam_size: int      = 10,
+        **defaults
+    ) -> None:
+        """
+        defaults: 会话没有指定时使用的Transcriber参数
+        header_timeout: 连接之后等待会话参数的秒数, 超时的连接被关闭, 不会一直占用处理线程
+        max_mel_capacity, max_beam_size: 客户端可以设置的mel_capacity以及beam_size、best_of等候选数的上限
+        """
+        self.engine = engine
+        self.address = address
+        self.max_sessions = max_sessions
+        self.header_timeout = header_timeout
+        self.max_mel_capacity = max_mel_capacity
+        self.max_beam_size = max_beam_size
+        self.verbose = verbose
+        self.defaults = {key: value for key, value in defaults.items() if key in SESSION_OPTIONS}
+
+        self.lock = threading.Lock()
+        self.sessions: Dict[str, Transcriber] = dict()
+        self.connections: Set[socket.socket] = set()
+        self.active: int = 0
+        """已经接受、尚未结束的会话数, 在创建Transcriber之前就占用名额"""
+        self.stats = ServerStats()
+        self.is_exited = True
+
+    def __enter__(self):
+        family, address = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.unlink(address)
+        self.listener = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(address)
+        self.listener.listen()
+        self.is_exited = False
+        self.thread = threading.Thread(target=self.accept, name="accept", daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.is_exited = True
+        self.listener.close()
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        family, address = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.unlink(address)
+
+    def serve_forever(self) -> None:
+        self.thread.join()
+
+    def accept(self) -> None:
+        while not self.is_exited:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                if self.is_exited:
+                    return
+                raise
+            threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+
+    def handle(self, connection: socket.socket) -> None:
+        with self.lock:
+            self.connections.add(connection)
+        reader, writer = connection.makefile("rb"), connection.makefile("wb")
+        name, accepted = None, False
+        try:
+            invalid = None
+            try:
+                options = self.read_options(connection, reader)
+            except ValueError as e:
+                options, invalid = dict(), str(e)
+            except socket.timeout:
+                options, invalid = dict(), "timed out waiting for the session options"
+            with self.lock:
+                full = self.active >= self.max_sessions
+                accepted = not full and invalid is None
+                self.active += accepted
+                self.stats.rejected += not accepted
+            if not accepted:
+                message = invalid or "too many sessions"
+                writer.write(encode_message(dict(type="error", message=message)))
+                return
+
+            stream = ConnectionStream(reader, **{key: value for key, value in options.items() if key in AUDIO_OPTIONS})
+            transcriber = Transcriber(
+                audio_stream=stream, engine=self.engine,
+                **{**self.defaults, **{key: value for key, value in options.items() if key in SESSION_OPTIONS}},
+            )
+            with stream, transcriber:
+                name = transcriber.session.name
+                with self.lock:
+                    self.sessions[name] = transcriber
+                    self.stats.sessions += 1
+                self.try_log("{} started, {} sessions".format(name, self.active))
+                writer.write(encode_message(dict(type="session", session=name)))
+                writer.flush()
+                for result in transcriber:
+                    writer.write(encode_result(result))
+                    # 同一次转录的其他结果已经在队列中, 一起写出
+                    for result in transcriber.read():
+                        writer.write(encode_result(result))
+                    writer.flush()
+            writer.write(encode_message(dict(
+                type="finished",
+                stats=dict(session=dataclasses.asdict(transcriber.session.stats), metrics=transcriber.metrics.snapshot()),
+            )))
+        except Exception as e:
+            with self.lock:
+                self.stats.failed += 1
+            self.try_log("{} failed: {!r}".format(name or "connection", e))
+            try:
+                writer.write(encode_message(dict(type="error", message=repr(e))))
+            except OSError:
+                pass
+        finally:
+            with self.lock:
+                self.sessions.pop(name, None)
+                self.connections.discard(connection)
+                self.active -= accepted
+            try:
+                writer.close()
+            except OSError:
+                pass
+            reader.close()
+            connection.close()
+            self.try_log("{} closed".format(name or "connection"))
+
+    def read_options(self, connection: socket.socket, reader: BinaryIO) -> Dict:
+        """
+        在header_timeout秒内读取不超过MAX_HEADER字节的一行会话参数并检查, 无效时抛出ValueError
+        """
+        connection.settimeout(self.header_timeout)
+        line = reader.readline(MAX_HEADER + 1)
+        connection.settimeout(None)
+        if len(line) > MAX_HEADER:
+            raise ValueError("session options longer than {} bytes".format(MAX_HEADER))
+        options = json.loads(line or b"{}")
+        if not isinstance(options, dict):
+            raise ValueError("session options must be a JSON object")
+        unknown = set(options) - set(SESSION_OPTIONS) - set(AUDIO_OPTIONS)
+        if unknown:
+            raise ValueError("unknown options {}".format(sorted(unknown)))
+        check_options(options, self.max_mel_capacity, self.max_beam_size)
+        return options
+
+    def try_log(self, log: str) -> None:
+        if self.verbose:
+            print(log)
+
+
+class RemoteTranscriber:
+    """
+    客户端: 接口与Transcriber相同(with、迭代器、async for、read()、subscribe), 把audio_stream的音频发送给Server,
+    由服务端共用的模型转录。本进程不载入模型。
+    """
+
+    def __init__(
+        self,
+        audio_stream: Stream,
+        server: str                 = "unix:/tmp/satranscriber.sock",
+        on_result: Optional[Callable[[TranscribeResult], None]] = None,
+        poll_interval: float        = 0.05,
+        **kwargs
+    ) -> None:
+        """
+        kwargs中SESSION_OPTIONS以内的参数作为会话参数发送, 其余的忽略(例如cli的model、device)
+        """
+        self.audio_stream = audio_stream
+        self.address = server
+        self.options = {key: value for key, value in kwargs.items() if key in SESSION_OPTIONS and value is not None}
+        self.poll_interval = poll_interval
+        self.result_callbacks: List[Callable[[TranscribeResult], None]] = [on_result] if on_result is not None else []
+        self.metrics = Metrics()
+        """只记录本地的翻译等阶段, 转录的统计在服务端, 结束时由stats返回"""
+        self.created = time.perf_counter()
+        self.startup: Dict[str, float] = dict()
+
+    def __enter__(self):
+        self.is_exited = False
+        self.results = ResultQueue()
+        self.stats: Optional[Dict] = None
+        """服务端在会话结束时发送的统计"""
+        self.error: Optional[str] = None
+
+        family, address = parse_address(self.address)
+        self.connection = socket.socket(family, socket.SOCK_STREAM)
+        self.connection.connect(address)
+        self.reader = self.connection.makefile("rb")
+        # 音频固定以16000Hz单声道发送, 重采样已经在audio_stream中完成
+        options = dict(self.options, audio_sample_rate=Stream.SAMPLE_RATE, audio_channels=1, max_speed=not self.audio_stream.realtime)
+        self.connection.sendall(encode_message(options))
+        message = json.loads(self.reader.readline() or b'{"type": "error", "message": "connection closed"}')
+        if message["type"] != "session":
+            self.connection.close()
+            raise RuntimeError("server refused the session: {}".format(message.get("message")))
+        self.session = message["session"]
+        self.startup["connect"] = time.perf_counter() - self.created
+
+        self.send_thread = threading.Thread(target=self.send, daemon=True)
+        self.receive_thread = threading.Thread(target=self.receive, daemon=True)
+        self.send_thread.start()
+        self.receive_thread.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.is_exited = True
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.receive_thread.join(timeout=1)
+        self.reader.close()
+        self.connection.close()
+
+    def send(self) -> None:
+        try:
+            while not self.is_exited:
+                audio = self.audio_stream.read()
+                if len(audio):
+                    self.connection.sendall((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+                if self.audio_stream.exhausted:
+                    self.connection.shutdown(socket.SHUT_WR)
+                    return
+                if not len(audio):
+                    time.sleep(self.poll_interval)
+        except OSError:
+            if not self.is_exited:
+                raise
+
+    def receive(self) -> None:
+        """
+        服务端发送的error、连接异常或者没有收到finished就断开时, 迭代器和read()取完结果之后抛出RuntimeError
+        """
+        error: Optional[BaseException] = None
+        try:
+            for line in self.reader:
+                message = json.loads(line)
+                if message["type"] == "result":
+                    self.publish(decode_result(message))
+                elif message["type"] == "finished":
+                    self.stats = message["stats"]
+                elif message["type"] == "error":
+                    self.error = message["message"]
+        except (OSError, ValueError) as e:
+            if not self.is_exited:
+                error = e
+        finally:
+            if self.error is not None:
+                error = RuntimeError("session {} failed on the server: {}".format(self.session, self.error))
+            elif error is None and self.stats is None and not self.is_exited:
+                error = RuntimeError("session {} closed by the server before it finished".format(self.session))
+            self.results.finish(error)
+
+    def subscribe(self, callback: Callable[[TranscribeResult], None]) -> None:
+        self.result_callbacks.append(callback)
+
+    def publish(self, result: TranscribeResult) -> None:
+        if "first_result" not in self.startup:
+            self.startup["first_result"] = time.perf_counter() - self.created
+        self.results.put(result)
+        for callback in self.result_callbacks:
+            callback(result)
+
+    def is_finished(self) -> bool:
+        return not self.receive_thread.is_alive()
+
+    def read(self) -> List[TranscribeResult]:
+        """
+        取出目前所有的结果, 不会阻塞
+        """
+        return self.results.read()
+
+    def __iter__(self) -> Iterator[TranscribeResult]:
+        return iter(self.results)
+
+    def __aiter__(self) -> AsyncIterator[TranscribeResult]:
+        return self.results.__aiter__()
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--address", type=str, default="unix:/tmp/satranscriber.sock", help="host:port or unix:/path to listen on")
+    parser.add_argument("--max_sessions", type=int, default=16, help="connections beyond this number are refused")
+    parser.add_argument("--verbose", type=bool, default=False)
+    parser.add_argument("--header_timeout", type=float, default=10.0, help="seconds to wait for the session options of a new connection")
+    parser.add_argument("--max_mel_capacity", type=int, default=4 * 3000, help="largest mel_capacity (frames) a session can ask for")
+    parser.add_argument("--max_beam_size", type=int, default=10, help="largest beam_size / best_of a session can ask for, also for the ladder")
+    parser.add_argument("--model", default="medium", choices=choices.MODELS, help="name of the Whisper model to use")
+    parser.add_argument("--device", type=str, default=None, help="device to run the model on, cuda if available and cpu otherwise by default")
+    parser.add_argument("--fp16", type=bool, default=True, help="whether to perform inference in fp16; True by default, always False on cpu")
+    parser.add_argument("--threads", type=int, default=None, help="number of torch intra-op threads")
+    parser.add_argument("--interop_threads", type=int, default=None, help="number of torch inter-op threads")
+    parser.add_argument("--quantize", type=bool, default=False, help="run the Linear layers with int8 dynamic quantization, cpu only")
+    parser.add_argument("--max_batch", type=int, default=8, help="maximum number of sessions decoded in one batch")
+    parser.add_argument("--max_wait", type=float, default=0.01, help="seconds to wait for more requests to fill a batch")
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+    engine = InferenceEngine(
+        args.model, args.device, args.fp16, args.threads, args.interop_threads, args.quantize,
+        max_batch=args.max_batch, max_wait=args.max_wait,
+    )
+    with engine, Server(
+        engine, args.address, args.max_sessions, args.verbose,
+        args.header_timeout, args.max_mel_capacity, args.max_beam_size,
+    ) as server:
+        print("serving {} on {}".format(args.model, args.address))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
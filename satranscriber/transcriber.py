@@ -2,23 +2,36 @@ from typing import *
 import torch
 import threading
 import time
+import dataclasses
+import array
 
 import whisper
-from whisper.audio import N_FRAMES, N_MELS, N_FFT
-from whisper.audio import log_mel_spectrogram
+from whisper.audio import N_FRAMES, N_MELS, HOP_LENGTH, SAMPLE_RATE
 from whisper.tokenizer import get_tokenizer, Tokenizer
 
 from .audio import Stream
+from .backpressure import Backpressure, LagPolicy, parse_policy
+from .cache import EncoderCache
+from .engine import InferenceEngine, Session
+from .ladder import DecodeLadder, Rung, default_ladder, parse_rung
+from .mel import MelBuffer, StreamingMel
+from .metrics import Metrics
+from .results import FINISHED, ResultQueue
+from .scheduler import Scheduler
+from .vad import VoiceActivityDetector
 from .utils import decode, parse_result
+from .utils.model import default_device, inference_dtype, load_model, set_threads
 from .utils.parse_result import TranscribeResult
 
+
 class Transcriber:
     NON_TRANSABLE_LENGTH = 200
 
     def __init__(
         self,
         audio_stream: Stream,
-        model: str                                  = "medium",
+        model: Union[str, whisper.Whisper]          = "medium",
+        engine: Optional[InferenceEngine]           = None,
         task: str                                   = "transcribe",
 
         # transcriber arguments
@@ -26,19 +39,61 @@ class Transcriber:
         temperature: Union[Tuple[float], float]     = (0, 0.2, 0.6),
         beam_size: int                              = 10,
         best_of: int                                = 10,
+        ladder: Optional[Sequence[Union[str, Rung]]] = None,
+        incremental: bool                           = False,
+        interim: bool                               = False,
         
         # decode arguments 
         logprob_threshold: float				    = -1.0,
         compression_ratio_threshold: float          = 2.4,
         no_speech_threshold: float				    = 0.6,
         padding: int 							    = 200,
-
+        mel_capacity: int                           = 2 * N_FRAMES,
+        vad: bool                                   = False,
+        vad_threshold: float                        = 0.2,
+        encoder_buckets: Optional[Sequence[float]]  = None,
+
+        # backpressure arguments
+        lag_policies: Optional[Sequence[Union[str, LagPolicy]]] = None,
+        degrade_rung: Union[str, Rung]              = "greedy",
+        degrade_model: Optional[Union[str, whisper.Whisper]] = None,
+
+        # scheduler arguments
+        target_latency: float                       = 3.0,
+        min_new_audio: float                        = 0.5,
+        clock: Callable[[], float]                  = time.monotonic,
+        sleep: Callable[[float], None]              = time.sleep,
+        on_metrics: Optional[Callable[[Metrics], None]] = None,
+        on_result: Optional[Callable[[TranscribeResult], None]] = None,
+
+        # inference arguments
+        device: Optional[str]                       = None,
         fp16: bool                                  = True,
+        threads: Optional[int]                      = None,
+        interop_threads: Optional[int]              = None,
+        quantize: bool                              = False,
+        model_dir: Optional[str]                    = None,
+        mmap: bool                                  = True,
+        background_load: bool                       = False,
+        warmup: bool                                = False,
         verbose: bool                               = False,
         **kwargs
     ) -> None:
 
-        self.model: whisper.Whisper = whisper.load_model(model, "cuda")
+        self.created = time.perf_counter()
+        self.startup: Dict[str, float] = dict()
+        """启动各阶段的秒数: load, warmup, degrade_model的degrade_load和degrade_warmup, 以及从创建到第一个结果的first_result"""
+        self._model: Optional[whisper.Whisper] = None
+        self.model_ready = threading.Event()
+        self.model_error: Optional[BaseException] = None
+
+        self.engine = engine
+        if engine is not None:
+            self.device, self.dtype = engine.device, engine.dtype
+        else:
+            self.device = device or default_device()
+            self.dtype = inference_dtype(self.device, fp16)
+            set_threads(threads, interop_threads)
         self.audio_stream = audio_stream
         self.task = task
 
@@ -46,32 +101,174 @@ class Transcriber:
         self.temperature_list = temperature if isinstance(temperature, Iterable) else [temperature]
         self.beam_size = beam_size
         self.best_of = best_of
+        self.rungs: List[Rung] = [parse_rung(rung) if isinstance(rung, str) else rung for rung in ladder] \
+            if ladder else default_ladder(self.temperature_list, beam_size, best_of)
+        """解码策略, 依次尝试直到结果通过is_quality; 没有指定ladder时由temperature、beam_size和best_of得到"""
+        self.incremental = incremental
+        self.interim = interim
         
         self.logprob_threshold = logprob_threshold
         self.compression_ratio_threshold = compression_ratio_threshold
         self.no_speech_threshold = no_speech_threshold
         self.padding = padding
+        self.mel_capacity = mel_capacity
+        self.use_vad = vad
+        self.vad_threshold = vad_threshold
+        self.encoder_buckets = encoder_buckets
+        """为None时编码器总是运行在30s的输入上, 否则运行在能容纳buffer的最短的bucket(秒)上"""
+
+        self.lag_policies: List[LagPolicy] = [parse_policy(policy) if isinstance(policy, str) else policy for policy in lag_policies or []]
+        """转录落后于实时音频时依次启用的policies, 为空时只有mel_buffer溢出才会丢弃音频"""
+        self.degrade_rung = parse_rung(degrade_rung) if isinstance(degrade_rung, str) else degrade_rung
+        if degrade_model is not None and engine is not None:
+            raise ValueError("degrade_model can not be used with a shared engine")
+        self.degrade_model = degrade_model
+        """degrade时代替model的更小的模型, 模型名在载入model之后以相同的参数载入"""
+        self.load_options = (quantize, model_dir, mmap)
+        self.use_warmup = warmup
+
+        self.target_latency = target_latency
+        self.min_new_audio = min_new_audio
+        self.clock = clock
+        self.sleep = sleep
+
+        self.metrics = Metrics()
+        """各阶段耗时与计数器, 每次转录之后调用on_metrics"""
+        if on_metrics is not None:
+            self.metrics.add_callback(on_metrics)
+        self.result_callbacks: List[Callable[[TranscribeResult], None]] = [on_result] if on_result is not None else []
 
-        self.dtype = torch.float16 if fp16 else torch.float32
         self.verbose = verbose
 
+        if engine is not None:
+            self.set_model(engine.model)
+        elif not isinstance(model, str):
+            self.set_model(model)
+        else:
+            load = lambda: self.load(model, quantize, model_dir, mmap, warmup)
+            if background_load:
+                # 模型在后台载入, 同时音频已经开始进入buffer, 载入完成后从buffer中的音频开始转录
+                threading.Thread(target=load, name="load_model", daemon=True).start()
+            else:
+                load()
+                if self.model_error is not None:
+                    raise self.model_error
+
+    def load(self, name: str, quantize: bool, model_dir: Optional[str], mmap: bool, warmup: bool) -> None:
+        try:
+            begin = time.perf_counter()
+            model = load_model(name, self.device, quantize, model_dir, mmap, self.dtype)
+            self.record_startup("load", time.perf_counter() - begin)
+            if warmup:
+                begin = time.perf_counter()
+                self.warmup(model)
+                self.record_startup("warmup", time.perf_counter() - begin)
+            self.set_model(model)
+        except BaseException as e:
+            self.model_error = e
+            self.model_ready.set()
+
+    @torch.no_grad()
+    def warmup(self, model: whisper.Whisper) -> None:
+        """
+        以静音完整地编码、解码一次, 让第一次真正的转录不用承担kernel选择、内存分配等一次性的开销
+        """
+        mel = torch.zeros(N_MELS, N_FRAMES)
+        features = decode.encode(model, mel, self.dtype)
+        decode.decode_features(
+            model, features, task=self.task, language=self.language,
+            fp16=self.dtype == torch.float16, sample_len=8, **self.rungs[0].options(),
+        )
+
+    def set_model(self, model: whisper.Whisper) -> None:
         from whisper.utils import exact_div
+        if self.degrade_model is not None:
+            self.prepare_degrade_model(model)
+        self._model = model
         self.input_stride = exact_div(
-            N_FRAMES, self.model.dims.n_audio_ctx
+            N_FRAMES, model.dims.n_audio_ctx
         )
+        self.model_ready.set()
+
+    def prepare_degrade_model(self, model: whisper.Whisper) -> None:
+        """
+        degrade_model在落后于实时时才第一次使用, 所以与model一样载入并预热, 不在那时承担冷启动的开销
+        """
+        if isinstance(self.degrade_model, str):
+            begin = time.perf_counter()
+            self.degrade_model = load_model(self.degrade_model, self.device, *self.load_options, dtype=self.dtype)
+            self.record_startup("degrade_load", time.perf_counter() - begin)
+        if self.degrade_model.is_multilingual != model.is_multilingual:
+            raise ValueError("degrade_model must use the same tokenizer as model, both multilingual or both English-only")
+        if self.use_warmup:
+            begin = time.perf_counter()
+            self.warmup(self.degrade_model)
+            self.record_startup("degrade_warmup", time.perf_counter() - begin)
+
+    @property
+    def model(self) -> whisper.Whisper:
+        """
+        后台载入时等待载入完成, 载入失败时抛出载入时的异常
+        """
+        self.model_ready.wait()
+        if self.model_error is not None:
+            raise self.model_error
+        return self._model
+
+    def record_startup(self, phase: str, seconds: float) -> None:
+        self.startup[phase] = seconds
+        self.metrics.set("startup_{}_seconds".format(phase), seconds)
+        self.try_log("startup {} took {:.2f}s".format(phase, seconds))
     
     def __enter__(self):
         self.lock = threading.RLock()
         self.is_exited = False
         self.try_read = False
-
-        self.temperature_idx = 0
-
-        self.mel_offset: int = 0
-        self.mel_buffer: torch.Tensor = torch.zeros((N_MELS, 0))
+        self.session: Optional[Session] = self.engine.register() if self.engine is not None else None
+
+        self.ladder = DecodeLadder(self.rungs)
+        self.full_ladder = self.ladder
+        self.degraded_ladder = DecodeLadder([self.degrade_rung])
+        self.backpressure = Backpressure(self.lag_policies) if self.lag_policies else None
+        self.overruns: int = 0
+        """已经计入metrics的音频流overruns(采样点)"""
+
+        self.mel_buffer = MelBuffer(self.mel_capacity, N_MELS)
+        self.mel_frontend = StreamingMel(N_MELS)
+        self.decoded_end: int = 0
+        """上一次转录的窗口的结束位置"""
+        self.audio_finished: bool = False
+        """音频流已经结束, 全部音频都已经进入mel_buffer"""
+        self.dropped_frames: int = 0
+        """没有得到转录结果就被丢弃的帧数, 不包括VAD跳过的静音和mel_buffer溢出的帧"""
+
+        self.scheduler = Scheduler(self.target_latency, self.min_new_audio, clock=self.clock, sleep=self.sleep)
+        self.encoder_cache = EncoderCache()
+
+        self.vad = VoiceActivityDetector(self.vad_threshold) if self.use_vad or any(policy.action == "silence" for policy in self.lag_policies) else None
+        self.speech_start: Optional[int] = None
+        """buffer中第一个语音帧的绝对序号, 没有语音时为None"""
+        self.speech_end: int = 0
+        """最后一个语音帧之后的绝对序号"""
+        self.vad_hits: int = 0
+        self.vad_skips: int = 0
+        self.vad_trimmed: int = 0
 
         self.decode_result: whisper.DecodingResult = None
-        self.output_buffer: List[TranscribeResult] = list()
+        self.results = ResultQueue()
+        """已经稳定的结果, 由read()和迭代器取出, 读取不会等待模型"""
+        self.next_segment_id: int = 0
+        self.interim_end: int = 0
+        """已经发布的临时结果的segment_id都小于interim_end"""
+        self.revisions: Dict[int, int] = dict()
+        """每个临时结果已经发布的次数"""
+
+        self.prefix_tokens: List[int] = list()
+        """上一次转录中尚未输出的完整句子的tokens(timestamp相对于当前的mel_offset), incremental模式下强制作为前缀"""
+        self.prompt_tokens: List[int] = list()
+        """已经输出的文本tokens, incremental模式下作为prompt"""
+        self.saved_forward_passes: int = 0
+        self.total_saved_forward_passes: int = 0
 
         self.transcribe_thread = threading.Thread(target=self.transcribe)
         self.transcribe_thread.start()
@@ -79,51 +276,122 @@ class Transcriber:
     
     def __exit__(self, type, value, traceback):
         self.is_exited = True
+        self.scheduler.stop()
         self.try_log("EXIT!!!")
-        if self.transcribe_thread.isAlive():
+        if self.transcribe_thread.is_alive():
             self.transcribe_thread.join(timeout=1)
+        if self.session is not None:
+            self.session.close()
 
     def temperature(self) -> float:
-        return self.temperature_list[self.temperature_idx]
+        return self.ladder.rung.temperature
     
-    def try_temperature_up(self) -> bool:
+    def try_ladder_up(self) -> bool:
         """
-        升温。在一般情况加不应该使温度降低, 除非转录的音频发生变化。
-        所以没有相应的try_temperature_down方法, 而是在extend_offset的同时使温度置0
+        换用ladder的下一级策略。在一般情况下不应该换回更便宜的策略, 除非转录的音频发生变化。
+        所以没有相应的down方法, 而是在窗口前移的同时回到第一级
         """
-        if self.temperature_idx + 1 < len(self.temperature_list):
-            self.temperature_idx += 1
+        if self.ladder.up():
+            self.metrics.inc("ladder_ups_total")
             return True
         return False
 
+    @property
+    def mel_offset(self) -> int:
+        return self.mel_buffer.offset
+
     def extend_mel(self, mel):
-        self.mel_buffer = torch.cat([self.mel_buffer, mel], dim=1)
+        dropped, offset = self.mel_buffer.dropped, self.mel_offset
+        self.mel_buffer.append(mel)
+        if self.mel_buffer.dropped > dropped:
+            self.try_log("mel buffer full, drop {} frames".format(self.mel_buffer.dropped - dropped))
+            self.metrics.inc("overflow_seconds_total", (self.mel_buffer.dropped - dropped) * HOP_LENGTH / SAMPLE_RATE)
+        if self.mel_offset > offset:
+            # 溢出时offset没有经过extend_offset前移
+            self.offset_advanced(self.mel_offset - offset)
+
+        if self.vad is not None:
+            speech = self.vad(mel).nonzero()
+            if len(speech):
+                begin = self.mel_buffer.end - mel.shape[-1]
+                if self.speech_start is None:
+                    self.speech_start = begin + int(speech[0])
+                self.speech_end = begin + int(speech[-1]) + 1
 
     def extend_offset(self, offset):
         """
         将最旧的offset位mel谱设置为不会再访问
         """
-        self.mel_offset += offset
-        self.mel_buffer = self.mel_buffer[:, offset:]
+        previous = self.mel_offset
+        self.mel_buffer.advance(offset)
+        self.offset_advanced(self.mel_offset - previous)
+
+    def offset_advanced(self, offset: int) -> None:
+        """
+        mel_offset前移了offset帧之后, 使依赖于offset的状态保持一致:
+        编码器缓存, buffer中第一个语音帧的位置, 以及以mel_offset为起点的prefix的timestamp
+        """
+        self.encoder_cache.evict(self.mel_offset)
+        if self.speech_start is not None and self.speech_start < self.mel_offset:
+            self.speech_start = self.mel_offset if self.speech_end > self.mel_offset else None
+        if self.prefix_tokens:
+            shifted = None
+            if offset % self.input_stride == 0:
+                shifted = parse_result.shift_timestamps(
+                    self.prefix_tokens, offset // self.input_stride, self.tokenizer().timestamp_begin)
+            self.prefix_tokens = shifted or []
     
+    def drop(self, length: int, reason: str) -> None:
+        """
+        丢弃最旧的length帧, 与extend_offset不同的是这些帧没有得到转录结果
+        """
+        length = min(length, len(self.mel_buffer))
+        self.try_log("{}, drop {} frames".format(reason, length))
+        self.dropped_frames += length
+        self.retract_interims()
+        self.metrics.inc("dropped_seconds_total", length * HOP_LENGTH / SAMPLE_RATE)
+        self.extend_offset(length)
+
+    def is_finished(self) -> bool:
+        """
+        音频流已经结束并且全部音频都已经转录
+        """
+        return self.audio_finished and len(self.mel_buffer) == 0
+
     def buffer_len(self) -> int:
         """
         可运算的buffer长度
         """
-        return min(N_FRAMES, self.mel_buffer.shape[-1])
+        return min(N_FRAMES, len(self.mel_buffer))
 
     def audio_end_position(self) -> int:
         return self.mel_offset + self.buffer_len()
     
     def decode_options(self) -> Dict:
-        return dict(
+        options = dict(
             task        = self.task,
             language    = self.language,
-            beam_size   = self.beam_size if self.temperature() == 0 else None,
-            best_of     = None if self.temperature() == 0 else self.best_of,
-            temperature = self.temperature(),
             fp16        = True if self.dtype == torch.float16 else False,
+            **self.ladder.rung.options(),
         )
+        if self.incremental:
+            options.update(self.incremental_options())
+        return options
+
+    def incremental_options(self) -> Dict:
+        """
+        已经输出的文本作为prompt; 上一次转录得到的、尚未稳定的完整句子作为prefix, 解码器只需要对新的语音做beam search。
+        换用下一级策略重试时不使用prefix。prompt + prefix + 采样长度(n_text_ctx // 2)不能超过n_text_ctx
+        """
+        n_text_ctx = self.model.dims.n_text_ctx
+        options = dict()
+        prefix = self.prefix_tokens[:n_text_ctx // 4] if self.ladder.index == 0 else []
+        if prefix:
+            options.update(prefix=prefix, max_initial_timestamp=None)
+        prompt_len = n_text_ctx // 2 - len(self.tokenizer().sot_sequence) - 1 - len(prefix)
+        if self.prompt_tokens and prompt_len > 0:
+            options.update(prompt=self.prompt_tokens[-prompt_len:])
+        return options
 
     def tokenizer(self) -> Tokenizer:
         return get_tokenizer(
@@ -137,85 +405,364 @@ class Transcriber:
             result.compression_ratio < self.compression_ratio_threshold and \
             result.no_speech_prob < self.no_speech_threshold
     
+    def window_is_final(self) -> bool:
+        """
+        窗口中的内容不会再增加: 窗口已满, 或者音频已经结束
+        """
+        return len(self.mel_buffer) >= N_FRAMES or self.audio_finished
+
     def is_stable(self, result: TranscribeResult) -> bool:
-        return result.tposition + self.padding < self.audio_end_position()
+        return self.window_is_final() or result.tposition + self.padding < self.audio_end_position()
 
 
 
 
 
-    def transcribe_step(self) -> bool:
-        self.read_audio_step()
-
-        decode_result = decode.decode(self.model, self.mel_buffer, self.dtype, **self.decode_options())
+    def transcribe_step(self, read_audio: bool = True) -> bool:
+        """
+        read_audio为False时不读取新的音频, 换用下一级策略重试时保持窗口不变以便使用编码器缓存
+        """
+        if read_audio:
+            self.read_audio_step()
+            if self.backpressure is not None:
+                self.apply_backpressure()
+        self.decoded_end = self.audio_end_position()
 
-        self.try_log("is quality? {}".format(self.is_quality(decode_result)))
-        self.try_log(decode_result)
+        if (self.use_vad or self.lagging("silence")) and not self.voice_activity_gate():
+            return True
 
-        if not self.is_quality(decode_result):
+        options = self.decode_options()
+        begin = self.clock()
+        decode_result = self.decode(self.mel_buffer.window(), options)
+        decode_time = self.clock() - begin
+
+        prefix = options.get("prefix") or []
+        if prefix:
+            decode_result = dataclasses.replace(decode_result, tokens=prefix + decode_result.tokens)
+        self.saved_forward_passes = len(prefix)
+        self.total_saved_forward_passes += len(prefix)
+
+        rung, accepted = str(self.ladder.rung), self.is_quality(decode_result)
+        self.ladder.record(accepted, decode_time)
+        self.metrics.inc("rung_attempts_total", label=rung)
+        self.metrics.inc("rung_accepted_total", accepted, label=rung)
+        self.try_log("decoded {} tokens with {}, avg_logprob {:.2f}, compression_ratio {:.2f}, no_speech_prob {:.2f}, is quality? {}".format(
+            len(decode_result.tokens), rung, decode_result.avg_logprob,
+            decode_result.compression_ratio, decode_result.no_speech_prob, accepted))
+        if self.incremental:
+            self.try_log("forced {} prefix tokens, {} decoder forward passes saved in total".format(
+                self.saved_forward_passes, self.total_saved_forward_passes))
+
+        if not accepted:
+            self.metrics.inc("quality_failures_total")
+            self.prefix_tokens = []
             return False
 
-        results = parse_result.split_decode_result(decode_result, self.tokenizer())
-        results = parse_result.to_transcribe_results(results, self.mel_offset, self.input_stride)
-        results = [result for result in results if self.is_stable(result)]
+        tokenizer = self.tokenizer()
+        # interim模式下以窗口末尾的时间作为没有结束的最后一句的结束时间
+        end_token = tokenizer.timestamp_begin + self.buffer_len() // self.input_stride if self.interim else None
+        with self.metrics.stage("parse"):
+            results, unfinished = parse_result.parse_decode_result(decode_result, tokenizer, self.mel_offset, self.input_stride, end_token)
+        stable_results = [result for result in results if self.is_stable(result)]
+        if self.interim:
+            interim_results = [result for result in results if not self.is_stable(result)] + ([unfinished] if unfinished else [])
+
+        if self.incremental:
+            unstable_results = [result for result in results if not self.is_stable(result)]
+            self.prefix_tokens = [token for result in unstable_results[:-1] for token in result.tokens]
+            self.prompt_tokens.extend(token for result in stable_results for token in result.tokens if token < tokenizer.eot)
+            del self.prompt_tokens[:-(self.model.dims.n_text_ctx // 2)]
+
+        final = self.window_is_final()
+        last_window = self.audio_finished and len(self.mel_buffer) <= N_FRAMES
+
+        if len(stable_results):
+            self.publish(self.finalize(stable_results))
+            self.extend_offset(stable_results[-1].tposition - self.mel_offset)
+
+        if last_window or (final and not stable_results):
+            # 窗口不会再变化, 剩下的部分已经无法得到完整的句子
+            self.drop(self.buffer_len(), "window is final")
+        elif self.interim:
+            self.publish_interims(interim_results)
 
-        if len(results):
-            self.output_buffer.extend(results)
-            self.extend_offset(results[-1].tposition - self.mel_offset)
+        return True
 
+    def finalize(self, results: List[TranscribeResult]) -> List[TranscribeResult]:
+        """
+        按输出顺序分配segment_id, 替代之前相同segment_id的临时结果
+        """
+        finals = list()
+        for result in results:
+            segment_id = self.next_segment_id
+            self.next_segment_id += 1
+            finals.append(dataclasses.replace(result, segment_id=segment_id, revision=self.revisions.pop(segment_id, -1) + 1, final=True))
+        self.interim_end = max(self.interim_end, self.next_segment_id)
+        return finals
+
+    def publish_interims(self, results: List[TranscribeResult]) -> None:
+        """
+        未稳定的结果作为临时结果发布, segment_id紧接在已经输出的结果之后; 比上一次少的segment被撤回
+        """
+        interims = list()
+        for i, result in enumerate(results):
+            segment_id = self.next_segment_id + i
+            self.revisions[segment_id] = self.revisions.get(segment_id, -1) + 1
+            interims.append(dataclasses.replace(result, segment_id=segment_id, revision=self.revisions[segment_id], final=False))
+        self.retract_interims(self.next_segment_id + len(results))
+        if interims:
+            self.metrics.inc("interims_total", len(interims))
+            self.publish(interims, final=False)
+
+    def retract_interims(self, begin: Optional[int] = None) -> None:
+        """
+        以空文本的临时结果撤回segment_id在[begin, interim_end)之间的临时结果, begin默认为next_segment_id
+        """
+        begin = self.next_segment_id if begin is None else begin
+        retractions = list()
+        for segment_id in range(begin, self.interim_end):
+            self.revisions[segment_id] = self.revisions.get(segment_id, -1) + 1
+            retractions.append(TranscribeResult(
+                text="", tokens=array.array("i"), start=0.0, end=0.0, sposition=0, tposition=0,
+                avg_logprob=0.0, compression_ratio=0.0, no_speech_prob=0.0, temprature=0.0,
+                segment_id=segment_id, revision=self.revisions[segment_id], final=False,
+            ))
+        self.interim_end = max(begin, self.next_segment_id)
+        if retractions:
+            self.publish(retractions, final=False)
+
+    def lagging(self, action: str) -> bool:
+        return self.backpressure is not None and action in self.backpressure
+
+    def lag_frames(self) -> int:
+        """
+        已经读入但还没有被任何一次解码看到的帧数
+        """
+        return max(0, self.mel_buffer.end - max(self.decoded_end, self.mel_offset))
+
+    def apply_backpressure(self) -> None:
+        """
+        读取音频之后、解码之前, 根据lag启用或停止policies。
+        不按实际时间读取的音频流会等待转录, 不会落后, 所以不处理
+        """
+        if not self.audio_stream.realtime:
+            return
+        lag = self.lag_frames() * HOP_LENGTH / SAMPLE_RATE
+        started, stopped = self.backpressure.update(lag)
+        for action in started:
+            self.try_log("{:.1f}s behind real time, start {}".format(lag, action))
+            self.metrics.inc("lag_actions_total", label=action)
+        for action in stopped:
+            self.try_log("{:.1f}s behind real time, stop {}".format(lag, action))
+
+        if "degrade" in started or "degrade" in stopped:
+            self.ladder = self.degraded_ladder if self.lagging("degrade") else self.full_ladder
+            self.ladder.reset()
+            self.prefix_tokens = []
+            if self.degrade_model is not None:
+                self.encoder_cache.clear()
+            self.metrics.set("degraded", float(self.lagging("degrade")))
+
+        if self.lagging("skip"):
+            # 只保留最近的音频, 使lag回到阈值的recover倍
+            keep = int(self.backpressure.threshold("skip") * self.backpressure.recover * SAMPLE_RATE / HOP_LENGTH)
+            length = (len(self.mel_buffer) - keep) // self.input_stride * self.input_stride
+            if length > 0:
+                self.metrics.inc("skipped_seconds_total", length * HOP_LENGTH / SAMPLE_RATE)
+                self.drop(length, "{:.1f}s behind real time, skip ahead".format(lag))
+                self.scheduler.reset()
+                self.ladder.reset()
+            self.backpressure.release("skip")
+
+    def decoding_model(self) -> whisper.Whisper:
+        return self.degrade_model if self.degrade_model is not None and self.lagging("degrade") else self.model
+
+    def voice_activity_gate(self) -> bool:
+        """
+        buffer中没有语音时跳过这次转录, 只保留最后hangover帧; 有语音时去掉语音之前的静音。
+        """
+        margin = self.vad.hangover
+        if self.speech_start is None:
+            self.vad_skips += 1
+            self.metrics.inc("vad_skips_total")
+            if self.audio_finished:
+                # 不会再有新的音频, hangover也不需要保留
+                silence = len(self.mel_buffer)
+            else:
+                silence = (len(self.mel_buffer) - margin) // self.input_stride * self.input_stride
+            if silence > 0:
+                # buffer比hangover还短时没有可以丢弃的静音
+                self.metrics.inc("silence_seconds_total", silence * HOP_LENGTH / SAMPLE_RATE)
+                self.extend_offset(silence)
+            self.try_log("no speech, skip decode ({} hits, {} skips)".format(self.vad_hits, self.vad_skips))
+            self.retract_interims()
+            return False
+
+        self.vad_hits += 1
+        lead = (self.speech_start - self.mel_offset - margin) // self.input_stride * self.input_stride
+        if lead > 0:
+            self.vad_trimmed += lead
+            self.metrics.inc("silence_seconds_total", lead * HOP_LENGTH / SAMPLE_RATE)
+            self.extend_offset(lead)
+            self.try_log("trim {} frames of leading silence".format(lead))
         return True
 
+    def decode(self, mel: torch.Tensor, options: Dict) -> whisper.DecodingResult:
+        n_frames = decode.bucket_frames(self.buffer_len(), self.encoder_buckets)
+        if self.session is not None:
+            # 编码器在InferenceEngine中与解码一起运行, 只能计入decode
+            with self.metrics.stage("decode"):
+                return self.session.decode(mel, n_frames, **options)
+
+        model = self.decoding_model()
+
+        def encode():
+            with self.metrics.stage("encode"):
+                return decode.encode(model, mel, self.dtype, n_frames)
+
+        audio_features = self.encoder_cache.get((self.mel_offset, self.buffer_len(), n_frames), encode)
+        stats = self.encoder_cache.stats
+        self.try_log("encoder cache hit rate {:.0%}, {:.2f}s saved".format(stats.hit_rate(), stats.saved_time()))
+        with self.metrics.stage("decode"):
+            return decode.decode_features(model, audio_features, **options)
+
+    def subscribe(self, callback: Callable[[TranscribeResult], None]) -> None:
+        """
+        callback在转录线程中、结果被接受时立即调用, 应当尽快返回
+        """
+        self.result_callbacks.append(callback)
+
+    def publish(self, results: List[TranscribeResult], final: bool = True) -> None:
+        if "first_result" not in self.startup and results:
+            self.record_startup("first_result", time.perf_counter() - self.created)
+        if final:
+            self.metrics.inc("results_total", len(results))
+        for result in results:
+            self.results.put(result)
+            for callback in self.result_callbacks:
+                callback(result)
+
     def transcribe(self):
-        INIT_STEP = 3
-        step = INIT_STEP
+        error = None
+        try:
+            self.wait_for_model()
+            self.transcribe_loop()
+        except BaseException as e:
+            # 由迭代器和read()在取完结果之后重新抛出
+            error = e
+            raise
+        finally:
+            self.results.finish(error)
+
+    def transcribe_loop(self):
+        retry = False
         while not self.is_exited:
-            self.try_log("wait audio buffer for {}s".format(step))
-            time.sleep(step) # 实际间隔为 step + process_time, 这个后续可能需要优化
+            reason = self.scheduler.wait(self.poll_audio, retry)
+            self.try_log("wake up by {}, {:.2f}s new audio".format(reason, self.new_audio_duration()))
+            if self.is_exited:
+                break
             self.lock.acquire()
             try:
-                if not self.transcribe_step():
-                    step /= 2
-                    can_temp_up = self.try_temperature_up()
-                    can_step_half = step > 0.1
-                    if not can_temp_up and not can_step_half:
-                        self.try_log("drop low quality")
-                        self.extend_offset(self.buffer_len())
-                        step = INIT_STEP
-                        self.temperature_idx = 0
+                with self.scheduler.busy():
+                    success = self.transcribe_step(read_audio=not retry)
+                self.try_log("step took {:.2f}s, busy {:.0%} of the time".format(
+                    self.scheduler.stats.last_busy_time, self.scheduler.stats.utilization()))
+                self.metrics.inc("steps_total")
+                retry = False
+                if not success:
+                    retry = self.try_ladder_up()
+                    can_backoff = self.scheduler.backoff()
+                    if not retry and not can_backoff:
+                        self.drop(self.buffer_len(), "low quality")
+                        self.scheduler.reset()
+                        self.ladder.reset()
                 else:
-                    step = INIT_STEP
-                    self.temperature_idx = 0
+                    self.scheduler.reset()
+                    self.ladder.reset()
             except:
                 self.is_exited = True
                 raise
             finally:
                 self.lock.release()
+            self.update_gauges()
+            self.metrics.emit()
+            if self.is_finished():
+                # 音频流已经结束并且全部转录完, 迭代器随之结束
+                self.try_log("audio stream finished")
+                break
+
+    def wait_for_model(self) -> None:
+        """
+        模型载入期间继续读取音频, 避免实时音频流在载入期间溢出
+        """
+        while not self.model_ready.wait(self.scheduler.poll_interval):
+            if self.is_exited:
+                return
+            self.read_audio_step()
+        if self.model_error is not None:
+            raise self.model_error
+
+    def update_gauges(self) -> None:
+        self.metrics.set("buffer_seconds", len(self.mel_buffer) * HOP_LENGTH / SAMPLE_RATE)
+        self.metrics.set("lag_seconds", self.lag_frames() * HOP_LENGTH / SAMPLE_RATE)
+        overruns = getattr(self.audio_stream, "overruns", 0)
+        if overruns > self.overruns:
+            # overruns以音频流原始的采样率计数
+            sample_rate = getattr(self.audio_stream, "speaker_sr", None) or getattr(self.audio_stream, "sample_rate", SAMPLE_RATE)
+            self.metrics.inc("capture_overrun_seconds_total", (overruns - self.overruns) / sample_rate)
+            self.overruns = overruns
+
+    def new_audio_duration(self) -> float:
+        """
+        上一次转录之后读入的音频秒数, 包括窗口之外的部分。
+        窗口已满时只要offset前移, 窗口外的音频就会进入窗口, 只计算窗口的增长会在提交很短的一句之后永远等不到min_new_audio
+        """
+        return max(0, self.mel_buffer.end - self.decoded_end) * HOP_LENGTH / SAMPLE_RATE
+
+    def poll_audio(self) -> float:
+        self.read_audio_step()
+        self.update_gauges()
+        new_audio = self.new_audio_duration()
+        if self.audio_finished and len(self.mel_buffer) > 0:
+            # 音频已经结束, 剩下的音频再短也要转录, 转录失败时也不会再有新的音频
+            return float("inf")
+        return new_audio
     
     def read_audio_step(self):
-        audio = self.audio_stream.read()
-        if len(audio) < N_FFT:
+        if self.audio_finished:
             return
-        self.extend_mel(log_mel_spectrogram(audio))
+        # 不按实际时间读取时, 在窗口之外多读min_new_audio, 窗口前移之后总有足够的新音频唤醒下一次转录
+        read_ahead = N_FRAMES + int(self.min_new_audio * SAMPLE_RATE / HOP_LENGTH)
+        if not self.audio_stream.realtime and len(self.mel_buffer) >= min(read_ahead, self.mel_capacity):
+            return
+        with self.metrics.stage("read"):
+            audio = self.audio_stream.read()
+        if len(audio):
+            with self.metrics.stage("mel"):
+                self.extend_mel(self.mel_frontend(audio))
+        if self.audio_stream.exhausted:
+            self.extend_mel(self.mel_frontend.flush())
+            self.audio_finished = True
     
     def read(self) -> List[TranscribeResult]:
-        if self.is_exited:
-            raise ValueError
+        """
+        取出目前所有的结果, 不会阻塞。转录线程异常退出时, 取完结果之后抛出它的异常
+        """
+        return self.results.read()
 
-        self.lock.acquire()
-        try:
-            buffer, self.output_buffer = self.output_buffer, []
-            return buffer
-        except:
-            self.is_exited = True
-            raise
-        finally:
-            self.lock.release()
+    def __iter__(self) -> Iterator[TranscribeResult]:
+        """
+        阻塞地逐个取出结果, 转录线程退出并且结果都被取出之后结束
+        """
+        return iter(self.results)
+
+    def __aiter__(self) -> AsyncIterator[TranscribeResult]:
+        """
+        async for, 等待结果时不会阻塞事件循环, 也不占用executor的线程
+        """
+        return self.results.__aiter__()
     
-    def try_log(self, log) -> None:
+    def try_log(self, log: str) -> None:
         if self.verbose:
-            import pprint
-            if isinstance(log, str):
-                print(log)
-            else:
-                pprint.pprint(log)
+            print(log)
 
@@ -2,6 +2,7 @@
 
 # Please refer to `https://api.fanyi.baidu.com/doc/21` for complete api document
 
+from typing import *
 import requests
 import random
 from hashlib import md5
@@ -9,11 +10,17 @@ from hashlib import md5
 from . import translator
 
 BAIDU_API_URL = "http://api.fanyi.baidu.com/api/trans/vip/translate"
+MAX_QUERY_BYTES = 6000
+"""q的UTF-8长度上限, 多行的q每一行对应trans_result中的一项"""
 
 def make_md5(s: str, encoding='utf-8'):
     return md5(s.encode(encoding)).hexdigest()
 
 class Translator(translator.Translator):
+    def __init__(self, source_lang: str, target_lang: str, **kwargs) -> None:
+        super().__init__(source_lang, target_lang, **kwargs)
+        self.session = translator.make_session(self.concurrency)
+
     def authentication(self, app_key, app_secret, **kwargs):
         self.app_id = app_key
         self.app_key = app_secret
@@ -30,14 +37,23 @@ class Translator(translator.Translator):
             'sign': make_md5(self.app_id + query + str(salt) + self.app_key),
         }
         
-        r = requests.post(BAIDU_API_URL, params=payload, headers=headers)
+        r = self.session.post(BAIDU_API_URL, params=payload, headers=headers, timeout=self.timeout)
 
         if r.status_code != 200:
             print(r.content)
             r.raise_for_status()
 
-        return r.json().get("trans_result")
+        result = r.json().get("trans_result")
+        if result is None:
+            print(r.content)
+            raise requests.HTTPError(r.json().get("error_msg"))
+        return result
+
+    def translate_lines(self, lines: List[str]) -> List[str]:
+        return [item["dst"] for item in self.translate_request("\n".join(lines))]
+
+    def translate_batch(self, texts: List[str]) -> List[str]:
+        return self.translate_packed(texts, MAX_QUERY_BYTES, self.translate_lines, lambda line: len(line.encode("utf-8")))
     
     def translate(self, query: str) -> str:
-        result = self.translate_request(query)
-        return result[-1]["dst"]
+        return self.translate_batch([query])[0]
@@ -0,0 +1,162 @@
+from typing import *
+import collections
+import dataclasses
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from .translator import Translator
+
+
+@dataclasses.dataclass
+class TranslationCacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    """过期而被当作未命中的条目数"""
+
+    def hit_rate(self) -> float:
+        total = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / total if total else 0.0
+
+
+def normalize(text: str) -> str:
+    """
+    NFKC并合并空白, 全角/半角与多余空格不同的句子使用同一个缓存条目
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class CachedTranslator(Translator):
+    """
+    包装任意一个Translator, 缓存它的翻译结果。
+    内存中是LRU, 磁盘上是SQLite(path为None时只使用内存), 以(后端, source_lang, target_lang, 规范化的原文)为key。
+    超过ttl秒的条目视为未命中; 磁盘上的条目超过max_disk_entries时删除最久没有使用的。翻译失败以及非空原文的空翻译不会被缓存。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS translations (
+            backend TEXT, source_lang TEXT, target_lang TEXT, text TEXT,
+            translation TEXT, created REAL, accessed REAL,
+            PRIMARY KEY (backend, source_lang, target_lang, text)
+        )
+    """
+
+    def __init__(
+        self,
+        translator: Translator,
+        path: Optional[str]                 = None,
+        max_entries: int                    = 1024,
+        max_disk_entries: int               = 100000,
+        ttl: Optional[float]                = 7 * 24 * 3600,
+        clock: Callable[[], float]          = time.time,
+    ) -> None:
+        super().__init__(translator.source_lang, translator.target_lang, translator.timeout, translator.concurrency)
+        self.translator = translator
+        self.backend = type(translator).__module__.rsplit(".", 1)[-1]
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.entries: "collections.OrderedDict[Tuple[str, str, str, str], Tuple[str, float]]" = collections.OrderedDict()
+        self.stats = TranslationCacheStats()
+
+        self.db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            # 翻译在TranslationPipeline的多个线程中进行, 由self.lock保证同一时间只有一个线程访问
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(self.SCHEMA)
+            self.db.commit()
+
+    def authentication(self, **kwargs):
+        return self.translator.authentication(**kwargs)
+
+    def close(self) -> None:
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def key(self, text: str) -> Tuple[str, str, str, str]:
+        return (self.backend, self.source_lang, self.target_lang, normalize(text))
+
+    def is_expired(self, created: float) -> bool:
+        return self.ttl is not None and self.clock() - created > self.ttl
+
+    def get(self, key: Tuple[str, str, str, str]) -> Optional[str]:
+        with self.lock:
+            if key in self.entries:
+                translation, created = self.entries[key]
+                if not self.is_expired(created):
+                    self.stats.memory_hits += 1
+                    self.entries.move_to_end(key)
+                    return translation
+                del self.entries[key]
+                self.stats.expired += 1
+
+            if self.db is not None:
+                row = self.db.execute(
+                    "SELECT translation, created FROM translations "
+                    "WHERE backend = ? AND source_lang = ? AND target_lang = ? AND text = ?", key
+                ).fetchone()
+                if row is not None and not self.is_expired(row[1]):
+                    self.stats.disk_hits += 1
+                    self.db.execute(
+                        "UPDATE translations SET accessed = ? "
+                        "WHERE backend = ? AND source_lang = ? AND target_lang = ? AND text = ?", (self.clock(), *key))
+                    self.db.commit()
+                    self._remember(key, row[0], row[1])
+                    return row[0]
+                if row is not None:
+                    self.stats.expired += 1
+
+            self.stats.misses += 1
+            return None
+
+    def put(self, key: Tuple[str, str, str, str], translation: str) -> None:
+        if not translation.strip() and key[3]:
+            # 非空原文的空翻译是后端的异常结果, 不缓存, 下一次重新翻译
+            return
+        now = self.clock()
+        with self.lock:
+            self._remember(key, translation, now)
+            if self.db is None:
+                return
+            self.db.execute("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?, ?)", (*key, translation, now, now))
+            if self.ttl is not None:
+                self.db.execute("DELETE FROM translations WHERE created < ?", (now - self.ttl,))
+            self.db.execute(
+                "DELETE FROM translations WHERE rowid IN "
+                "(SELECT rowid FROM translations ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.max_disk_entries,))
+            self.db.commit()
+
+    def _remember(self, key: Tuple[str, str, str, str], translation: str, created: float) -> None:
+        self.entries[key] = (translation, created)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def translate(self, text: str) -> str:
+        key = self.key(text)
+        translation = self.get(key)
+        if translation is None:
+            translation = self.translator.translate(text)
+            self.put(key, translation)
+        return translation
+
+    def translate_batch(self, texts: List[str]) -> List[str]:
+        """
+        只把未命中的句子(去重之后)交给被包装的translator.translate_batch
+        """
+        keys = [self.key(text) for text in texts]
+        translations = [self.get(key) for key in keys]
+        misses = {key: text for key, text, translation in zip(keys, texts, translations) if translation is None}
+        if misses:
+            for key, translation in zip(misses, self.translator.translate_batch(list(misses.values()))):
+                self.put(key, translation)
+                misses[key] = translation
+        return [misses[key] if translation is None else translation for key, translation in zip(keys, translations)]
@@ -1,12 +1,16 @@
+from typing import *
 import googletrans
 
 from . import translator
 
+MAX_QUERY_LENGTH = 5000
+
 
 class Translator(translator.Translator):
-	def __init__(self, source_lang: str, target_lang: str) -> None:
-		super().__init__(source_lang, target_lang)
-		self.translator = googletrans.Translator()
+	def __init__(self, source_lang: str, target_lang: str, **kwargs) -> None:
+		super().__init__(source_lang, target_lang, **kwargs)
+		# googletrans内部的httpx.Client本身就是连接池
+		self.translator = googletrans.Translator(timeout=self.timeout)
 	
 	def authentication(self, **kwargs):
 		return
@@ -14,3 +18,10 @@ class Translator(translator.Translator):
 	def translate(self, text: str) -> str:
 		return self.translator.translate(text, src=self.source_lang, dest=self.target_lang).text
 
+	def translate_lines(self, lines: List[str]) -> List[str]:
+		# 传入list时googletrans会逐句请求, 所以拼接成一个多行的请求, 返回的翻译保留了换行
+		return self.translate("\n".join(lines)).split("\n")
+
+	def translate_batch(self, texts: List[str]) -> List[str]:
+		return self.translate_packed(texts, MAX_QUERY_LENGTH, self.translate_lines)
+
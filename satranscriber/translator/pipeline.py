@@ -0,0 +1,75 @@
+from typing import *
+import collections
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .translator import Translator
+from ..metrics import Metrics
+from ..utils.parse_result import TranscribeResult
+
+
+class TranslationPipeline:
+    """
+    在线程池中并发翻译, 但按提交的顺序输出。submit_batch的一组句子用一次translate_batch翻译。
+    每个翻译完成时, 从队首开始把已经完成的结果依次交给on_output(result, text, error),
+    所以一个慢的请求只会推迟它之后的输出, 而不会阻塞转录和之后的请求。翻译失败时text为原文, error为异常。
+    """
+
+    def __init__(
+        self,
+        translator: Translator,
+        on_output: Callable[[TranscribeResult, str, Optional[BaseException]], None],
+        concurrency: Optional[int] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> None:
+        """
+        concurrency: 同时进行的翻译请求数, 默认与translator.concurrency相同
+        """
+        self.translator = translator
+        self.on_output = on_output
+        self.metrics = metrics
+        self.executor = ThreadPoolExecutor(max_workers=concurrency or translator.concurrency, thread_name_prefix="translate")
+        self.pending: "collections.deque[Tuple[List[TranscribeResult], Future]]" = collections.deque()
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self, wait: bool = True) -> None:
+        self.executor.shutdown(wait=wait)
+
+    def submit(self, result: TranscribeResult) -> Future:
+        return self.submit_batch([result])
+
+    def submit_batch(self, results: List[TranscribeResult]) -> Future:
+        future = self.executor.submit(self.translate, [result.text for result in results])
+        with self.lock:
+            self.pending.append((results, future))
+        future.add_done_callback(lambda _: self.flush())
+        return future
+
+    def translate(self, texts: List[str]) -> List[str]:
+        if self.metrics is None:
+            return self.translator.translate_batch(texts)
+        with self.metrics.stage("translate"):
+            return self.translator.translate_batch(texts)
+
+    def flush(self) -> None:
+        """
+        输出队首所有已经完成的翻译。持有锁调用on_output, 保证输出不会交错
+        """
+        with self.lock:
+            while self.pending and self.pending[0][1].done():
+                results, future = self.pending.popleft()
+                error = future.exception()
+                if error is not None and self.metrics is not None:
+                    self.metrics.inc("translate_errors_total")
+                texts = [result.text for result in results] if error is not None else future.result()
+                for result, text in zip(results, texts):
+                    self.on_output(result, text, error)
+
+    def __len__(self) -> int:
+        return len(self.pending)
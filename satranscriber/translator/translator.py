@@ -1,10 +1,20 @@
+from typing import *
 import abc
 
+import requests
+from requests.adapters import HTTPAdapter
+
 
 class Translator(abc.ABC):
-	def __init__(self, source_lang: str, target_lang: str, **kwargs) -> None:
+	def __init__(self, source_lang: str, target_lang: str, timeout: float = 10.0, concurrency: int = 4, **kwargs) -> None:
+		"""
+		timeout: 每个请求的超时秒数
+		concurrency: 同时进行的请求数, 也是连接池的大小
+		"""
 		self.source_lang = source_lang
 		self.target_lang = target_lang
+		self.timeout = timeout
+		self.concurrency = concurrency
 	
 	@abc.abstractmethod
 	def authentication(self, **kwargs):
@@ -13,3 +23,66 @@ class Translator(abc.ABC):
 	@abc.abstractmethod
 	def translate(self, text: str) -> str:
 		pass
+
+	def translate_batch(self, texts: List[str]) -> List[str]:
+		"""
+		翻译多个句子, 返回与texts一一对应的翻译。默认逐句调用translate, 支持一次请求多句的后端应当覆盖这个方法
+		"""
+		return [self.translate(text) for text in texts]
+
+	def translate_packed(
+		self,
+		texts: List[str],
+		limit: int,
+		request: Callable[[List[str]], List[str]],
+		size: Callable[[str], int] = len,
+	) -> List[str]:
+		"""
+		把句子逐行拼接成不超过limit(以size计算, 包括换行符)的请求, request翻译一组行并返回每一行的翻译。
+		句子中的换行被替换为空格, 空句子不发送; 返回的行数与请求不一致时, 这一组退回逐句请求,
+		逐句请求仍然不是恰好一行时抛出ValueError, 不把缺失的翻译当作空字符串返回。
+		"""
+		lines = [" ".join(text.split()) for text in texts]
+		translations = ["" for _ in texts]
+		for group in pack([i for i, line in enumerate(lines) if line], lines, limit, size):
+			results = request([lines[i] for i in group])
+			if len(results) != len(group):
+				results = [self.request_line(request, lines[i]) for i in group]
+			for i, result in zip(group, results):
+				translations[i] = result
+		return translations
+
+	@staticmethod
+	def request_line(request: Callable[[List[str]], List[str]], line: str) -> str:
+		results = request([line])
+		if len(results) != 1:
+			raise ValueError("expected 1 translation of {!r}, got {}".format(line, len(results)))
+		return results[0]
+
+
+def pack(indices: List[int], lines: List[str], limit: int, size: Callable[[str], int] = len) -> List[List[int]]:
+	"""
+	按顺序把lines[indices]分组, 每组以换行连接之后的size不超过limit。超过limit的单个句子单独成组
+	"""
+	groups, group, total = list(), list(), 0
+	for i in indices:
+		length = size(lines[i]) + (1 if group else 0)
+		if group and total + length > limit:
+			groups.append(group)
+			group, total, length = list(), 0, size(lines[i])
+		group.append(i)
+		total += length
+	if group:
+		groups.append(group)
+	return groups
+
+
+def make_session(pool_size: int) -> requests.Session:
+	"""
+	复用连接的requests.Session, 连接池的大小与并发数相同
+	"""
+	session = requests.Session()
+	adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+	session.mount("http://", adapter)
+	session.mount("https://", adapter)
+	return session
@@ -1,3 +1,4 @@
+from typing import *
 import uuid
 import requests
 import hashlib
@@ -6,6 +7,9 @@ import time
 from . import translator
 
 YOUDAO_API_URL = 'https://openapi.youdao.com/api'
+YOUDAO_BATCH_API_URL = 'https://openapi.youdao.com/v2/api'
+MAX_QUERY_LENGTH = 5000
+"""批量翻译中所有q的总长度上限"""
 
 def encrypt(signStr):
     hash_algorithm = hashlib.sha256()
@@ -21,6 +25,9 @@ def truncate(q):
 
 
 class Translator(translator.Translator):
+    def __init__(self, source_lang: str, target_lang: str, **kwargs) -> None:
+        super().__init__(source_lang, target_lang, **kwargs)
+        self.session = translator.make_session(self.concurrency)
 
     def authentication(self, app_key, app_secret, **kwargs):
         self.app_key = app_key
@@ -30,7 +37,7 @@ class Translator(translator.Translator):
         curtime = str(int(time.time()))
         salt = str(uuid.uuid1())
 
-        r = requests.post(
+        r = self.session.post(
             YOUDAO_API_URL,
             data={
                 "q": q,
@@ -46,7 +53,8 @@ class Translator(translator.Translator):
             },
             headers={
                 'Content-Type': 'application/x-www-form-urlencoded'
-            }
+            },
+            timeout=self.timeout,
         )
         
         if r.json().get("errorCode") == "0":
@@ -55,3 +63,40 @@ class Translator(translator.Translator):
         else:
             print(r.content)
             raise requests.HTTPError
+
+    def translate_lines(self, lines: List[str]) -> List[str]:
+        """
+        批量翻译接口, 多个q在同一个请求中, 签名使用所有q拼接之后的字符串
+        """
+        curtime = str(int(time.time()))
+        salt = str(uuid.uuid1())
+
+        r = self.session.post(
+            YOUDAO_BATCH_API_URL,
+            data={
+                "q": lines,
+                "from": self.source_lang,
+                "to": self.target_lang,
+                "appKey": self.app_key,
+                "salt": salt,
+                "sign": encrypt(self.app_key + truncate("".join(lines)) + salt + curtime + self.app_secret),
+                "signType": "v3",
+                "curtime": curtime,
+            },
+            headers={
+                'Content-Type': 'application/x-www-form-urlencoded'
+            },
+            timeout=self.timeout,
+        )
+
+        if r.json().get("errorCode") != "0":
+            print(r.content)
+            raise requests.HTTPError
+        translations = {item["query"]: item["translation"] for item in r.json().get("translateResults", [])}
+        if not all(line in translations for line in lines):
+            # 返回的结果与请求对不上, 由translate_packed退回逐句请求
+            return []
+        return [translations[line] for line in lines]
+
+    def translate_batch(self, texts: List[str]) -> List[str]:
+        return self.translate_packed(texts, MAX_QUERY_LENGTH, self.translate_lines)
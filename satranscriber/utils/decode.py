@@ -1,9 +1,13 @@
 from typing import *
 
 import torch
+import torch.nn.functional as F
 import whisper
-from whisper.audio import pad_or_trim, N_FRAMES
+from whisper.audio import pad_or_trim, N_FRAMES, HOP_LENGTH, SAMPLE_RATE
 from whisper import DecodingOptions, DecodingResult
+from whisper.decoding import DecodingTask
+from whisper.model import AudioEncoder
+from whisper.tokenizer import Tokenizer
 
 
 
@@ -39,6 +43,117 @@ def decode(model: whisper.Whisper, mel_buffer: torch.Tensor, dtype, **decode_opt
     return model.decode(mel, options)
 
 
+def bucket_frames(length: int, buckets: Optional[Sequence[float]]) -> int:
+    """
+    编码器输入的帧数: 不小于length帧的最小bucket(秒), 没有buckets或者都不够长时为N_FRAMES(30s)。
+    结果是偶数, 经过stride为2的conv2之后正好是n_frames // 2个位置
+    """
+    for seconds in sorted(buckets or []):
+        frames = int(round(seconds * SAMPLE_RATE / HOP_LENGTH)) // 2 * 2
+        if frames >= length:
+            return min(frames, N_FRAMES)
+    return N_FRAMES
+
+
+def encode_reduced(encoder: AudioEncoder, x: torch.Tensor) -> torch.Tensor:
+    """
+    与AudioEncoder.forward相同, 但输入可以短于30s: 位置编码只取前n_ctx个。
+    x: (batch, n_mels, n_frames) -> (batch, n_frames // 2, n_audio_state)
+    """
+    x = F.gelu(encoder.conv1(x))
+    x = F.gelu(encoder.conv2(x))
+    x = x.permute(0, 2, 1)
+    x = (x + encoder.positional_embedding[:x.shape[1]]).to(x.dtype)
+    for block in encoder.blocks:
+        x = block(x)
+    return encoder.ln_post(x)
+
+
+class FeaturesDecodingTask(DecodingTask):
+    """
+    DecodingTask只在输入的形状为(n_audio_ctx, n_audio_state)时跳过编码器, 这里的输入总是audio features, 长度可以小于n_audio_ctx。
+    解码器的cross attention不限制audio features的长度
+    """
+
+    def _get_audio_features(self, audio_features: torch.Tensor) -> torch.Tensor:
+        return audio_features.half() if self.options.fp16 else audio_features
+
+    def _detect_language(self, audio_features: torch.Tensor, tokens: torch.Tensor):
+        """
+        language为None时whisper的detect_language会把长度不是n_audio_ctx的audio features当作mel再编码一次,
+        这里直接在audio features上计算startoftranscript之后的语言token
+        """
+        languages = [self.options.language] * audio_features.shape[0]
+        lang_probs = None
+        if self.options.language is None or self.options.task == "lang_id":
+            lang_tokens, lang_probs = detect_language_features(self.model, audio_features, self.tokenizer)
+            languages = [max(probs, key=probs.get) for probs in lang_probs]
+            if self.options.language is None:
+                tokens[:, self.sot_index + 1] = lang_tokens
+        return languages, lang_probs
+
+
+@torch.no_grad()
+def detect_language_features(model: whisper.Whisper, audio_features: torch.Tensor, tokenizer: Tokenizer) -> Tuple[torch.Tensor, List[Dict[str, float]]]:
+    """
+    与whisper.decoding.detect_language相同, 但输入总是(batch, n_ctx, n_audio_state)的audio features, n_ctx可以小于n_audio_ctx
+    """
+    if not model.is_multilingual:
+        raise ValueError("This model doesn't have language tokens so it can't perform lang id")
+    x = torch.tensor([[tokenizer.sot]] * audio_features.shape[0]).to(audio_features.device)
+    logits = model.logits(x, audio_features)[:, 0]
+    mask = torch.ones(logits.shape[-1], dtype=torch.bool)
+    mask[list(tokenizer.all_language_tokens)] = False
+    logits[:, mask] = -float("inf")
+    language_tokens = logits.argmax(dim=-1)
+    probs = logits.softmax(dim=-1).cpu()
+    language_probs = [
+        {code: probs[i, token].item() for token, code in zip(tokenizer.all_language_tokens, tokenizer.all_language_codes)}
+        for i in range(audio_features.shape[0])
+    ]
+    return language_tokens, language_probs
+
+
+@torch.no_grad()
+def encode(model: whisper.Whisper, mel_buffer: torch.Tensor, dtype, n_frames: int = N_FRAMES) -> torch.Tensor:
+    """
+    只运行编码器, 得到(n_frames // 2, n_audio_state)的audio features。n_frames小于N_FRAMES时只编码前n_frames帧
+    """
+    mel = pad_or_trim(mel_buffer, n_frames).to(model.device).to(dtype)
+    if n_frames == N_FRAMES:
+        return model.encoder(mel.unsqueeze(0))[0]
+    return encode_reduced(model.encoder, mel.unsqueeze(0))[0]
+
+
+def decode_features(model: whisper.Whisper, audio_features: torch.Tensor, **decode_options) -> DecodingResult:
+    """
+    model.decode收到形状为(n_audio_ctx, n_audio_state)的输入时会跳过编码器; 更短的audio features由FeaturesDecodingTask解码
+    """
+    options = DecodingOptions(**decode_options)
+    if audio_features.shape[-2] == model.dims.n_audio_ctx:
+        return model.decode(audio_features, options)
+    return decode_reduced(model, audio_features.unsqueeze(0), options)[0]
+
+
+@torch.no_grad()
+def decode_reduced(model: whisper.Whisper, audio_features: torch.Tensor, options: DecodingOptions) -> List[DecodingResult]:
+    """
+    (batch, n_ctx, n_audio_state)的audio features
+    """
+    return FeaturesDecodingTask(model, options).run(audio_features)
+
+
+def decode_batch(model: whisper.Whisper, mel: torch.Tensor, options: DecodingOptions) -> List[DecodingResult]:
+    """
+    (batch, n_mels, n_frames)的mel, n_frames小于N_FRAMES时编码器只运行在前n_frames帧上
+    """
+    if mel.shape[-1] == N_FRAMES:
+        return model.decode(mel, options)
+    with torch.no_grad():
+        audio_features = encode_reduced(model.encoder, mel)
+    return decode_reduced(model, audio_features, options)
+
+
 # def transcribe_step(self: "Transcriber"):
 #     """
 #     刷新buffer内前30s音频的转录结果
@@ -0,0 +1,176 @@
+from typing import *
+import hashlib
+import inspect
+import itertools
+import os
+import urllib.request
+import warnings
+
+import numpy as np
+import torch
+import whisper
+from whisper.model import ModelDimensions, Whisper
+
+
+def default_device() -> str:
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def inference_dtype(device: str, fp16: bool) -> torch.dtype:
+    if fp16 and device == "cpu":
+        warnings.warn("FP16 is not supported on CPU; using FP32 instead")
+        fp16 = False
+    return torch.float16 if fp16 else torch.float32
+
+
+def set_threads(threads: Optional[int] = None, interop_threads: Optional[int] = None) -> None:
+    """
+    设置torch的intra-op和inter-op线程数, None表示使用torch的默认值
+    """
+    if threads:
+        torch.set_num_threads(threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            warnings.warn("inter-op threads can only be set before any parallel work has started")
+
+
+def quantize_dynamic(model: whisper.Whisper) -> whisper.Whisper:
+    """
+    把Linear层替换为int8动态量化的版本, 只能在CPU上运行。
+    whisper的Linear是nn.Linear的子类(在forward中转换weight的dtype), quantize_dynamic只按类型精确匹配,
+    所以先把它们还原为nn.Linear; 在fp32下两者的计算相同。
+    """
+    for module in model.modules():
+        if type(module) is whisper.model.Linear:
+            module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+MODEL_URLS = {
+    "tiny.en": "https://openaipublic.azureedge.net/main/whisper/models/d3dd57d32accea0b295c96e26691aa14d8822fac7d9d27d5dc00b4ca2826dd03/tiny.en.pt",
+    "tiny": "https://openaipublic.azureedge.net/main/whisper/models/65147644a518d12f04e32d6f3b26facc3f8dd46e5390956a9424a650c0ce22b9/tiny.pt",
+    "base.en": "https://openaipublic.azureedge.net/main/whisper/models/25a8566e1d0c1e2231d1c762132cd20e0f96a85d16145c3a00adf5d1ac670ead/base.en.pt",
+    "base": "https://openaipublic.azureedge.net/main/whisper/models/ed3a0b6b1c0edf879ad9b11b1af5a0e6ab5db9205f891f668f8b0e6c6326e34e/base.pt",
+    "small.en": "https://openaipublic.azureedge.net/main/whisper/models/f953ad0fd29cacd07d5a9eda5624af0f6bcf2258be67c92b79389873d91e0872/small.en.pt",
+    "small": "https://openaipublic.azureedge.net/main/whisper/models/9ecf779972d90ba49c06d968637d720dd632c55bbf19d441fb42bf17a411e794/small.pt",
+    "medium.en": "https://openaipublic.azureedge.net/main/whisper/models/d7440d1dc186f76616474e0ff0b3b6b879abc9d1a4926b7adfa41db2d497ab4f/medium.en.pt",
+    "medium": "https://openaipublic.azureedge.net/main/whisper/models/345ae4da62f9b3d59415adc60127b97c714f32e89e936602e85993674d08dcb1/medium.pt",
+    "large-v1": "https://openaipublic.azureedge.net/main/whisper/models/e4b87e7e0bf463eb8e6956e646f1e277e901512310def2c24bf0e11bd3c28e9a/large-v1.pt",
+    "large-v2": "https://openaipublic.azureedge.net/main/whisper/models/81f7c96c852ee8fc832187b0132e569d6c3065a3252ed18e56effd0b6a73e524/large-v2.pt",
+    "large": "https://openaipublic.azureedge.net/main/whisper/models/81f7c96c852ee8fc832187b0132e569d6c3065a3252ed18e56effd0b6a73e524/large-v2.pt",
+}
+"""
+与whisper中的模型地址相同(whisper没有公开这张表), 升级whisper时需要同步更新。地址中倒数第二段是文件的sha256
+"""
+
+
+def download(url: str, root: str) -> str:
+    """
+    下载到root中并校验sha256, 先写入.part文件, 校验通过后才改名, 中断的下载不会被当作完整的checkpoint
+    """
+    os.makedirs(root, exist_ok=True)
+    expected_sha256 = url.split("/")[-2]
+    path = os.path.join(root, os.path.basename(url))
+    partial = path + ".part"
+    digest = hashlib.sha256()
+    with urllib.request.urlopen(url) as source, open(partial, "wb") as output:
+        while True:
+            buffer = source.read(1 << 20)
+            if not buffer:
+                break
+            output.write(buffer)
+            digest.update(buffer)
+    if digest.hexdigest() != expected_sha256:
+        os.remove(partial)
+        raise RuntimeError("Model has been downloaded from {} but the SHA256 checksum does not match; please retry".format(url))
+    os.replace(partial, path)
+    return path
+
+
+def checkpoint_path(name: str, download_root: Optional[str] = None) -> str:
+    """
+    模型名(本地缓存中没有时下载)或者checkpoint文件的路径
+    """
+    if download_root is None:
+        download_root = os.path.join(os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "whisper")
+    if name in MODEL_URLS:
+        # 文件名取自地址, large与large-v2是同一个文件
+        path = os.path.join(download_root, os.path.basename(MODEL_URLS[name]))
+        if not os.path.isfile(path):
+            path = download(MODEL_URLS[name], download_root)
+        return path
+    if os.path.isfile(name):
+        return name
+    raise RuntimeError("Model {} not found; available models = {}".format(name, list(MODEL_URLS)))
+
+
+def load_checkpoint(path: str, mmap: bool = True) -> Tuple[Dict, bool]:
+    """
+    torch>=2.1时以mmap方式载入: 权重直接映射自page cache中的文件, 不需要先整个读入内存。
+    返回checkpoint以及是否使用了mmap
+    """
+    if mmap and "mmap" in inspect.signature(torch.load).parameters:
+        try:
+            return torch.load(path, map_location="cpu", mmap=True), True
+        except RuntimeError:
+            # 旧的(非zip格式的)checkpoint不能mmap
+            pass
+    return torch.load(path, map_location="cpu"), False
+
+
+def assign_state_dict(dims: ModelDimensions, state_dict: Dict[str, torch.Tensor]) -> Optional[whisper.Whisper]:
+    """
+    在meta device上构造模型(不分配也不随机初始化参数), 再以assign使参数直接使用checkpoint(映射)的tensor。
+    不在state_dict中的buffer(decoder的mask)需要重新计算; 仍有其他meta tensor(其他版本的whisper)时返回None
+    """
+    try:
+        with torch.device("meta"):
+            model = Whisper(dims)
+    except (NotImplementedError, RuntimeError):
+        return None
+    model.load_state_dict(state_dict, assign=True)
+    n_ctx = dims.n_text_ctx
+    model.decoder.register_buffer("mask", torch.empty(n_ctx, n_ctx).fill_(-np.inf).triu_(1), persistent=False)
+    if any(tensor.is_meta for tensor in itertools.chain(model.parameters(), model.buffers())):
+        return None
+    return model
+
+
+def load_model(
+    name: str,
+    device: str,
+    quantize: bool = False,
+    download_root: Optional[str] = None,
+    mmap: bool = True,
+    dtype: torch.dtype = torch.float32,
+) -> whisper.Whisper:
+    """
+    dtype: 推理的dtype(inference_dtype), 以mmap载入时参数转换为这个dtype
+    """
+    if quantize and device != "cpu":
+        warnings.warn("int8 dynamic quantization is only supported on CPU; loading the float model")
+        quantize = False
+
+    checkpoint, mapped = load_checkpoint(checkpoint_path(name, download_root), mmap)
+    dims = ModelDimensions(**checkpoint["dims"])
+    model = assign_state_dict(dims, checkpoint["model_state_dict"]) if mapped else None
+    if model is None:
+        model = Whisper(dims)
+        model.load_state_dict(checkpoint["model_state_dict"])
+        mapped = False
+    del checkpoint
+    model = model.to(device)
+    if mapped:
+        # checkpoint中的权重是fp16: fp32推理时需要转换, 否则dtype不一致; fp16推理时保持原样。
+        # whisper的LayerNorm总是以fp32计算, 它的参数保持fp32
+        model = model.to(dtype)
+        if dtype != torch.float32:
+            for module in model.modules():
+                if isinstance(module, torch.nn.LayerNorm):
+                    module.float()
+
+    if quantize:
+        model = quantize_dynamic(model)
+    return model
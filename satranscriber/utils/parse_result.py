@@ -1,15 +1,23 @@
 from typing import *
+import array
 import dataclasses
+import sys
+
+import numpy as np
 from whisper import DecodingResult
 from whisper.audio import HOP_LENGTH, SAMPLE_RATE
 from whisper.tokenizer import get_tokenizer, Tokenizer
 
 
+SLOTS = dict(slots=True) if sys.version_info >= (3, 10) else dict()
+"""Python 3.10以上的dataclass可以使用__slots__"""
+
 
-@dataclasses.dataclass
+@dataclasses.dataclass(**SLOTS)
 class TranscribeResult:
     text: str
-    tokens: List[int]
+    tokens: Sequence[int]
+    """array('i'), 每个token 4字节"""
     start: float
     end: float
     sposition: int
@@ -18,11 +26,19 @@ class TranscribeResult:
     compression_ratio: float
     no_speech_prob: float
     temprature: float
+    segment_id: int = -1
+    """输出顺序中的序号, 临时结果与替代它的最终结果相同"""
+    revision: int = 0
+    """这个segment第几次被发布"""
+    final: bool = True
+    """False表示尚未稳定的临时结果, 之后会被相同segment_id的结果替代; 文本为空的临时结果表示撤回"""
 
 
 def split_decode_result(result: DecodingResult, tokenizer: Tokenizer) -> List[DecodingResult]:
     result_list = list()
     tokens = result.tokens
+    if len(tokens) == 0:
+        return result_list
 
     min_start_token = tokens[0]
 
@@ -34,6 +50,9 @@ def split_decode_result(result: DecodingResult, tokenizer: Tokenizer) -> List[De
         for ttoken_idx in range(stoken_idx + 1, len(tokens)):
             if tokens[ttoken_idx] > min_start_token:
                 break
+        else:
+            # 最后一句没有结束的timestamp
+            break
         
         setence_tokens = tokens[stoken_idx:ttoken_idx+1]
 
@@ -48,14 +67,90 @@ def split_decode_result(result: DecodingResult, tokenizer: Tokenizer) -> List[De
     return result_list
 
 
-def to_transcribe_results(results: List[DecodingResult], start_offset: int, input_stride: int) -> List[TranscribeResult]:
+def sentence_bounds(tokens: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    与split_decode_result相同的切分: 一句话从stoken_idx开始, 到之后第一个大于tokens[0]的token(即下一个timestamp)结束。
+    边界由一次向量化的比较得到, 之后只按句子的数量循环。返回每句首尾token的下标
+    """
+    if len(tokens) == 0:
+        return []
+    boundaries = np.flatnonzero(tokens > tokens[0])
+    bounds, start = list(), 0
+    while start < len(tokens) - 1:
+        i = np.searchsorted(boundaries, start + 1)
+        if i == len(boundaries):
+            # 最后一句没有结束的timestamp
+            break
+        end = int(boundaries[i])
+        bounds.append((start, end))
+        start = end + 1
+    return bounds
+
+
+def parse_decode_result(
+    result: DecodingResult,
+    tokenizer: Tokenizer,
+    start_offset: int,
+    input_stride: int,
+    end_token: Optional[int] = None,
+) -> Tuple[List[TranscribeResult], Optional[TranscribeResult]]:
+    """
+    split_decode_result + to_transcribe_results, 不再为每句复制整个DecodingResult:
+    tokens只转换一次为array, 每句的tokens是它的切片, 首尾的位置向量化计算, 每句只decode一次文本。
+    end_token不为None时, 另外返回没有结束timestamp的最后一句, 以end_token作为结束(没有时为None)
+    """
+    token_array = array.array("i", result.tokens)
+    tokens = np.frombuffer(token_array, dtype=np.int32) if len(token_array) else np.zeros(0, np.int32)
+    bounds = sentence_bounds(tokens)
+
+    spans = [token_array[start:end + 1] for start, end in bounds]
+    texts = [span[1:-1] for span in spans]
+    unfinished = None
+    if end_token is not None:
+        tail_start = bounds[-1][1] + 1 if bounds else 0
+        tail = token_array[tail_start:]
+        if len(tail) >= 2 and tokenizer.timestamp_begin <= tail[0] < end_token:
+            text_tokens = array.array("i", (token for token in tail if token < tokenizer.timestamp_begin))
+            unfinished = array.array("i", [tail[0]]) + text_tokens + array.array("i", [end_token])
+            spans.append(unfinished)
+            texts.append(text_tokens)
+
+    if not spans:
+        return [], None
+    first = np.array([span[0] for span in spans], dtype=np.int64)
+    last = np.array([span[-1] for span in spans], dtype=np.int64)
+    spositions = (start_offset + (first - tokenizer.timestamp_begin) * input_stride).tolist()
+    tpositions = (start_offset + (last - tokenizer.timestamp_begin) * input_stride).tolist()
+
+    results = [TranscribeResult(
+        text                = tokenizer.decode(text.tolist()),
+        tokens              = sentence,
+        start               = sposition * HOP_LENGTH / SAMPLE_RATE,
+        end                 = tposition * HOP_LENGTH / SAMPLE_RATE,
+        sposition           = sposition,
+        tposition           = tposition,
+        avg_logprob         = result.avg_logprob,
+        compression_ratio   = result.compression_ratio,
+        no_speech_prob      = result.no_speech_prob,
+        temprature          = result.temperature,
+    ) for sentence, text, sposition, tposition in zip(spans, texts, spositions, tpositions)]
+
+    if unfinished is not None:
+        return results[:-1], results[-1]
+    return results, None
+
+
+def to_transcribe_results(results: List[DecodingResult], start_offset: int, input_stride: int, timestamp_begin: Optional[int] = None) -> List[TranscribeResult]:
+    """
+    timestamp_begin: 窗口起点(<|0.00|>)对应的token, 为None时以第一个token作为窗口起点
+    """
     if len(results) == 0:
         return []
-    stoken = results[0].tokens[0]
+    stoken = results[0].tokens[0] if timestamp_begin is None else timestamp_begin
 
     transcribe_results = [TranscribeResult(
         text                = result.text, 
-        tokens              = result.tokens,
+        tokens              = array.array("i", result.tokens),
         start               = (start_offset + (result.tokens[0] - stoken) * input_stride) * HOP_LENGTH / SAMPLE_RATE,
         end                 = (start_offset + (result.tokens[-1] - stoken) * input_stride) * HOP_LENGTH / SAMPLE_RATE,
         sposition           = start_offset + (result.tokens[0] - stoken) * input_stride,
@@ -68,3 +163,17 @@ def to_transcribe_results(results: List[DecodingResult], start_offset: int, inpu
 
     return transcribe_results
 
+
+
+def shift_timestamps(tokens: List[int], shift: int, timestamp_begin: int) -> Optional[List[int]]:
+    """
+    窗口起点向后移动shift个timestamp后, 重新计算tokens中的timestamp。有timestamp移到窗口之前时返回None
+    """
+    shifted = list()
+    for token in tokens:
+        if token >= timestamp_begin:
+            token -= shift
+            if token < timestamp_begin:
+                return None
+        shifted.append(token)
+    return shifted
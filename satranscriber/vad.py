@@ -0,0 +1,56 @@
+from typing import *
+import torch
+
+
+class VoiceActivityDetector:
+    """
+    在已经计算好的mel帧上做判断的轻量VAD, 只用到每帧的平均能量和spectral flux, 在CPU上几乎没有开销。
+    能量高出噪声底噪energy_threshold, 或者flux超过flux_threshold的帧视为语音;
+    噪声底噪在静音时缓慢上升、遇到更低的能量时立即下降。
+    语音帧之后的hangover帧也视为语音, 以免切断句尾。
+    """
+
+    def __init__(
+        self,
+        energy_threshold: float = 0.2,
+        flux_threshold: float = 0.1,
+        hangover: int = 30,
+        floor_rise: float = 0.0005,
+    ) -> None:
+        self.energy_threshold = energy_threshold
+        self.flux_threshold = flux_threshold
+        self.hangover = hangover
+        self.floor_rise = floor_rise
+
+        self.noise_floor: Optional[float] = None
+        self.previous: Optional[torch.Tensor] = None
+        """上一块的最后一帧, 用于计算flux"""
+        self.since_speech: int = hangover + 1
+        """上一块结束时距离最后一个语音帧的帧数"""
+
+    def __call__(self, mel: torch.Tensor) -> torch.Tensor:
+        """
+        mel: (n_mels, n_frames), 返回每帧是否为语音的bool tensor
+        """
+        n_frames = mel.shape[-1]
+        if n_frames == 0:
+            return torch.zeros(0, dtype=torch.bool)
+
+        energy = mel.mean(dim=0)
+        previous = mel[:, :1] if self.previous is None else self.previous
+        flux = torch.relu(torch.diff(mel, dim=1, prepend=previous)).mean(dim=0)
+        self.previous = mel[:, -1:].clone()
+
+        floor = energy.min().item()
+        if self.noise_floor is not None:
+            floor = min(self.noise_floor + self.floor_rise * n_frames, floor)
+        self.noise_floor = floor
+
+        active = (energy > floor + self.energy_threshold) | (flux > self.flux_threshold)
+
+        index = torch.arange(n_frames)
+        last = torch.where(active, index, torch.full_like(index, -self.since_speech))
+        last = torch.cummax(last, dim=0).values
+        speech = index - last <= self.hangover
+        self.since_speech = n_frames - int(last[-1])
+        return speech